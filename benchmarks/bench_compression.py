@@ -0,0 +1,65 @@
+# system imports
+import sys
+
+# package imports
+from helper import setup_sdk, bench, report
+
+
+USAGE = 'python benchmarks/bench_compression.py SDK_PATH'
+
+
+def build_value(count):
+  return {
+    'entities': [
+      { 'key': 'ahFkZXZ-dmVub20tZXhhbXBsZXIRCxIEVXNlchiAgICAgICACgw{}'.format(i), 'username': 'user{}'.format(i), 'email': 'user{}@venom.io'.format(i), 'age': i, 'score': i / 3.0 }
+      for i in range(count)
+    ],
+    'type': 'BenchUser'
+  }
+
+
+def protocol(encoding, level):
+  import venom
+  import webapp2
+  
+  request = webapp2.Request.blank('/')
+  if encoding:
+    request.headers['Accept-Encoding'] = encoding
+  protocol = venom.Protocols.JSONProtocol(request, webapp2.Response(), None, {})._configure(compression={ 'level': level })
+  protocol.pretty = False
+  return protocol
+
+
+def main(sdk_path):
+  setup_sdk(sdk_path)
+  
+  rows = []
+  for count in [100, 1000, 10000]:
+    value = build_value(count)
+    modes = [('identity', None, 6)]
+    modes += [('gzip', 'gzip', level) for level in [1, 6, 9]]
+    modes += [('deflate', 'deflate', 6)]
+    baseline = None
+    for name, encoding, level in modes:
+      def write():
+        instance = protocol(encoding, level)
+        instance._write(value)
+        return instance.response.body
+      size = len(write())
+      milliseconds = bench(write, number=3, repeat=3) / 1000
+      if baseline == None:
+        baseline = (size, milliseconds)
+      saved = 100.0 * (baseline[0] - size) / baseline[0]
+      rows.append((count, name, level, size, saved, milliseconds, milliseconds - baseline[1]))
+  
+  report(
+    'JSONProtocol response compression',
+    rows, ['entities', 'encoding', 'level', 'bytes', '% saved', 'ms', 'ms added']
+  )
+
+
+if __name__ == '__main__':
+  if len(sys.argv) != 2:
+    print USAGE
+    sys.exit(1)
+  main(sys.argv[1])
@@ -0,0 +1,83 @@
+# system imports
+import json
+import sys
+
+# package imports
+from helper import setup_sdk, bench, report
+
+
+USAGE = 'python benchmarks/bench_handler.py SDK_PATH'
+
+
+def build_handlers():
+  import venom
+  
+  class HeaderHandler(venom.RequestHandler):
+    def post(self):
+      return { 'agent': self.headers.get('user-agent') }
+  
+  class EagerHeaderHandler(HeaderHandler):
+    """ parses every section up front, as handlers used to """
+    def __init__(self, *args, **kwargs):
+      super(EagerHeaderHandler, self).__init__(*args, **kwargs)
+      self.url, self.query, self.headers, self.body
+  
+  class BodyHandler(venom.RequestHandler):
+    def post(self):
+      return { 'name': self.body.get('name') }
+  
+  return [('header only', HeaderHandler), ('header eager', EagerHeaderHandler), ('body', BodyHandler)]
+
+
+def build_route(handler):
+  import venom
+  
+  return venom.POST('/api/v1/users/:user', handler).url({
+    'user': venom.Parameters.Integer()
+  }).query({
+    'fields': venom.Parameters.String(required=False)
+  }).headers({
+    'User-Agent': venom.Parameters.String()
+  }).body({
+    'name': venom.Parameters.String(min=3),
+    'tags': venom.Parameters.List(venom.Parameters.String()),
+    'address': {
+      'street': venom.Parameters.String(),
+      'city': venom.Parameters.String()
+    }
+  })
+
+
+def main(sdk_path):
+  setup_sdk(sdk_path)
+  
+  import webapp2
+  
+  body = json.dumps({
+    'name': 'venom',
+    'tags': ['tag{}'.format(i) for i in range(20)],
+    'address': { 'street': '1 Main St', 'city': 'Springfield' }
+  })
+  
+  rows = []
+  for name, handler in build_handlers():
+    route = build_route(handler)
+    def handle():
+      request = webapp2.Request.blank('/api/v1/users/123?fields=name', POST=body)
+      request.headers['User-Agent'] = 'venom'
+      response = webapp2.Response()
+      route.handle(request, response, response.set_status, parameters={ 'user': '123' })
+      assert response.status_int == 200, response.body
+    rows.append((name, bench(handle, number=2000)))
+  
+  report(
+    'Route.handle of a POST with url, query, header and body templates',
+    rows, ['handler', 'us']
+  )
+
+
+if __name__ == '__main__':
+  if len(sys.argv) != 2:
+    print USAGE
+    sys.exit(1)
+  main(sys.argv[1])
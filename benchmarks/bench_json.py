@@ -0,0 +1,75 @@
+# system imports
+import datetime
+import json
+import sys
+
+# package imports
+from helper import setup_sdk, bench, report
+
+
+USAGE = 'python benchmarks/bench_json.py SDK_PATH'
+
+
+def build_entities(count):
+  import venom
+  
+  class BenchUser(venom.Model):
+    auto_migrate_in_dev = False
+    
+    username = venom.Properties.String()
+    email = venom.Properties.String()
+    age = venom.Properties.Integer()
+    score = venom.Properties.Float()
+    created = venom.Properties.DateTime()
+  
+  now = datetime.datetime.now()
+  return {
+    'entities': [
+      BenchUser(username='user{}'.format(i), email='user{}@venom.io'.format(i), age=i, score=i / 3.0, created=now)
+      for i in range(count)
+    ],
+    'type': 'BenchUser'
+  }
+
+
+def protocol(pretty):
+  import venom
+  import webapp2
+  
+  request = webapp2.Request.blank('/')
+  protocol = venom.Protocols.JSONProtocol(request, webapp2.Response(), None, {})
+  protocol.pretty = pretty
+  return protocol
+
+
+def main(sdk_path):
+  setup_sdk(sdk_path)
+  
+  from venom.internal.json_encoder import JSONEncoder
+  default_encoder = JSONEncoder(separators=(',', ':'))
+  
+  rows = []
+  for count in [1000, 10000]:
+    value = build_entities(count)
+    modes = [
+      ('pretty', lambda: protocol(True).write(value)),
+      ('__json__ dicts', lambda: default_encoder.encode(value)),
+      ('compact', lambda: protocol(False).write(value)),
+      ('compact stream', lambda: ''.join(protocol(False).write_chunks(value)))
+    ]
+    for name, encode in modes:
+      size = len(encode())
+      milliseconds = bench(encode, number=3, repeat=3) / 1000
+      rows.append((count, name, size, milliseconds))
+  
+  report(
+    'JSONProtocol encoding of entity lists',
+    rows, ['entities', 'mode', 'bytes', 'ms']
+  )
+
+
+if __name__ == '__main__':
+  if len(sys.argv) != 2:
+    print USAGE
+    sys.exit(1)
+  main(sys.argv[1])
@@ -0,0 +1,65 @@
+# system imports
+import sys
+
+# package imports
+from helper import setup_sdk, bench, report
+
+
+USAGE = 'python benchmarks/bench_parameters.py SDK_PATH'
+
+
+def build_cases():
+  from venom import Parameters
+  
+  nested_template = Parameters.String(min=1, characters='abcdefghij')
+  nested_value = 'abcdef'
+  for depth in range(8):
+    nested_template = Parameters.Dict({
+      'name': Parameters.String(min=3, max=20, pattern='[a-z]+'),
+      'count': Parameters.Integer(min=0),
+      'child': nested_template
+    })
+    nested_value = { 'name': 'level', 'count': depth, 'child': nested_value }
+  
+  list_template = Parameters.Dict({
+    'users': Parameters.List({
+      'username': Parameters.String(min=3, max=32, characters='abcdefghijklmnopqrstuvwxyz0123456789'),
+      'age': Parameters.Integer(min=0, max=150),
+      'score': Parameters.Float(),
+      'role': Parameters.String(choices=['admin', 'member']),
+      'tags': Parameters.List(Parameters.String(pattern='[a-z]+'))
+    })
+  })
+  list_value = {
+    'users': [
+      { 'username': 'user{}'.format(i), 'age': i % 100, 'score': i / 3.0, 'role': 'member', 'tags': ['a', 'bc', 'def'] }
+      for i in range(500)
+    ]
+  }
+  return [
+    ('nested x8', nested_template, nested_value, 2000),
+    ('500 list items', list_template, list_value, 20)
+  ]
+
+
+def main(sdk_path):
+  setup_sdk(sdk_path)
+  
+  rows = []
+  for name, template, value, number in build_cases():
+    compiled = template.compile()
+    interpreted = bench(lambda: template.load('request.Body', value), number=number)
+    fast = bench(lambda: compiled('request.Body', value), number=number)
+    rows.append((name, interpreted, fast, interpreted / fast))
+  
+  report(
+    'Parameters validation, microseconds per body',
+    rows, ['body', 'load us', 'compiled us', 'speedup']
+  )
+
+
+if __name__ == '__main__':
+  if len(sys.argv) != 2:
+    print USAGE
+    sys.exit(1)
+  main(sys.argv[1])
@@ -0,0 +1,62 @@
+# system imports
+import sys
+
+# package imports
+from helper import setup_sdk, bench, report
+
+
+USAGE = 'python benchmarks/bench_query.py SDK_PATH'
+
+
+def build_queries():
+  import venom
+  
+  class BenchQueryUser(venom.Model):
+    auto_migrate_in_dev = False
+    
+    username = venom.Properties.String()
+    bio = venom.Properties.String(max=None)
+    age = venom.Properties.Integer()
+    score = venom.Properties.Float()
+    
+    by_username = venom.Query(username == venom.QP)
+    by_profile = venom.Query(username == venom.QP, age == venom.QP, score > venom.QP('score'))
+    by_bio = venom.Query(bio == venom.QP, venom.OR(age < venom.QP, age > 60))
+  
+  return [
+    ('1 filter', BenchQueryUser.by_username, ('user1',), {}),
+    ('3 filters', BenchQueryUser.by_profile, ('user1', 30), { 'score': 0.5 }),
+    ('search', BenchQueryUser.by_bio, ('hello "world"', 18), {})
+  ]
+
+
+def interpreted(query, args, kwargs):
+  """ the per call work Query.__call__ did before plans """
+  arguments = query.to_query_arguments().apply(*args, **kwargs)
+  if query.uses_datastore():
+    return query.to_datastore_query(arguments)
+  return query.to_search_query(arguments)
+
+
+def main(sdk_path):
+  setup_sdk(sdk_path)
+  
+  rows = []
+  for name, query, args, kwargs in build_queries():
+    plan = query.compile()
+    assert repr(plan.bind(args, kwargs)) == repr(interpreted(query, args, kwargs))
+    before = bench(lambda: interpreted(query, args, kwargs), number=5000)
+    after = bench(lambda: plan.bind(args, kwargs), number=5000)
+    rows.append((name, before, after, before / after))
+  
+  report(
+    'Query preparation before execution, microseconds per call',
+    rows, ['query', 'current us', 'compiled us', 'speedup']
+  )
+
+
+if __name__ == '__main__':
+  if len(sys.argv) != 2:
+    print USAGE
+    sys.exit(1)
+  main(sys.argv[1])
@@ -0,0 +1,53 @@
+# system imports
+import sys
+
+# package imports
+from helper import setup_sdk, bench, report
+
+
+USAGE = 'python benchmarks/bench_router.py SDK_PATH'
+
+
+def build_application(route_count):
+  import venom
+  
+  class Handler(venom.RequestHandler):
+    pass
+  
+  app = venom.Application()
+  for i in range(route_count // 2):
+    app.GET('/resource{}'.format(i), Handler)
+    app.GET('/resource{}/:entity'.format(i), Handler)
+  return app
+
+
+def linear_find_route(app, path, method):
+  for route in app.routes:
+    if route.matches(path, method):
+      return route
+  return None
+
+
+def main(sdk_path):
+  setup_sdk(sdk_path)
+  
+  rows = []
+  for route_count in [10, 50, 100, 300, 1000]:
+    app = build_application(route_count)
+    app.router
+    path = '/api/v1/resource{}/1234'.format(route_count // 2 - 1)
+    linear = bench(lambda: linear_find_route(app, path, 'GET'), number=200)
+    trie = bench(lambda: app.find_route(path, 'GET'), number=200)
+    rows.append((route_count, linear, trie, linear / trie))
+  
+  report(
+    'Route lookup (worst case: last registered route), microseconds per call',
+    rows, ['routes', 'linear scan', 'trie', 'speedup']
+  )
+
+
+if __name__ == '__main__':
+  if len(sys.argv) != 2:
+    print USAGE
+    sys.exit(1)
+  main(sys.argv[1])
@@ -0,0 +1,160 @@
+# system imports
+import sys
+import threading
+import time
+
+# package imports
+from helper import setup_sdk, report
+
+
+USAGE = 'python benchmarks/bench_save.py SDK_PATH'
+
+# simulated round trip per call, in seconds, added on top of the
+# testbed stubs which otherwise answer synchronously on wait
+LATENCY = {
+  'Put': 0.030,
+  'IndexDocument': 0.030,
+  'Get': 0.010,
+  'ListDocuments': 0.010,
+  'AllocateIds': 0.005
+}
+DEFAULT_LATENCY = 0.010
+
+
+def install_latency(services):
+  """
+  ' Replaces each stub with one whose RPCs run on a thread from
+  ' the moment they are made and take LATENCY longer, so that
+  ' RPCs in flight together overlap as they would in production.
+  """
+  from google.appengine.api import apiproxy_rpc
+  from google.appengine.api import apiproxy_stub_map
+  
+  class LatencyRPC(apiproxy_rpc.RPC):
+    def _MakeCallImpl(self):
+      super(LatencyRPC, self)._MakeCallImpl()
+      self._thread = threading.Thread(target=self._run)
+      self._thread.start()
+    
+    def _run(self):
+      time.sleep(LATENCY.get(self.call, DEFAULT_LATENCY))
+      try:
+        self.stub.MakeSyncCall(self.package, self.call, self.request, self.response)
+      except Exception:
+        _, self._exception, self._traceback = sys.exc_info()
+    
+    def _WaitImpl(self):
+      self._thread.join()
+      self._state = apiproxy_rpc.RPC.FINISHING
+      self._Callback()
+      return True
+  
+  class LatencyStub(object):
+    def __init__(self, stub):
+      self.stub = stub
+    
+    def CreateRPC(self):
+      return LatencyRPC(stub=self.stub)
+    
+    def MakeSyncCall(self, service, call, request, response, *args):
+      time.sleep(LATENCY.get(call, DEFAULT_LATENCY))
+      return self.stub.MakeSyncCall(service, call, request, response, *args)
+    
+    def __getattr__(self, name):
+      return getattr(self.stub, name)
+  
+  for service in services:
+    stub = apiproxy_stub_map.apiproxy.GetStub(service)
+    apiproxy_stub_map.apiproxy.ReplaceStub(service, LatencyStub(stub))
+
+
+def sequential(manager):
+  """ the put HybridPutManager.get_results made before it overlapped writes """
+  manager._prefetch()
+  manager._put_datastore_entities_async()()
+  manager._put_search_documents_async()()
+
+
+def timed(build, put, number=5):
+  """ best time of put(build()) in milliseconds, not counting build() """
+  best = None
+  for _ in range(number):
+    hybrids = build()
+    start = time.time()
+    put(hybrids)
+    elapsed = (time.time() - start) * 1e3
+    best = elapsed if best == None else min(best, elapsed)
+  return best
+
+
+def build_cases():
+  from google.appengine.ext import ndb
+  from google.appengine.api import search
+  from venom.internal.hybrid_model import HybridModel
+  
+  class BenchSaveHybrid(HybridModel):
+    pass
+  
+  class BenchReservedHybrid(HybridModel):
+    reserve_ids = True
+  
+  def create(count, cls=BenchSaveHybrid):
+    hybrids = []
+    for i in range(count):
+      hybrid = cls()
+      hybrid.set('name', 'user{}'.format(i), ndb.StringProperty)
+      hybrid.set('name', 'user{}'.format(i), search.TextField)
+      hybrids.append(hybrid)
+    return hybrids
+  
+  stored = create(50)
+  BenchSaveHybrid.put_multi(stored)
+  keys = [hybrid.entity_key for hybrid in stored]
+  
+  def update(count):
+    hybrids = BenchSaveHybrid.get_multi(keys[:count])
+    for hybrid in hybrids:
+      name = 'renamed{}'.format(time.time())
+      hybrid.set('name', name, ndb.StringProperty)
+      hybrid.set('name', name, search.TextField)
+    return hybrids
+  
+  return [
+    ('50 new', lambda: create(50)),
+    ('50 new reserved', lambda: create(50, BenchReservedHybrid)),
+    ('50 updated', lambda: update(50)),
+    ('25 new 25 upd', lambda: create(25) + update(25))
+  ]
+
+
+def main(sdk_path):
+  setup_sdk(sdk_path)
+  
+  from google.appengine.ext import testbed
+  from venom.internal.hybrid_model import HybridPutManager
+  
+  bed = testbed.Testbed()
+  bed.activate()
+  bed.init_datastore_v3_stub()
+  bed.init_memcache_stub()
+  bed.init_search_stub()
+  install_latency(['datastore_v3', 'search'])
+  
+  rows = []
+  for name, build in build_cases():
+    before = timed(build, lambda hybrids: sequential(HybridPutManager(hybrids)))
+    after = timed(build, lambda hybrids: HybridPutManager(hybrids).get_results())
+    rows.append((name, before, after, before / after))
+  
+  bed.deactivate()
+  report(
+    'HybridPutManager puts with simulated RPC latency, milliseconds per put',
+    rows, ['hybrids', 'sequential ms', 'concurrent ms', 'speedup']
+  )
+
+
+if __name__ == '__main__':
+  if len(sys.argv) != 2:
+    print USAGE
+    sys.exit(1)
+  main(sys.argv[1])
@@ -0,0 +1,57 @@
+# system imports
+import sys
+
+# package imports
+from helper import setup_sdk, bench, report
+
+
+USAGE = 'python benchmarks/bench_wsgi.py SDK_PATH'
+
+
+def build_dispatch(versions):
+  import venom
+  
+  class Handler(venom.RequestHandler):
+    def get(self):
+      return { 'user': self.url.get('user') }
+  
+  applications = []
+  for version in range(1, versions + 1):
+    app = venom.Application(version=version)
+    app.GET('/users/:user', Handler).url({ 'user': venom.Parameters.Integer() })
+    applications.append(app)
+  return venom.VersionDispatch(*applications)
+
+
+def call(app, environ):
+  def start_response(status, headers, exc_info=None):
+    pass
+  return ''.join(app(dict(environ), start_response))
+
+
+def main(sdk_path):
+  setup_sdk(sdk_path)
+  
+  import venom
+  import webapp2
+  
+  rows = []
+  for versions in [1, 4]:
+    dispatch = build_dispatch(versions)
+    direct = venom.DirectWSGIApplication(dispatch)
+    environ = webapp2.Request.blank('/api/v{}/users/123'.format(versions)).environ
+    nested = bench(lambda: call(dispatch, environ), number=500)
+    fast = bench(lambda: call(direct, environ), number=500)
+    rows.append((versions, nested, fast, 1e6 / nested, 1e6 / fast))
+  
+  report(
+    'WSGI dispatch of a GET request, microseconds per request and requests per second',
+    rows, ['versions', 'webapp2 us', 'direct us', 'webapp2 req/s', 'direct req/s']
+  )
+
+
+if __name__ == '__main__':
+  if len(sys.argv) != 2:
+    print USAGE
+    sys.exit(1)
+  main(sys.argv[1])
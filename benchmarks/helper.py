@@ -0,0 +1,41 @@
+# system imports
+import os
+import sys
+import timeit
+
+
+__all__ = ['setup_sdk', 'bench', 'report']
+
+
+def setup_sdk(sdk_path):
+  """
+  ' Mirrors tests/runner.py so benchmarks import venom
+  ' against the same App Engine SDK the tests use.
+  """
+  if os.path.exists(os.path.join(sdk_path, 'platform/google_appengine')):
+    sys.path.insert(0, os.path.join(sdk_path, 'platform/google_appengine'))
+  else:
+    sys.path.insert(0, sdk_path)
+  sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+  
+  import dev_appserver
+  dev_appserver.fix_sys_path()
+
+
+def bench(function, number=1000, repeat=3):
+  """ returns the best per-call time in microseconds """
+  best = min(timeit.repeat(function, number=number, repeat=repeat))
+  return best / number * 1e6
+
+
+def report(title, rows, columns):
+  print title
+  template = ' | '.join(['{:>14}'] * len(columns))
+  print template.format(*columns)
+  print template.format(*(['-' * 14] * len(columns)))
+  for row in rows:
+    print template.format(*[
+      '{:.2f}'.format(value) if isinstance(value, float) else value
+      for value in row
+    ])
+  print
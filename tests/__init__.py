@@ -1,9 +1,10 @@
 __all__  = ['helper']
-__all__ += ['model', 'internal']
+__all__ += ['model', 'internal', 'routing']
 
 
 import helper
 
 
 import model
-import internal
\ No newline at end of file
+import internal
+import routing
\ No newline at end of file
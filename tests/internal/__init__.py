@@ -1,5 +1,7 @@
-__all__ = ['test_hybrid_model', 'hybrid_model']
+__all__ = ['test_hybrid_model', 'test_json_encoder', 'test_msgpack_codec', 'hybrid_model']
 
 
 import test_hybrid_model
+import test_json_encoder
+import test_msgpack_codec
 import hybrid_model
\ No newline at end of file
@@ -1,7 +1,10 @@
 from helper import smart_assert, BasicTestCase
 import venom
 
+from google.appengine.api import apiproxy_stub_map
+from google.appengine.datastore import datastore_stub_util
 from google.appengine.ext import ndb
+from google.appengine.ext import testbed
 from google.appengine.api import search
 
 
@@ -195,4 +198,344 @@ class HybridModelTest(BasicTestCase):
     entities = TestHybrid.get_multi([doc1, doc2])
     assert entities[0].datastore_entity.get_entity().foo == 123
     assert entities[1].datastore_entity.get_entity().foo == 456
-    
\ No newline at end of file
+
+
+class SearchPagingTest(BasicTestCase):
+  def setUp(self):
+    super(SearchPagingTest, self).setUp()
+    entities = []
+    for i in range(45):
+      entity = TestHybrid()
+      entity.set('foo', i, ndb.IntegerProperty)
+      entity.set('tag', 'paged', search.TextField)
+      entities.append(entity)
+    TestHybrid.put_multi(entities)
+    ndb.get_context().clear_cache()
+    
+    self.calls = []
+    def count(service, call, request, response):
+      if service in ('search', 'datastore_v3') and call in ('Search', 'Get'):
+        self.calls.append(call)
+    apiproxy_stub_map.apiproxy.GetPreCallHooks().Append('count_rpcs', count)
+  
+  def tearDown(self):
+    apiproxy_stub_map.apiproxy.GetPreCallHooks().Clear()
+    super(SearchPagingTest, self).tearDown()
+  
+  def test_all_pages(self):
+    # the Search API returns 20 documents unless asked for more
+    entities = TestHybrid.query_by_search('tag = paged')
+    assert len(entities) == 45
+    values = [entity.datastore_entity.get_entity().foo for entity in entities]
+    assert sorted(values) == range(45)
+  
+  def test_batches_overlap(self):
+    entities = list(TestHybrid.iter_by_search('tag = paged', batch_size=20))
+    assert len(entities) == 45
+    # each page's entities are fetched after the next search is issued
+    searches = [i for i, call in enumerate(self.calls) if call == 'Search']
+    assert len(searches) == 3
+    assert searches[:2] == [0, 1]
+    assert self.calls[2] == 'Get'
+    assert self.calls[-1] == 'Get'
+  
+  def test_limit(self):
+    entities = list(TestHybrid.iter_by_search('tag = paged', batch_size=10, limit=15))
+    assert len(entities) == 15
+    assert self.calls.count('Search') == 2
+    
+    self.calls = []
+    iterator = TestHybrid.iter_by_search('tag = paged', batch_size=10)
+    first = [next(iterator) for _ in range(3)]
+    assert len(first) == 3
+    assert self.calls.count('Search') == 2
+  
+  def test_large_offset(self):
+    documents = [
+      search.Document(doc_id='{:04}'.format(i), fields=[search.TextField(name='tag', value='many')])
+      for i in range(1030)
+    ]
+    for i in range(0, len(documents), 200):
+      TestHybrid.index.put(documents[i: i + 200])
+    self.calls = []
+    
+    ids, cursor, more = TestHybrid.fetch_page_by_search('tag = many', limit=20, offset=990, keys_only=True)
+    assert len(ids) == 20
+    assert more
+    assert self.calls == ['Search']
+    ids, cursor, more = TestHybrid.fetch_page_by_search('tag = many', limit=20, offset=1010, keys_only=True)
+    assert len(ids) == 20
+    assert not more
+    ids, cursor, more = TestHybrid.fetch_page_by_search('tag = many', limit=20, offset=1025, keys_only=True)
+    assert len(ids) == 5
+    assert not more
+  
+  def test_missing_entities(self):
+    entities = TestHybrid.query_by_search('tag = paged')
+    entities[0].entity_key.delete()
+    assert len(TestHybrid.query_by_search('tag = paged')) == 44
+
+
+class PutPrefetchTest(BasicTestCase):
+  def setUp(self):
+    super(PutPrefetchTest, self).setUp()
+    entities = []
+    for i in range(8):
+      entity = TestHybrid()
+      entity.set('foo', i, ndb.IntegerProperty)
+      entity.set('foo', i, search.NumberField)
+      entities.append(entity)
+    TestHybrid.put_multi(entities)
+    self.keys = [entity.entity_key for entity in entities]
+    ndb.get_context().clear_cache()
+    
+    self.calls = []
+    def count(service, call, request, response):
+      if service in ('search', 'datastore_v3'):
+        self.calls.append(call)
+    apiproxy_stub_map.apiproxy.GetPreCallHooks().Append('count_rpcs', count)
+  
+  def tearDown(self):
+    apiproxy_stub_map.apiproxy.GetPreCallHooks().Clear()
+    super(PutPrefetchTest, self).tearDown()
+  
+  def update(self, entities):
+    for entity in entities:
+      foo = entity.datastore_entity.get_entity().foo
+      entity.set('foo', foo + 100, ndb.IntegerProperty)
+      entity.set('foo', foo + 100, search.NumberField)
+    self.calls = []
+    TestHybrid.put_multi(entities)
+  
+  def stored(self):
+    return sorted(
+      document.field('foo').value
+      for document in TestHybrid.index.get_range(limit=100)
+    )
+  
+  def test_documents(self):
+    self.update(TestHybrid.get_multi(self.keys))
+    # one range read replaces a get per document
+    assert self.calls.count('ListDocuments') == 1
+    assert self.calls.count('IndexDocument') == 1
+    assert self.stored() == range(100, 108)
+  
+  def test_sparse_documents(self):
+    # every other id still spans few enough ids for one range read,
+    # but put_multi may assign the ids out of order
+    keys = sorted(self.keys, key=lambda key: key.id())[::2]
+    self.update(TestHybrid.get_multi(keys))
+    assert self.calls.count('IndexDocument') == 1
+    assert self.calls.count('ListDocuments') == 1
+    assert self.stored() == sorted([i + 100 if key in keys else i for i, key in enumerate(self.keys)])
+  
+  def test_dense_runs(self):
+    split = venom.internal.hybrid_model.HybridPutManager._split_dense_runs
+    runs, singles = split(set(['1', '2', '4', '98', '99', '100', '500', '007', 'name']))
+    assert sorted(runs) == [['1', '2', '4'], ['98', '99']]
+    assert sorted(singles) == ['007', '100', '500', 'name']
+  
+  def test_scattered_documents(self):
+    entities = []
+    for i in range(8, 48):
+      entity = TestHybrid()
+      entity.set('foo', i, ndb.IntegerProperty)
+      entity.set('foo', i, search.NumberField)
+      entities.append(entity)
+    TestHybrid.put_multi(entities)
+    # put_multi may assign the ids out of order
+    keys = sorted(self.keys + [entity.entity_key for entity in entities], key=lambda key: key.id())
+    
+    # ids 12 apart are read with one get each, as before prefetching
+    self.update(TestHybrid.get_multi(keys[::12]))
+    assert self.calls.count('ListDocuments') == 4
+    assert self.calls.count('IndexDocument') == 1
+    assert [self.calls.index('ListDocuments') + i for i in range(4)] == [
+      i for i, call in enumerate(self.calls) if call == 'ListDocuments'
+    ]
+  
+  def test_production_ids(self):
+    # put assigns scattered ids in production, which form no runs,
+    # so every document is read with its own get in a single round
+    stub = self.testbed.get_stub(testbed.DATASTORE_SERVICE_NAME)
+    stub.SetAutoIdPolicy(datastore_stub_util.SCATTERED)
+    entities = []
+    for i in range(20):
+      entity = TestHybrid()
+      entity.set('foo', i, ndb.IntegerProperty)
+      entity.set('foo', i, search.NumberField)
+      entities.append(entity)
+    TestHybrid.put_multi(entities)
+    keys = [entity.entity_key for entity in entities]
+    assert all(key.id() > 10 ** 14 for key in keys)
+    
+    self.update(TestHybrid.get_multi(keys))
+    assert self.calls.count('ListDocuments') == 20
+    assert self.calls.count('IndexDocument') == 1
+    assert [self.calls.index('ListDocuments') + i for i in range(20)] == [
+      i for i, call in enumerate(self.calls) if call == 'ListDocuments'
+    ]
+  
+  def test_unchanged_documents(self):
+    entities = TestHybrid.get_multi(self.keys)
+    for entity in entities:
+      foo = entity.datastore_entity.get_entity().foo
+      entity.set('foo', foo, search.NumberField)
+    self.calls = []
+    TestHybrid.put_multi(entities)
+    assert self.calls.count('ListDocuments') == 1
+    assert self.calls.count('IndexDocument') == 0
+  
+  def test_unchanged_entities(self):
+    entities = TestHybrid.get_multi(self.keys)
+    for entity in entities:
+      foo = entity.datastore_entity.get_entity().foo
+      entity.set('foo', foo, ndb.IntegerProperty)
+      entity.set('foo', foo, search.NumberField)
+    self.calls = []
+    TestHybrid.put_multi(entities)
+    assert self.calls.count('Put') == 0
+    assert self.calls.count('IndexDocument') == 0
+  
+  def test_missing_documents(self):
+    entities = TestHybrid.get_multi(self.keys)
+    TestHybrid.index.delete(entities[0].document_id)
+    self.update(entities)
+    assert self.calls.count('IndexDocument') == 1
+    assert self.stored() == range(100, 108)
+  
+  def test_entities(self):
+    entities = [
+      TestHybrid(document=TestHybrid.index.get(TestHybrid._key_to_document_id(key)))
+      for key in self.keys
+    ]
+    self.update(entities)
+    # update() read the entities, so the put reads nothing
+    assert self.calls.count('Get') == 0
+    
+    entities = [
+      TestHybrid(document=TestHybrid.index.get(TestHybrid._key_to_document_id(key)))
+      for key in self.keys
+    ]
+    for entity in entities:
+      foo = int(entity.search_document.get_document().field('foo').value)
+      entity.set('foo', foo, search.NumberField)
+      entity.set('foo', foo + 100, ndb.IntegerProperty)
+    ndb.get_context().clear_cache()
+    self.calls = []
+    TestHybrid.put_multi(entities)
+    assert self.calls.count('Get') == 1
+    assert self.calls.count('ListDocuments') == 0
+    assert self.calls.count('IndexDocument') == 0
+    assert sorted(entity.foo for entity in ndb.get_multi(self.keys)) == range(200, 208)
+
+
+class OtherHybrid(venom.internal.hybrid_model.HybridModel):
+  pass
+
+
+class ReservedHybrid(venom.internal.hybrid_model.HybridModel):
+  reserve_ids = True
+
+
+class OtherReservedHybrid(venom.internal.hybrid_model.HybridModel):
+  reserve_ids = True
+
+
+class ConcurrentPutTest(BasicTestCase):
+  def setUp(self):
+    super(ConcurrentPutTest, self).setUp()
+    self.events = []
+    def before(service, call, request, response):
+      if service in ('search', 'datastore_v3'):
+        self.events.append(('issued', call))
+    def after(service, call, request, response, *args):
+      if service in ('search', 'datastore_v3'):
+        self.events.append(('finished', call))
+    apiproxy_stub_map.apiproxy.GetPreCallHooks().Append('issued_rpcs', before)
+    apiproxy_stub_map.apiproxy.GetPostCallHooks().Append('finished_rpcs', after)
+  
+  def tearDown(self):
+    apiproxy_stub_map.apiproxy.GetPreCallHooks().Clear()
+    apiproxy_stub_map.apiproxy.GetPostCallHooks().Clear()
+    super(ConcurrentPutTest, self).tearDown()
+  
+  def create(self, cls, count, searchable=True):
+    entities = []
+    for i in range(count):
+      entity = cls()
+      entity.set('foo', i, ndb.IntegerProperty)
+      if searchable:
+        entity.set('foo', i, search.NumberField)
+      entities.append(entity)
+    return entities
+  
+  def assert_stored(self, entities):
+    for entity in entities:
+      assert entity.document_id == entity._key_to_document_id(entity.entity_key)
+      assert entity.search_document.document.doc_id == entity.document_id
+      assert entity.datastore_entity.entity.key == entity.entity_key
+    assert len(set(entity.entity_key for entity in entities)) == len(entities)
+  
+  def test_new_entities(self):
+    entities = self.create(TestHybrid, 5) + self.create(OtherHybrid, 3)
+    TestHybrid.put_multi(entities)
+    # ids stay scattered, so documents wait for the keys put assigns
+    assert self.events.count(('issued', 'AllocateIds')) == 0
+    assert self.events.count(('issued', 'Put')) == 1
+    assert self.events.count(('issued', 'IndexDocument')) == 2
+    assert self.events.index(('finished', 'Put')) < self.events.index(('issued', 'IndexDocument'))
+    self.assert_stored(entities)
+    
+    found = TestHybrid.query_by_search('foo >= 0')
+    assert sorted(entity.datastore_entity.get_entity().foo for entity in found) == range(5)
+  
+  def test_reserved_ids(self):
+    entities = self.create(ReservedHybrid, 5) + self.create(OtherReservedHybrid, 3)
+    ReservedHybrid.put_multi(entities)
+    # one allocation per kind, then both writes are in flight together
+    assert self.events.count(('issued', 'AllocateIds')) == 2
+    assert self.events.count(('issued', 'Put')) == 1
+    assert self.events.count(('issued', 'IndexDocument')) == 2
+    assert self.events.index(('issued', 'IndexDocument')) < self.events.index(('finished', 'Put'))
+    assert self.events.index(('issued', 'Put')) < self.events.index(('finished', 'IndexDocument'))
+    self.assert_stored(entities)
+    
+    found = ReservedHybrid.query_by_search('foo >= 0')
+    assert sorted(entity.datastore_entity.get_entity().foo for entity in found) == range(5)
+  
+  def test_new_and_existing_entities(self):
+    existing = self.create(TestHybrid, 3)
+    TestHybrid.put_multi(existing)
+    for entity in existing:
+      entity.set('foo', 10, search.NumberField)
+    created = self.create(TestHybrid, 2)
+    self.events = []
+    TestHybrid.put_multi(existing + created)
+    # known documents are put alongside the entities, new ones after
+    issued = [i for i, event in enumerate(self.events) if event == ('issued', 'IndexDocument')]
+    assert len(issued) == 2
+    assert issued[0] < self.events.index(('finished', 'Put')) < issued[1]
+    self.assert_stored(existing + created)
+    assert len(TestHybrid.query_by_search('foo = 10')) == 3
+  
+  def test_datastore_only(self):
+    entities = self.create(TestHybrid, 3, searchable=False)
+    TestHybrid.put_multi(entities)
+    assert self.events.count(('issued', 'AllocateIds')) == 0
+    assert self.events.count(('issued', 'IndexDocument')) == 0
+    assert all(entity.entity_key != None for entity in entities)
+  
+  def test_existing_entities(self):
+    entities = self.create(TestHybrid, 3)
+    TestHybrid.put_multi(entities)
+    keys = [entity.entity_key for entity in entities]
+    
+    for entity in entities:
+      entity.set('foo', 10, ndb.IntegerProperty)
+      entity.set('foo', 10, search.NumberField)
+    self.events = []
+    TestHybrid.put_multi(entities)
+    assert self.events.count(('issued', 'AllocateIds')) == 0
+    assert [entity.entity_key for entity in entities] == keys
+    assert len(TestHybrid.query_by_search('foo = 10')) == 3
@@ -0,0 +1,65 @@
+from helper import smart_assert, BasicTestCase
+from venom.internal.json_encoder import JSONEncoder, CompactJSONEncoder
+import venom
+
+import datetime
+import json
+import time
+import warnings
+
+
+class JSONEncoderTest(BasicTestCase):
+  def test_compact_primitives(self):
+    encoder = CompactJSONEncoder()
+    value = {
+      'string': 'foo"bar',
+      'unicode': u'caf\xe9',
+      'int': 12,
+      'long': 12L,
+      'float': 1.5,
+      'bool': True,
+      'none': None,
+      'list': [1, 'two', [3.0], ()],
+      'dict': { 1: 'one', 'nested': {} }
+    }
+    encoded = encoder.encode(value)
+    assert not ' ' in encoded
+    assert json.loads(encoded) == json.loads(json.dumps(value))
+  
+  def test_datetime_and_json_objects(self):
+    now = datetime.datetime.now()
+    parameter = venom.Parameters.String(min=3)
+    value = { 'now': now, 'parameter': parameter }
+    
+    expected = { 'now': time.mktime(now.timetuple()), 'parameter': json.loads(json.dumps(dict(parameter))) }
+    assert json.loads(CompactJSONEncoder().encode(value)) == expected
+    assert json.loads(JSONEncoder().encode(value)) == expected
+  
+  def test_unknown_types(self):
+    with smart_assert.raises(TypeError) as context:
+      CompactJSONEncoder().encode(object())
+    with smart_assert.raises(TypeError) as context:
+      CompactJSONEncoder().encode({ (1, 2): 'tuple key' })
+  
+  def test_iterencode(self):
+    value = { 'entities': [{ 'key': i } for i in range(5)], 'type': 'Test' }
+    pieces = list(CompactJSONEncoder().iterencode(value))
+    assert len(pieces) > 5
+    assert json.loads(''.join(pieces)) == value
+  
+  def test_deprecated_global_patch(self):
+    now = datetime.datetime.now()
+    parameter = venom.Parameters.String(min=3)
+    with warnings.catch_warnings(record=True) as caught:
+      warnings.simplefilter('always')
+      assert json.loads(json.dumps({ 'now': now, 'parameter': parameter })) == {
+        'now': time.mktime(now.timetuple()),
+        'parameter': json.loads(JSONEncoder().encode(parameter))
+      }
+    assert len(caught) == 2
+    assert all(issubclass(warning.category, DeprecationWarning) for warning in caught)
+    
+    with smart_assert.raises(TypeError) as context:
+      json.dumps(object())
+    with smart_assert.raises(TypeError) as context:
+      JSONEncoder().encode(object())
@@ -0,0 +1,82 @@
+from helper import smart_assert, BasicTestCase
+from venom.internal.msgpack_codec import Packer, Unpacker, MsgPackDecodeError
+from venom.internal import msgpack_codec
+import venom
+
+import datetime
+import time
+
+
+class MsgPackCodecTest(BasicTestCase):
+  def roundtrip(self, value):
+    return Unpacker(Packer().pack(value)).unpack()
+  
+  def test_known_bytes(self):
+    pack = Packer().pack
+    assert pack(None) == '\xc0'
+    assert pack(True) == '\xc3'
+    assert pack(False) == '\xc2'
+    assert pack(1) == '\x01'
+    assert pack(-1) == '\xff'
+    assert pack(200) == '\xcc\xc8'
+    assert pack(-200) == '\xd1\xff\x38'
+    assert pack(1.5) == '\xcb\x3f\xf8\x00\x00\x00\x00\x00\x00'
+    assert pack('abc') == '\xa3abc'
+    assert pack(u'\xe9') == '\xa2\xc3\xa9'
+    assert pack([1, 2]) == '\x92\x01\x02'
+    assert pack({ 'a': 1 }) == '\x81\xa1a\x01'
+  
+  def test_roundtrip(self):
+    value = {
+      u'string': u'caf\xe9',
+      u'long string': u'x' * 70000,
+      u'ints': [0, 127, 128, -32, -33, 2 ** 16, 2 ** 32, 2 ** 63, -2 ** 31, -2 ** 63],
+      u'float': 0.25,
+      u'list': range(20),
+      u'dict': { str(i): i for i in range(20) },
+      u'none': None,
+      u'bools': [True, False]
+    }
+    assert self.roundtrip(value) == value
+    assert isinstance(self.roundtrip('foo'), unicode)
+  
+  def test_unpack_other_types(self):
+    assert Unpacker('\xca\x3f\xc0\x00\x00').unpack() == 1.5
+    assert Unpacker('\xd9\x03abc').unpack() == u'abc'
+    assert Unpacker('\xc4\x02\x00\x01').unpack() == '\x00\x01'
+  
+  def test_unpack_errors(self):
+    with smart_assert.raises(MsgPackDecodeError):
+      Unpacker('\xa3ab').unpack()
+    with smart_assert.raises(MsgPackDecodeError):
+      Unpacker('\x01\x02').unpack()
+    with smart_assert.raises(MsgPackDecodeError):
+      Unpacker('\xc1').unpack()
+  
+  def test_default(self):
+    now = datetime.datetime.now()
+    parameter = venom.Parameters.String(min=3)
+    assert self.roundtrip(now) == time.mktime(now.timetuple())
+    assert self.roundtrip(parameter) == self.roundtrip(parameter.__json__())
+    with smart_assert.raises(TypeError):
+      Packer().pack(object())
+  
+  def test_packb(self):
+    value = { u'foo': [1, u'bar', None] }
+    assert msgpack_codec.unpackb(msgpack_codec.packb(value)) == value
+  
+  def test_supported_options(self):
+    class Current(object):
+      def packb(self, value, default=None, use_bin_type=True):
+        return Packer().pack(value)
+      def unpackb(self, data, raw=True):
+        return Unpacker(data).unpack()
+    
+    class Old(object):
+      def packb(self, value, default=None):
+        return Packer().pack(value)
+      def unpackb(self, data, encoding=None):
+        return Unpacker(data).unpack()
+    
+    assert msgpack_codec._supported_options(Current()) == ({ 'use_bin_type': False }, { 'raw': False })
+    assert msgpack_codec._supported_options(Old()) == ({}, { 'encoding': 'utf-8' })
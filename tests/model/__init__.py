@@ -1,6 +1,8 @@
-__all__ = ['test_Properties', 'test_model', 'test_query']
+__all__ = ['test_Properties', 'test_cache', 'test_identity', 'test_model', 'test_query']
 
 
 import test_Properties
+import test_cache
+import test_identity
 import test_model
 import test_query
\ No newline at end of file
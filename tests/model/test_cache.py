@@ -0,0 +1,108 @@
+from helper import smart_assert, BasicTestCase
+import venom
+
+from google.appengine.api import apiproxy_stub_map
+from google.appengine.ext import ndb
+
+
+class Clock(object):
+  def __init__(self):
+    self.now = 1000.0
+  
+  def __call__(self):
+    return self.now
+
+
+class CachedConfig(venom.Model):
+  cache_policy = venom.CachePolicy()
+  name = venom.Properties.String()
+
+
+class CachePolicyTest(BasicTestCase):
+  def setUp(self):
+    super(CachePolicyTest, self).setUp()
+    self.policy = CachedConfig.cache_policy = venom.CachePolicy(size=2, ttl=30, clock=Clock())
+    self.configs = [CachedConfig(name='config{}'.format(i)) for i in range(3)]
+    CachedConfig.save_multi(self.configs)
+    
+    self.rpcs = []
+    def count(service, call, request, response):
+      self.rpcs.append((service, call))
+    apiproxy_stub_map.apiproxy.GetPreCallHooks().Append('count_rpcs', count)
+  
+  def tearDown(self):
+    apiproxy_stub_map.apiproxy.GetPreCallHooks().Clear()
+    super(CachePolicyTest, self).tearDown()
+  
+  def get(self, config):
+    ndb.get_context().clear_cache()
+    return CachedConfig.get(config.key)
+  
+  def test_hit_without_rpc(self):
+    assert self.get(self.configs[0]).name == 'config0'
+    assert len(self.rpcs) > 0
+    self.rpcs = []
+    
+    config = self.get(self.configs[0])
+    assert config.name == 'config0'
+    assert config.key == self.configs[0].key
+    assert config is not self.get(self.configs[0])
+    assert self.rpcs == []
+    assert self.policy.stats() == { 'size': 1, 'hits': 2, 'misses': 1, 'evictions': 0 }
+  
+  def test_lru_eviction(self):
+    self.get(self.configs[0])
+    self.get(self.configs[1])
+    self.get(self.configs[0])
+    self.get(self.configs[2])
+    assert self.policy.evictions == 1
+    
+    self.rpcs = []
+    self.get(self.configs[0])
+    assert self.rpcs == []
+    self.get(self.configs[1])
+    assert self.rpcs != []
+  
+  def test_ttl(self):
+    self.get(self.configs[0])
+    self.policy.clock.now += 29
+    self.rpcs = []
+    self.get(self.configs[0])
+    assert self.rpcs == []
+    
+    self.policy.clock.now += 1
+    self.get(self.configs[0])
+    assert self.rpcs != []
+    assert self.policy.misses == 2
+  
+  def test_invalidation(self):
+    config = self.get(self.configs[0])
+    config.name = 'changed'
+    config.save()
+    assert self.get(self.configs[0]).name == 'changed'
+    
+    config = self.get(self.configs[0])
+    config.name = 'again'
+    CachedConfig.save_multi([config])
+    assert self.get(self.configs[0]).name == 'again'
+    
+    self.get(self.configs[0]).delete()
+    assert self.get(self.configs[0]) == None
+  
+  def test_missing_not_cached(self):
+    assert CachedConfig.get('123456') == None
+    assert self.policy.stats()['size'] == 0
+  
+  def test_keys(self):
+    config = self.get(self.configs[0])
+    self.rpcs = []
+    assert CachedConfig.get_multi([config.hybrid_entity.entity_key, int(config.key)])[1].name == 'config0'
+    assert self.rpcs == []
+  
+  def test_size(self):
+    try:
+      venom.CachePolicy(size=0)
+    except ValueError as err:
+      assert str(err) == 'CachePolicy size must be at least 1'
+    else:
+      assert False
@@ -0,0 +1,100 @@
+from helper import smart_assert, BasicTestCase
+import venom
+
+from google.appengine.api import apiproxy_stub_map
+from google.appengine.ext import ndb
+
+import json
+import webapp2
+
+
+class IdentityOwner(venom.Model):
+  name = venom.Properties.String()
+
+
+class IdentityPet(venom.Model):
+  name = venom.Properties.String()
+  owner = venom.Properties.Model(IdentityOwner)
+
+
+class IdentityMapTest(BasicTestCase):
+  def setUp(self):
+    super(IdentityMapTest, self).setUp()
+    self.owner = IdentityOwner(name='owner').save()
+    self.pet = IdentityPet(name='pet', owner=self.owner).save()
+    ndb.get_context().clear_cache()
+    
+    self.gets = 0
+    def count(service, call, request, response):
+      if call == 'Get':
+        self.gets += 1
+    apiproxy_stub_map.apiproxy.GetPreCallHooks().Append('count_gets', count, 'datastore_v3')
+  
+  def tearDown(self):
+    apiproxy_stub_map.apiproxy.GetPreCallHooks().Clear()
+    super(IdentityMapTest, self).tearDown()
+  
+  def test_without_map(self):
+    assert venom.IdentityMap.current() == None
+    assert IdentityOwner.get(self.owner.key) is not IdentityOwner.get(self.owner.key)
+  
+  def test_same_instance(self):
+    with venom.IdentityMap() as identity_map:
+      assert venom.IdentityMap.current() is identity_map
+      owner = IdentityOwner.get(self.owner.key)
+      assert owner.name == 'owner'
+      assert IdentityOwner.get(self.owner.key) is owner
+      assert IdentityOwner.get(int(self.owner.key)) is owner
+      assert IdentityOwner.get(owner.hybrid_entity.entity_key) is owner
+      assert IdentityOwner.get_multi([self.owner.key, self.owner.key]) == [owner, owner]
+      assert identity_map.hits == 5
+      assert identity_map.misses == 1
+    assert venom.IdentityMap.current() == None
+    assert self.gets == 1
+  
+  def test_duplicate_ids(self):
+    with venom.IdentityMap():
+      first, second = IdentityOwner.get_multi([self.owner.key, self.owner.key])
+      assert first is second
+  
+  def test_property_lookup(self):
+    with venom.IdentityMap():
+      pet = IdentityPet.get(self.pet.key)
+      owner = IdentityOwner.get(self.owner.key)
+      assert pet.owner is owner
+    assert self.gets == 2
+  
+  def test_save_and_delete(self):
+    with venom.IdentityMap() as identity_map:
+      owner = IdentityOwner(name='new').save()
+      assert IdentityOwner.get(owner.key) is owner
+      
+      owners = [IdentityOwner(name='a'), IdentityOwner(name='b')]
+      IdentityOwner.save_multi(owners)
+      assert IdentityOwner.get_multi([owners[0].key, owners[1].key]) == owners
+      
+      owner.delete()
+      assert IdentityOwner.get(owner.key) == None
+      assert identity_map.stats() == { 'entities': 2, 'hits': 3, 'misses': 1 }
+  
+  def test_nested(self):
+    with venom.IdentityMap() as outer:
+      with venom.IdentityMap() as inner:
+        IdentityOwner.get(self.owner.key)
+      assert venom.IdentityMap.current() is outer
+      assert len(outer.entities) == 0
+      assert len(inner.entities) == 1
+  
+  def test_request_scope(self):
+    app = venom.Application()
+    app.CRUD('/owners/:owner/pets', IdentityPet, domain='owner')
+    request = webapp2.Request.blank('/api/v1/owners/{}/pets/{}'.format(self.owner.key, self.pet.key))
+    response = request.get_response(app)
+    assert response.status_int == 200
+    assert json.loads(response.body)['name'] == 'pet'
+    
+    # the ownership check reuses the owner loaded from the url
+    identity_map = request.environ['venom.identity_map']
+    assert identity_map.hits >= 1
+    assert self.gets == 2
+    assert venom.IdentityMap.current() == None
@@ -1,8 +1,11 @@
 from helper import smart_assert, BasicTestCase
 import venom
 
+from google.appengine.api import apiproxy_stub_map
 from google.appengine.ext import ndb
 
+import datetime
+
 
 class ModelTest(BasicTestCase):
   def test_modelattribute_fixup(self):
@@ -195,6 +198,38 @@ class ModelTest(BasicTestCase):
     assert json['bio'] == 'bio'
     assert json['key'] == None
   
+  def test_json_encoder(self):
+    from venom.internal.json_encoder import compact_encoder
+    import json
+    
+    class Owner(venom.Model):
+      name = venom.Properties.String()
+    
+    class User(venom.Model):
+      username = venom.Properties.String()
+      age = venom.Properties.Integer()
+      score = venom.Properties.Float()
+      password = venom.Properties.Password(min=3)
+      created = venom.Properties.DateTime()
+      owner = venom.Properties.Model(Owner)
+      anything = venom.Properties.Property()
+    
+    owner = Owner(name='owner').save()
+    user = User(username='username', age=20, score=2.5, password='pass', owner=owner, anything=[1, 2])
+    user.created = datetime.datetime.now()
+    
+    assert [name for name, _ in User._json_encoder.properties] == ['age', 'anything', 'created', 'owner', 'score', 'username']
+    
+    expected = json.loads(json.dumps(user.__json__(), cls=venom.internal.json_encoder.JSONEncoder))
+    encoded = json.loads(compact_encoder.encode(user))
+    assert encoded == expected
+    assert not 'password' in encoded
+    assert encoded['owner'] == { 'name': 'owner', 'key': owner.key }
+    assert encoded['anything'] == [1, 2]
+    
+    user = User(username='username')
+    assert json.loads(compact_encoder.encode([user]))[0]['age'] == None
+  
   def test_key_update(self):
     class User(venom.Model):
       username = venom.Properties.String()
@@ -213,6 +248,33 @@ class ModelTest(BasicTestCase):
     user = User()
     assert user.key == None
   
+  def test_version_stamp(self):
+    class User(venom.Model):
+      username = venom.Properties.String()
+    
+    user = User(username='username')
+    assert user._updated == None
+    unsaved = user._etag()
+    
+    user.save()
+    assert isinstance(user._updated, datetime.datetime)
+    etag = user._etag()
+    assert etag != unsaved
+    
+    fetched = User.get(user.key)
+    assert fetched._updated == user._updated
+    assert fetched._etag() == etag
+    assert fetched.username == 'username'
+    assert not User.updated_property in fetched.__json__()
+    
+    fetched.save()
+    assert fetched._updated == user._updated
+    
+    fetched.username = 'renamed'
+    fetched.save()
+    assert fetched._updated > user._updated
+    assert fetched._etag() != etag
+  
   def test_get(self):
     class User(venom.Model):
       username = venom.Properties.String()
@@ -236,3 +298,97 @@ class ModelTest(BasicTestCase):
     users = User.get_multi([key1, key2])
     assert users[0].username == 'username1'
     assert users[1].username == 'username2'
+
+
+class TrackedUser(venom.Model):
+  username = venom.Properties.String(max=None)
+  password = venom.Properties.Password()
+  visits = venom.Properties.Integer()
+  
+  by_username = venom.Query(username == venom.QP)
+
+
+class DirtyTrackingTest(BasicTestCase):
+  def setUp(self):
+    super(DirtyTrackingTest, self).setUp()
+    TrackedUser.save_multi([
+      TrackedUser(username='user{}'.format(i), password='secret', visits=i)
+      for i in range(3)
+    ])
+    ndb.get_context().clear_cache()
+    self.users = sorted(TrackedUser.all(), key=lambda user: user.visits)
+    
+    self.calls = []
+    def count(service, call, request, response):
+      self.calls.append((service, call))
+    apiproxy_stub_map.apiproxy.GetPreCallHooks().Append('count_rpcs', count)
+  
+  def tearDown(self):
+    apiproxy_stub_map.apiproxy.GetPreCallHooks().Clear()
+    super(DirtyTrackingTest, self).tearDown()
+  
+  def stored(self, user):
+    ndb.get_context().clear_cache()
+    return TrackedUser.get(user.key)
+  
+  def test_unchanged(self):
+    user = self.users[0]
+    updated = user._updated
+    user.save()
+    TrackedUser.save_multi(self.users)
+    assert self.calls == []
+    assert user._updated == updated
+    
+    user.visits = 0
+    user.password = 'secret'
+    user.save()
+    assert self.calls == []
+  
+  def test_new_entity(self):
+    user = TrackedUser(username='new', visits=10)
+    user.save()
+    self.calls = []
+    user.save()
+    assert self.calls == []
+    
+    user.visits = 11
+    user.save()
+    assert ('datastore_v3', 'Put') in self.calls
+    assert self.stored(user).visits == 11
+  
+  def test_datastore_only(self):
+    user = self.users[1]
+    updated = user._updated
+    user.visits = 20
+    user.password = 'changed'
+    user.save()
+    # nothing is read to diff and the search index is not written
+    assert [call for call in self.calls if call[0] in ('datastore_v3', 'search')] == [
+      ('datastore_v3', 'Put')
+    ]
+    assert user._updated > updated
+    
+    stored = self.stored(user)
+    assert stored.visits == 20
+    assert stored.password == TrackedUser.password._hash('changed')
+    assert [found.key for found in TrackedUser.by_username('user1')] == [user.key]
+  
+  def test_search(self):
+    self.users[0].username = 'renamed'
+    self.users[2].visits = 30
+    TrackedUser.save_multi(self.users)
+    calls = [call for call in self.calls if call[0] in ('datastore_v3', 'search')]
+    assert calls.count(('datastore_v3', 'Put')) == 1
+    assert calls.count(('search', 'IndexDocument')) == 1
+    assert not ('search', 'ListDocuments') in calls
+    assert not ('datastore_v3', 'Get') in calls
+    
+    assert [found.key for found in TrackedUser.by_username('renamed')] == [self.users[0].key]
+    assert len(TrackedUser.by_username('user0')) == 0
+    assert self.stored(self.users[2]).visits == 30
+  
+  def test_force(self):
+    TrackedUser.save_multi(self.users, force=True)
+    calls = [call for call in self.calls if call[0] in ('datastore_v3', 'search')]
+    assert ('datastore_v3', 'Put') in calls
+    assert not ('search', 'IndexDocument') in calls
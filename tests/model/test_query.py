@@ -1,6 +1,10 @@
+from google.appengine.api import apiproxy_stub_map
 from google.appengine.ext import ndb
 from google.appengine.api import search
+from google.appengine.api import memcache
 from helper import smart_assert, BasicTestCase
+import json
+import time
 import venom
 
 
@@ -169,4 +173,395 @@ class QueryTest(BasicTestCase):
     query = venom.Query(foo < venom.QP, bar != venom.QP)
     query._connect(name='query', entity=TestModel())
     assert query(123, bar=456) == []
-    
\ No newline at end of file
+  
+  def test_plan(self):
+    foo = QueryTestProp()
+    foo._connect(name='foo')
+    bar = QueryTestProp()
+    bar._connect(name='bar')
+    
+    query = venom.Query(foo == venom.QP, venom.OR(bar < 5, bar > venom.QP('high')))
+    plan = query.compile()
+    assert plan.backend == venom.QueryPlan.DATASTORE
+    assert repr(plan.bind((1,), { 'high': 9 })) == repr(query.to_datastore_query([1, 9]))
+    assert repr(plan.bind((), { 'foo': 1, 'high': 9 })) == repr(query.to_datastore_query([1, 9]))
+    assert not plan.positional
+    
+    query = venom.Query(foo > venom.QP, bar != venom.QP, foo <= 7)
+    plan = query.compile()
+    assert plan.backend == venom.QueryPlan.SEARCH
+    assert plan.template == '(foo > {} AND (NOT bar = {}) AND foo <= {})'
+    assert plan.bind((1, 'a"b'), {}) == query.to_search_query([1, 'a"b'])
+    assert plan.bind((1, 'a"b'), {}) == '(foo > 1 AND (NOT bar = "a\\"b") AND foo <= 7)'
+    
+    try:
+      plan.bind((1,), {})
+    except Exception as err:
+      assert str(err) == 'Expected 2 args, received 1'
+    else:
+      assert False
+    
+    assert repr(venom.Query().compile().bind((), {})) == 'None'
+  
+  def test_compiled_on_model(self):
+    class PlannedModel(venom.Model):
+      name = venom.Properties.String()
+      by_name = venom.Query(name == venom.QP)
+    
+    assert PlannedModel.by_name._plan.backend == venom.QueryPlan.DATASTORE
+    assert PlannedModel.all._plan.arguments == []
+    PlannedModel(name='foo').save()
+    assert [entity.name for entity in PlannedModel.by_name('foo')] == ['foo']
+
+
+class CachedPerson(venom.Model):
+  name = venom.Properties.String()
+  bio = venom.Properties.String(max=None)
+  
+  by_name = venom.Query(name == venom.QP).cached(60)
+  by_bio = venom.Query(bio == venom.QP).cached(60)
+  uncached = venom.Query(name == venom.QP)
+
+
+class QueryCacheTest(BasicTestCase):
+  def setUp(self):
+    super(QueryCacheTest, self).setUp()
+    self.people = [CachedPerson(name='a', bio='x'), CachedPerson(name='b', bio='y')]
+    CachedPerson.save_multi(self.people)
+    
+    self.rpcs = []
+    def count(service, call, request, response):
+      self.rpcs.append(call)
+    apiproxy_stub_map.apiproxy.GetPreCallHooks().Append('count_rpcs', count)
+  
+  def tearDown(self):
+    apiproxy_stub_map.apiproxy.GetPreCallHooks().Clear()
+    super(QueryCacheTest, self).tearDown()
+  
+  def names(self, results):
+    return sorted(person.name for person in results)
+  
+  def test_datastore_hit(self):
+    self.settle()
+    assert self.names(CachedPerson.by_name('a')) == ['a']
+    assert 'RunQuery' in self.rpcs
+    self.rpcs = []
+    
+    results = CachedPerson.by_name('a')
+    assert isinstance(results, venom.QueryResults)
+    assert [person.key for person in results] == [self.people[0].key]
+    assert not 'RunQuery' in self.rpcs
+    
+    # other arguments are cached separately
+    assert self.names(CachedPerson.by_name('b')) == ['b']
+    assert 'RunQuery' in self.rpcs
+  
+  def settle(self):
+    # as if the kind was last written before the datastore and index settled
+    cache = venom.model.cache.QueryResultCache(CachedPerson)
+    memcache.set(cache._written_key(), time.time() - cache.settle_time)
+  
+  def test_search_hit(self):
+    self.settle()
+    assert self.names(CachedPerson.by_bio('y')) == ['b']
+    assert 'Search' in self.rpcs
+    self.rpcs = []
+    assert self.names(CachedPerson.by_bio('y')) == ['b']
+    assert not 'Search' in self.rpcs
+  
+  def test_settling(self):
+    # neither the index nor a global query may hold the write yet,
+    # so nothing is cached
+    list(CachedPerson.by_bio('y'))
+    list(CachedPerson.by_name('a'))
+    self.rpcs = []
+    list(CachedPerson.by_bio('y'))
+    list(CachedPerson.by_name('a'))
+    assert 'Search' in self.rpcs
+    assert 'RunQuery' in self.rpcs
+    
+    self.settle()
+    list(CachedPerson.by_bio('y'))
+    list(CachedPerson.by_name('a'))
+    self.rpcs = []
+    list(CachedPerson.by_bio('y'))
+    list(CachedPerson.by_name('a'))
+    assert not 'Search' in self.rpcs
+    assert not 'RunQuery' in self.rpcs
+  
+  def test_uncached(self):
+    list(CachedPerson.uncached('a'))
+    self.rpcs = []
+    list(CachedPerson.uncached('a'))
+    assert 'RunQuery' in self.rpcs
+  
+  def test_invalidation(self):
+    list(CachedPerson.by_name('a'))
+    CachedPerson(name='a', bio='z').save()
+    assert self.names(CachedPerson.by_name('a')) == ['a', 'a']
+    
+    people = CachedPerson.by_name('a')
+    people[0].name = 'c'
+    CachedPerson.save_multi([people[0]])
+    assert self.names(CachedPerson.by_name('a')) == ['a']
+    
+    CachedPerson.by_name('a').get().delete()
+    assert self.names(CachedPerson.by_name('a')) == []
+  
+  def test_read_after_write(self):
+    list(CachedPerson.by_name('a'))
+    with venom.IdentityMap():
+      person = CachedPerson(name='a', bio='z').save()
+      self.rpcs = []
+      results = list(CachedPerson.by_name('a'))
+      assert 'RunQuery' in self.rpcs
+      assert person.key in [result.key for result in results]
+      
+      self.rpcs = []
+      list(CachedPerson.by_name('a'))
+      assert 'RunQuery' in self.rpcs
+
+
+class PagedPerson(venom.Model):
+  name = venom.Properties.String()
+  bio = venom.Properties.String(max=None)
+  age = venom.Properties.Integer()
+  
+  by_name = venom.Query(name == venom.QP)
+  by_bio = venom.Query(bio == venom.QP)
+  cached_by_name = venom.Query(name == venom.QP).cached(60)
+
+
+class QueryResultsTest(BasicTestCase):
+  def setUp(self):
+    super(QueryResultsTest, self).setUp()
+    PagedPerson.save_multi([PagedPerson(name='p', bio='paged', age=i) for i in range(25)])
+    ndb.get_context().clear_cache()
+    
+    self.rpcs = []
+    def count(service, call, request, response):
+      self.rpcs.append((call, request))
+    apiproxy_stub_map.apiproxy.GetPreCallHooks().Append('count_rpcs', count)
+  
+  def tearDown(self):
+    apiproxy_stub_map.apiproxy.GetPreCallHooks().Clear()
+    super(QueryResultsTest, self).tearDown()
+  
+  def calls(self):
+    return [call for call, request in self.rpcs]
+  
+  def test_lazy(self):
+    results = PagedPerson.by_name('p')
+    assert isinstance(results, venom.QueryResults)
+    assert self.rpcs == []
+    assert len(results) == 25
+    assert results == list(results)
+    assert venom.internal.json_encoder.compact_encoder.encode(results) == venom.internal.json_encoder.compact_encoder.encode(list(results))
+  
+  def test_get(self):
+    person = PagedPerson.by_name('p').get()
+    assert person.name == 'p'
+    queries = [request for call, request in self.rpcs if call == 'RunQuery']
+    assert len(queries) == 1
+    assert queries[0].limit() == 1
+    assert PagedPerson.by_name('missing').get() == None
+    
+    query = PagedPerson.by_bio('paged')
+    missing = query.fetch(3, keys_only=True)
+    ndb.delete_multi([ndb.Key(PagedPerson.kind, int(document_id)) for document_id in missing])
+    person = PagedPerson.by_bio('paged').get()
+    assert person != None
+    assert not person.key in missing
+    assert PagedPerson.by_bio('missing').get() == None
+  
+  def walk(self, results, **options):
+    pages = []
+    cursor = None
+    while True:
+      page = results.fetch(10, cursor=cursor, **options)
+      pages.append(page)
+      if not page.more:
+        return pages
+      assert page.cursor != None
+      cursor = page.cursor
+  
+  def test_datastore_cursors(self):
+    pages = self.walk(PagedPerson.by_name('p'))
+    assert [len(page) for page in pages] == [10, 10, 5]
+    ages = [person.age for page in pages for person in page]
+    assert sorted(ages) == range(25)
+    assert isinstance(pages[0], venom.QueryPage)
+    assert pages[-1].cursor == None
+  
+  def test_search_cursors(self):
+    pages = self.walk(PagedPerson.by_bio('paged'))
+    assert [len(page) for page in pages] == [10, 10, 5]
+    ages = [person.age for page in pages for person in page]
+    assert sorted(ages) == range(25)
+  
+  def test_offset(self):
+    for query in [PagedPerson.by_name('p'), PagedPerson.by_bio('paged')]:
+      first = query.fetch(10)
+      page = query.fetch(5, offset=3)
+      assert [person.key for person in page] == [person.key for person in first[3:8]]
+      assert page.more
+      last = query.fetch(5, offset=22)
+      assert len(last) == 3
+      assert not last.more
+      skipped = query.fetch(3, offset=2, cursor=first.cursor)
+      assert [person.key for person in skipped] == [person.key for person in query.fetch(3, offset=12)]
+    
+    # search cannot return a cursor for a page at an offset
+    query = PagedPerson.by_name('p')
+    following = query.fetch(5, cursor=query.fetch(5, offset=3).cursor)
+    assert [person.key for person in following] == [person.key for person in query.fetch(10)[8:10]] + [person.key for person in query.fetch(3, offset=10)]
+    assert PagedPerson.by_bio('paged').fetch(5, offset=3).cursor == None
+  
+  def test_keys_only(self):
+    for query in [PagedPerson.by_name('p'), PagedPerson.by_bio('paged')]:
+      self.rpcs = []
+      keys = query.fetch(5, keys_only=True)
+      assert not 'Get' in self.calls()
+      assert all(isinstance(key, basestring) for key in keys)
+      assert keys == [person.key for person in query.fetch(5)]
+  
+  def test_count(self):
+    assert PagedPerson.by_name('p').count() == 25
+    assert PagedPerson.by_name('p').count(limit=10) == 10
+    assert PagedPerson.by_bio('paged').count() == 25
+    assert PagedPerson.by_bio('paged').count(limit=10) == 10
+    assert not 'Get' in self.calls()
+    
+    results = PagedPerson.by_name('p')
+    list(results)
+    self.rpcs = []
+    assert results.count() == 25
+    assert results.get() != None
+    assert self.rpcs == []
+  
+  def test_stream(self):
+    for query in [PagedPerson.by_name('p'), PagedPerson.by_bio('paged')]:
+      ages = [person.age for person in query.stream(batch_size=10)]
+      assert sorted(ages) == range(25)
+      assert len(list(query.stream(batch_size=10, limit=12))) == 12
+      assert query._entities == None
+    
+    self.rpcs = []
+    list(PagedPerson.by_bio('paged').stream(batch_size=10, limit=5))
+    assert self.calls().count('Search') == 1
+  
+  def test_cached_pages(self):
+    cache = venom.model.cache.QueryResultCache(PagedPerson)
+    memcache.set(cache._written_key(), time.time() - cache.settle_time)
+    page = PagedPerson.cached_by_name('p').fetch(10)
+    self.rpcs = []
+    cached = PagedPerson.cached_by_name('p').fetch(10)
+    assert not 'RunQuery' in self.calls()
+    assert [person.key for person in cached] == [person.key for person in page]
+    assert cached.cursor == page.cursor
+    assert PagedPerson.cached_by_name('p').fetch(10, keys_only=True) == [person.key for person in page]
+
+
+class PartialPerson(venom.Model):
+  name = venom.Properties.String(max=None)
+  age = venom.Properties.Integer()
+  secret = venom.Properties.String()
+  
+  by_name = venom.Query(name == venom.QP, age >= venom.QP)
+  listing = venom.Query(name == venom.QP, age >= venom.QP).returning('name', 'age')
+
+
+class ReturnedFieldsTest(BasicTestCase):
+  def setUp(self):
+    super(ReturnedFieldsTest, self).setUp()
+    PartialPerson.save_multi([PartialPerson(name='p', age=i, secret='s{}'.format(i)) for i in range(5)])
+    ndb.get_context().clear_cache()
+    
+    self.rpcs = []
+    def count(service, call, request, response):
+      if service == 'datastore_v3':
+        self.rpcs.append(call)
+    apiproxy_stub_map.apiproxy.GetPreCallHooks().Append('count_rpcs', count)
+  
+  def tearDown(self):
+    apiproxy_stub_map.apiproxy.GetPreCallHooks().Clear()
+    super(ReturnedFieldsTest, self).tearDown()
+  
+  def test_search_only(self):
+    people = sorted(PartialPerson.listing('p', 0), key=lambda person: person.age)
+    assert [person.age for person in people] == range(5)
+    assert all(person.name == 'p' for person in people)
+    assert isinstance(people[0].age, int)
+    assert self.rpcs == []
+    
+    page = PartialPerson.listing('p', 3).fetch(10)
+    assert sorted(person.age for person in page) == [3, 4]
+    assert len(list(PartialPerson.listing('p', 0).stream(batch_size=2, limit=3))) == 3
+    assert self.rpcs == []
+  
+  def test_deferred_load(self):
+    person = PartialPerson.listing('p', 4).get()
+    assert self.rpcs == []
+    assert person._updated == None
+    
+    assert person.secret == 's4'
+    assert self.rpcs == ['Get']
+    assert person._partial == None
+    assert person._updated != None
+    assert person.secret == 's4'
+    assert self.rpcs == ['Get']
+  
+  def test_save(self):
+    person = PartialPerson.listing('p', 4).get()
+    person.age = 40
+    assert self.rpcs == ['Get']
+    person.save()
+    
+    stored = PartialPerson.get(person.key)
+    assert stored.age == 40
+    assert stored.secret == 's4'
+    
+    people = sorted(PartialPerson.listing('p', 0), key=lambda person: person.age)[:3]
+    PartialPerson.save_multi(people)
+    assert [PartialPerson.get(person.key).secret for person in people] == ['s0', 's1', 's2']
+  
+  def test_save_deleted(self):
+    person = PartialPerson.listing('p', 4).get()
+    PartialPerson.get(person.key).delete()
+    
+    with smart_assert.raises(Exception):
+      person.age = 40
+    assert person._partial != None
+    with smart_assert.raises(Exception):
+      person.save()
+    with smart_assert.raises(Exception):
+      PartialPerson.save_multi([person])
+    assert PartialPerson.get(person.key) == None
+  
+  def test_json(self):
+    person = PartialPerson.listing('p', 4).get()
+    assert json.loads(venom.internal.json_encoder.compact_encoder.encode(person)) == {
+      'name': 'p', 'age': 4, 'key': person.key
+    }
+    assert person.__json__() == { 'name': 'p', 'age': 4, 'key': person.key }
+    assert self.rpcs == []
+  
+  def test_invalid(self):
+    try:
+      class DatastoreReturning(venom.Model):
+        name = venom.Properties.String()
+        by_name = venom.Query(name == venom.QP).returning('name')
+    except Exception as err:
+      assert str(err) == "Query 'by_name' can only return fields from the search index but it queries the datastore"
+    else:
+      assert False
+    
+    try:
+      class UnindexedReturning(venom.Model):
+        name = venom.Properties.String(max=None)
+        secret = venom.Properties.String()
+        by_name = venom.Query(name == venom.QP).returning('secret')
+    except Exception as err:
+      assert str(err) == "Query 'by_name' cannot return 'secret' because it is not a property stored in the search index"
+    else:
+      assert False
@@ -0,0 +1,9 @@
+__all__ = ['test_application', 'test_handlers', 'test_Parameters', 'test_Protocols', 'test_router', 'test_routes']
+
+
+import test_application
+import test_handlers
+import test_Parameters
+import test_Protocols
+import test_router
+import test_routes
\ No newline at end of file
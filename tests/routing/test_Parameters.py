@@ -0,0 +1,153 @@
+from helper import smart_assert, BasicTestCase
+import venom
+
+import copy
+
+
+Parameters = venom.Parameters
+
+
+class Upper(Parameters.String):
+  def cast(self, key, value):
+    return str(value).upper()
+
+
+class CompiledValidatorTest(BasicTestCase):
+  def assert_equivalent(self, parameter, value):
+    """
+    ' Runs the compiled validator and Parameter.load on copies of
+    ' value and checks they return or raise the same thing.
+    """
+    results = []
+    for load in [parameter.load, parameter.compile()]:
+      try:
+        results.append(('ok', load('request.Body', copy.deepcopy(value))))
+      except (Parameters.ParameterValidationFailed, Parameters.ParameterCastingFailed) as err:
+        results.append((type(err), str(err)))
+    assert results[0] == results[1], results
+    return results[1]
+  
+  def test_leaves(self):
+    cases = [
+      (Parameters.Parameter(), [None, 1, 'a']),
+      (Parameters.Parameter(required=False), [None]),
+      (Parameters.ChoicesParameter(choices=[1, 2]), [1, 3]),
+      (Parameters.String(), ['a', 12, None, u'caf\xe9']),
+      (Parameters.String(min=2, max=3), ['a', 'ab', 'abcd']),
+      (Parameters.String(characters='abc'), ['abba', 'abd']),
+      (Parameters.String(pattern='[a-z]+'), ['abc', 'ab1']),
+      (Parameters.String(choices=['a', 'b']), ['a', 'c']),
+      (Parameters.Integer(min=0, max=10), ['5', 5, -1, 11, 'x', None]),
+      (Parameters.Float(min=0.5), ['1.5', 0.1, 'x']),
+      (Parameters.Integer(choices=[[1]]), [1]),
+      (Parameters.ChoicesParameter(choices=['a', 'b']), [['a'], { 'a': 1 }, 'a']),
+      (Parameters.ChoicesParameter(choices=[1, [2]]), [[2], [3], 1]),
+      (Upper(min=2), ['ab', 'a'])
+    ]
+    for parameter, values in cases:
+      for value in values:
+        self.assert_equivalent(parameter, value)
+  
+  def test_unhashable_choices(self):
+    parameter = Parameters.ChoicesParameter(choices=['a', 'b'])
+    with smart_assert.raises(Parameters.ParameterValidationFailed):
+      parameter.compile()('request.Body', ['a'])
+    result = self.assert_equivalent(Parameters.ChoicesParameter(choices=['a']), ['a'])
+    assert result[0] == Parameters.ParameterValidationFailed
+  
+  def test_containers(self):
+    parameter = Parameters.Dict({
+      'name': Parameters.String(min=3),
+      'age': Parameters.Integer(required=False),
+      'ignored': 'not a parameter',
+      'address': {
+        'city': Parameters.String(),
+        'tags': Parameters.List(Parameters.String(), min=1, max=2)
+      },
+      'friends': Parameters.List({
+        'name': Parameters.String(),
+        'scores': Parameters.List(Parameters.List(Parameters.Integer()))
+      })
+    })
+    valid = {
+      'name': 'foo',
+      'address': { 'city': 'bar', 'tags': ['a'] },
+      'friends': [{ 'name': 'baz', 'scores': [['1', 2], []] }],
+      'extra': True
+    }
+    result = self.assert_equivalent(parameter, valid)
+    assert result[1]['friends'][0]['scores'] == [[1, 2], []]
+    assert result[1]['age'] == None
+    
+    invalid = [
+      dict(valid, name='fo'),
+      dict(valid, address={ 'city': 'bar', 'tags': [] }),
+      dict(valid, address={ 'city': 'bar', 'tags': ['a', 'b', 'c'] }),
+      dict(valid, address={ 'tags': ['a'] }),
+      dict(valid, friends=[{ 'name': 'baz', 'scores': [['1', 'x']] }]),
+      dict(valid, friends=[{ 'name': 'baz', 'scores': 5 }]),
+      dict(valid, friends=None),
+      'not a dict'
+    ]
+    for value in invalid:
+      assert self.assert_equivalent(parameter, value)[0] != 'ok'
+  
+  def test_error_keys(self):
+    parameter = Parameters.Dict({ 'items': Parameters.List({ 'count': Parameters.Integer(max=1) }) })
+    try:
+      parameter.compile()('request.Body', { 'items': [{ 'count': 0 }, { 'count': 2 }] })
+      assert False, 'validation should have failed'
+    except Parameters.ParameterValidationFailed as err:
+      assert str(err) == "'request.Body.items[1].count' field must be at most 1 but was 2"
+  
+  def test_deep_nesting(self):
+    parameter = Parameters.Integer()
+    value = 1
+    for _ in range(40):
+      parameter = Parameters.List(parameter)
+      value = [value]
+    self.assert_equivalent(parameter, value)
+  
+  def test_route_compiles(self):
+    route = venom.GET('/', venom.RequestHandler).body({ 'name': Parameters.String() })
+    assert route._load_body('request.Body', { 'name': 1 }) == { 'name': '1' }
+  
+  def test_route_compiles_lazily(self):
+    compiled = []
+    compile = Parameters.Parameter.compile
+    def counting(parameter):
+      compiled.append(parameter)
+      return compile(parameter)
+    Parameters.Parameter.compile = counting
+    try:
+      route = venom.GET('/', venom.RequestHandler).body({ 'name': Parameters.String() })
+      other = venom.GET('/other', venom.RequestHandler)
+      assert compiled == []
+      assert route._load_url is other._load_url is other._load_body
+      
+      assert route._load_body('request.Body', { 'name': 1 }) == { 'name': '1' }
+      assert route._load_body('request.Body', { 'name': 2 }) == { 'name': '2' }
+      assert compiled == [route._body]
+    finally:
+      Parameters.Parameter.compile = compile
+    
+    with smart_assert.raises(Parameters.ParameterValidationFailed):
+      route._load_url('request.Path', None)
+    with smart_assert.raises(Parameters.ParameterCastingFailed):
+      route._load_url('request.Path', 'not a dict')
+  
+  def test_lazy_defers(self):
+    class LazyItem(venom.Model):
+      pass
+    
+    cases = [
+      ({}, False),
+      ({ 'name': Parameters.String() }, False),
+      ({ 'item': Parameters.Model(LazyItem) }, True),
+      ({ 'items': Parameters.List({ 'item': Parameters.Model(LazyItem) }) }, True),
+      ({ 'nested': { 'item': Parameters.Model(LazyItem) } }, True)
+    ]
+    for template, defers in cases:
+      parameter = Parameters.Dict(template)
+      assert Parameters.lazy_compile(parameter).defers == defers
+      assert parameter.compile().defers == defers
@@ -0,0 +1,155 @@
+from helper import smart_assert, BasicTestCase
+import venom
+
+from webob.datetime_utils import UTC
+import datetime
+import gzip
+import json
+import os
+import StringIO
+import webapp2
+import zlib
+
+
+class JSONProtocolTest(BasicTestCase):
+  def protocol(self, path='/', **attributes):
+    request = webapp2.Request.blank(path)
+    response = webapp2.Response()
+    protocol = venom.Protocols.JSONProtocol(request, response, None, {})
+    for key, value in attributes.items():
+      setattr(protocol, key, value)
+    return protocol
+  
+  def test_compact_and_pretty(self):
+    value = { 'b': [1, 2], 'a': 'foo' }
+    assert json.loads(self.protocol(pretty=False).write(value)) == value
+    assert self.protocol(pretty=False).write([1, 2]) == '[1,2]'
+    assert self.protocol(pretty=True).write(value) == json.dumps(value, indent=2, sort_keys=True)
+    assert self.protocol('/?pretty=1', pretty=False).write(value) == json.dumps(value, indent=2, sort_keys=True)
+    assert self.protocol(pretty=False).write(None) == '{}'
+  
+  def test_pretty_on_development_server(self):
+    software = os.environ.get('SERVER_SOFTWARE')
+    try:
+      os.environ['SERVER_SOFTWARE'] = 'Development/2.0'
+      assert self.protocol().write([1, 2]) == json.dumps([1, 2], indent=2, sort_keys=True)
+      os.environ['SERVER_SOFTWARE'] = 'Google App Engine/1.9'
+      assert self.protocol().write([1, 2]) == '[1,2]'
+    finally:
+      if software == None: del os.environ['SERVER_SOFTWARE']
+      else: os.environ['SERVER_SOFTWARE'] = software
+  
+  def test_streaming(self):
+    value = { 'entities': [{ 'key': str(i), 'name': 'entity' } for i in range(50)] }
+    
+    protocol = self.protocol(pretty=False, stream_threshold=100)
+    assert len(list(protocol.write_chunks(value))) == 1
+    
+    protocol = self.protocol(pretty=False, stream_threshold=10, chunk_size=100)
+    chunks = list(protocol.write_chunks(value))
+    assert len(chunks) > 1
+    assert json.loads(''.join(chunks)) == value
+    
+    protocol._write(value)
+    assert json.loads(protocol.response.body) == value
+    
+    protocol = self.protocol(pretty=True, stream_threshold=10, chunk_size=100)
+    assert ''.join(protocol.write_chunks(value)) == json.dumps(value, indent=2, sort_keys=True)
+  
+  def test_last_modified_precision(self):
+    updated = datetime.datetime(2015, 3, 4, 5, 6, 7, 890000)
+    protocol = self.protocol()
+    assert not protocol._not_modified('abc', updated)
+    assert protocol.response.headers['Last-Modified'] == 'Wed, 04 Mar 2015 05:06:07 GMT'
+    
+    for since, not_modified in [('05:06:07', True), ('05:06:08', True), ('05:06:06', False)]:
+      protocol = self.protocol()
+      protocol.request.headers['If-Modified-Since'] = 'Wed, 04 Mar 2015 {} GMT'.format(since)
+      assert protocol._not_modified('abc', updated) == not_modified
+      assert protocol.response.last_modified == updated.replace(microsecond=0, tzinfo=UTC)
+
+
+class CompressionTest(BasicTestCase):
+  def protocol(self, encoding=None, compression=None, **attributes):
+    request = webapp2.Request.blank('/')
+    if encoding:
+      request.headers['Accept-Encoding'] = encoding
+    response = webapp2.Response()
+    protocol = venom.Protocols.JSONProtocol(request, response, None, {})._configure(compression=compression)
+    protocol.pretty = False
+    for key, value in attributes.items():
+      setattr(protocol, key, value)
+    return protocol
+  
+  def value(self, count):
+    return [{ 'key': str(i), 'name': 'entity' } for i in range(count)]
+  
+  def gunzip(self, body):
+    return gzip.GzipFile(fileobj=StringIO.StringIO(body)).read()
+  
+  def test_gzip(self):
+    value = self.value(100)
+    protocol = self.protocol('gzip, deflate')
+    protocol._write(value)
+    response = protocol.response
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in response.vary
+    assert len(response.body) < len(json.dumps(value))
+    assert json.loads(self.gunzip(response.body)) == value
+  
+  def test_deflate(self):
+    value = self.value(100)
+    protocol = self.protocol('deflate')
+    protocol._write(value)
+    assert protocol.response.headers['Content-Encoding'] == 'deflate'
+    assert json.loads(zlib.decompress(protocol.response.body)) == value
+  
+  def test_skipped(self):
+    small = self.value(1)
+    large = self.value(100)
+    
+    protocol = self.protocol('gzip')
+    protocol._write(small)
+    assert not 'Content-Encoding' in protocol.response.headers
+    assert 'Accept-Encoding' in protocol.response.vary
+    assert json.loads(protocol.response.body) == small
+    
+    for protocol in [self.protocol(), self.protocol('identity'), self.protocol('gzip;q=0')]:
+      protocol._write(large)
+      assert not 'Content-Encoding' in protocol.response.headers
+      assert json.loads(protocol.response.body) == large
+    
+    protocol = self.protocol('gzip', compression={ 'level': 0 })
+    protocol._write(large)
+    assert not 'Content-Encoding' in protocol.response.headers
+    
+    protocol = self.protocol('gzip')
+    protocol.response.headers['Content-Encoding'] = 'br'
+    protocol._write(large)
+    assert protocol.response.headers['Content-Encoding'] == 'br'
+    assert json.loads(protocol.response.body) == large
+  
+  def test_threshold(self):
+    value = self.value(1)
+    protocol = self.protocol('gzip', compression={ 'threshold': 10 })
+    protocol._write(value)
+    assert json.loads(self.gunzip(protocol.response.body)) == value
+  
+  def test_streaming(self):
+    value = self.value(500)
+    protocol = self.protocol('gzip', stream_threshold=10, chunk_size=100)
+    protocol._write(value)
+    assert protocol.response.headers['Content-Encoding'] == 'gzip'
+    assert json.loads(self.gunzip(protocol.response.body)) == value
+  
+  def test_etag(self):
+    protocol = self.protocol('gzip')
+    assert not protocol._not_modified('abc')
+    protocol._write(self.value(100))
+    assert protocol.response.etag == 'abc-gzip'
+    
+    protocol = self.protocol('gzip')
+    protocol.request.headers['If-None-Match'] = '"abc-gzip"'
+    assert protocol._not_modified('abc')
+    assert protocol.response.status_int == 304
+    assert protocol.response.etag == 'abc-gzip'
@@ -0,0 +1,452 @@
+from helper import smart_assert, BasicTestCase
+import venom
+
+from venom.internal import msgpack_codec
+import json
+import webapp2
+import webob
+
+
+class UserHandler(venom.RequestHandler):
+  def get(self):
+    return { 'user': self.url.get('user') }
+  
+  def put(self):
+    return { 'user': self.url.get('user') }
+  
+  def delete(self):
+    return None
+
+
+class ApplicationTest(BasicTestCase):
+  def setUp(self):
+    super(ApplicationTest, self).setUp()
+    self.app = venom.Application()
+    self.app.GET('/users/:user', UserHandler).url({
+      'user': venom.Parameters.Integer()
+    })
+  
+  def test_dispatch(self):
+    response = webapp2.Request.blank('/api/v1/users/123').get_response(self.app)
+    assert response.status_int == 200
+    body = json.loads(response.body)
+    assert body['user'] == 123
+  
+  def test_dispatch_not_found(self):
+    response = webapp2.Request.blank('/api/v1/todos/123').get_response(self.app)
+    assert response.status_int == 404
+    response = webapp2.Request.blank('/api/v1/users/123', POST='').get_response(self.app)
+    assert response.status_int == 404
+  
+  def test_dispatch_error(self):
+    response = webapp2.Request.blank('/api/v1/users/abc').get_response(self.app)
+    assert response.status_int == 500
+    body = json.loads(response.body)
+    assert body['success'] == False
+    assert body['code'] == 1000
+  
+  def test_version_dispatch(self):
+    app = venom.VersionDispatch(self.app)
+    response = webapp2.Request.blank('/api/v1/users/123').get_response(app)
+    assert response.status_int == 200
+    assert json.loads(response.body)['user'] == 123
+    response = webapp2.Request.blank('/api/v2/users/123').get_response(app)
+    assert response.status_int == 404
+  
+  def test_matches_version(self):
+    assert self.app.matches_version('/api/v1/users')
+    assert self.app.matches_version('/meta/v1/')
+    assert self.app.matches_version('/routes/v1')
+    assert not self.app.matches_version('/api/v2/users')
+    assert not self.app.matches_version('/api/v10/users')
+    assert not self.app.matches_version('/foo/v1/users')
+    assert not self.app.matches_version('api/v1/users')
+    assert not self.app.matches_version('/api')
+  
+  def test_version_register_and_retire(self):
+    v2 = venom.Application(version=2)
+    v2.GET('/users/:user', UserHandler)
+    app = venom.VersionDispatch(self.app)
+    
+    response = webapp2.Request.blank('/api/v2/users/abc').get_response(app)
+    assert response.status_int == 404
+    
+    app.register(v2)
+    response = webapp2.Request.blank('/api/v2/users/abc').get_response(app)
+    assert response.status_int == 200
+    assert json.loads(response.body)['user'] == 'abc'
+    
+    assert app.retire(1) is self.app
+    response = webapp2.Request.blank('/api/v1/users/123').get_response(app)
+    assert response.status_int == 404
+    assert app.applications == [v2]
+    
+    with smart_assert.raises(ValueError) as context:
+      app.retire(1)
+  
+  def test_version_duplicates(self):
+    first = venom.Application(version=2)
+    first.GET('/users/:user', UserHandler)
+    second = venom.Application(version=2)
+    app = venom.VersionDispatch(self.app, first, second)
+    
+    response = webapp2.Request.blank('/api/v2/users/abc').get_response(app)
+    assert response.status_int == 200
+    
+    third = venom.Application(version=2)
+    assert app.register(third) is third
+    response = webapp2.Request.blank('/api/v2/users/abc').get_response(app)
+    assert response.status_int == 200
+    
+    assert app.retire(2) is first
+    response = webapp2.Request.blank('/api/v2/users/abc').get_response(app)
+    assert response.status_int == 404
+    assert app.applications == [self.app, second, third]
+    assert app.retire(2) is second
+    assert app.dispatch(webapp2.Request.blank('/api/v2/users/abc'), None, None) is third
+
+
+class NameHandler(venom.RequestHandler):
+  def post(self):
+    return { 'name': self.body.get('name') }
+
+
+class NegotiationTest(BasicTestCase):
+  def setUp(self):
+    super(NegotiationTest, self).setUp()
+    self.app = venom.Application(protocols=[venom.Protocols.MsgPackProtocol])
+    self.app.GET('/users/:user', UserHandler).url({
+      'user': venom.Parameters.Integer()
+    })
+    self.app.POST('/names', NameHandler).body({
+      'name': venom.Parameters.String(min=3)
+    })
+  
+  def request(self, path, accept=None, body=None, content_type=None):
+    request = webapp2.Request.blank(path)
+    if accept:
+      request.headers['Accept'] = accept
+    if body != None:
+      request.method = 'POST'
+      request.body = body
+      request.content_type = content_type
+    return request.get_response(self.app)
+  
+  def test_accept(self):
+    response = self.request('/api/v1/users/123')
+    assert response.content_type == 'application/json'
+    assert json.loads(response.body) == { 'user': 123 }
+    
+    response = self.request('/api/v1/users/123', accept='application/x-msgpack')
+    assert response.content_type == 'application/x-msgpack'
+    assert msgpack_codec.unpackb(response.body) == { 'user': 123 }
+    
+    response = self.request('/api/v1/users/123', accept='application/json;q=0.5, application/x-msgpack')
+    assert response.content_type == 'application/x-msgpack'
+    
+    response = self.request('/api/v1/users/123', accept='*/*')
+    assert response.content_type == 'application/json'
+    
+    response = self.request('/meta/v1/users/123', accept='application/x-msgpack')
+    assert response.content_type == 'application/json'
+  
+  def test_content_type(self):
+    body = msgpack_codec.packb({ 'name': 'foo' })
+    response = self.request('/api/v1/names', body=body, content_type='application/x-msgpack')
+    assert response.content_type == 'application/json'
+    assert json.loads(response.body) == { 'name': 'foo' }
+    
+    response = self.request('/api/v1/names', accept='application/x-msgpack', body=body, content_type='application/x-msgpack')
+    assert msgpack_codec.unpackb(response.body) == { 'name': 'foo' }
+    
+    body = json.dumps({ 'name': 'bar' })
+    response = self.request('/api/v1/names', accept='application/x-msgpack', body=body, content_type='application/json')
+    assert msgpack_codec.unpackb(response.body) == { 'name': 'bar' }
+  
+  def test_error_envelope(self):
+    body = msgpack_codec.packb({ 'name': 'fo' })
+    response = self.request('/api/v1/names', accept='application/x-msgpack', body=body, content_type='application/x-msgpack')
+    assert response.status_int == 500
+    assert response.content_type == 'application/x-msgpack'
+    body = msgpack_codec.unpackb(response.body)
+    assert body['success'] == False
+    assert body['code'] == 1001
+    
+    response = self.request('/api/v1/users/abc', accept='application/x-msgpack')
+    assert msgpack_codec.unpackb(response.body)['code'] == 1000
+
+
+class LegacyProtocol(venom.Protocols.JSONProtocol):
+  def __init__(self, request, response, error, errors):
+    super(LegacyProtocol, self).__init__(request, response, error, errors)
+    self.legacy = True
+
+
+class LegacyProtocolTest(BasicTestCase):
+  def test_four_argument_init(self):
+    app = venom.Application(protocol=LegacyProtocol, protocols=[venom.Protocols.MsgPackProtocol], compression={ 'threshold': 10 })
+    app.POST('/names', NameHandler).body({
+      'name': venom.Parameters.String(min=3)
+    })
+    request = webapp2.Request.blank('/api/v1/names')
+    request.method = 'POST'
+    request.body = msgpack_codec.packb({ 'name': 'foo' })
+    request.content_type = 'application/x-msgpack'
+    response = request.get_response(app)
+    assert response.status_int == 200
+    assert response.content_type == 'application/json'
+    assert json.loads(response.body) == { 'name': 'foo' }
+
+
+class ListHandler(venom.RequestHandler):
+  def get(self):
+    return [{ 'index': i } for i in range(200)]
+
+
+class CompressionTest(BasicTestCase):
+  def request(self, app, path):
+    request = webapp2.Request.blank(path)
+    request.headers['Accept-Encoding'] = 'gzip'
+    return request.get_response(app)
+  
+  def test_application_and_route(self):
+    app = venom.Application(compression={ 'threshold': 10 })
+    app.GET('/users/:user', UserHandler)
+    app.GET('/items', ListHandler).compress(level=0)
+    
+    response = self.request(app, '/api/v1/users/123')
+    assert response.headers['Content-Encoding'] == 'gzip'
+    response.decode_content()
+    assert json.loads(response.body) == { 'user': '123' }
+    
+    response = self.request(app, '/api/v1/items')
+    assert not 'Content-Encoding' in response.headers
+    assert len(json.loads(response.body)) == 200
+  
+  def test_error(self):
+    app = venom.Application(compression={ 'threshold': 10 })
+    app.GET('/users/:user', UserHandler).url({
+      'user': venom.Parameters.Integer()
+    })
+    response = self.request(app, '/api/v1/users/abc')
+    assert response.status_int == 500
+    assert response.headers['Content-Encoding'] == 'gzip'
+    response.decode_content()
+    assert json.loads(response.body)['code'] == 1000
+
+
+class ConditionalUser(venom.Model):
+  username = venom.Properties.String()
+
+
+class ConditionalTest(BasicTestCase):
+  def setUp(self):
+    super(ConditionalTest, self).setUp()
+    self.app = venom.Application()
+    self.app.CRUD('/users', ConditionalUser, conditional=True)
+    self.app.GET('/names/:user', UserHandler).conditional()
+    self.user = ConditionalUser(username='foo').save()
+    self.path = '/api/v1/users/{}'.format(self.user.key)
+  
+  def request(self, path, method='GET', body=None, **headers):
+    request = webapp2.Request.blank(path)
+    request.method = method
+    if body != None:
+      request.body = json.dumps(body)
+    for key, value in headers.items():
+      request.headers[key.replace('_', '-')] = value
+    return request.get_response(self.app)
+  
+  def test_entity_etag(self):
+    response = self.request(self.path)
+    assert response.status_int == 200
+    assert response.etag == self.user._etag()
+    assert response.last_modified != None
+    
+    response = self.request(self.path, If_None_Match='"{}"'.format(self.user._etag()))
+    assert response.status_int == 304
+    assert response.body == ''
+    
+    response = self.request(self.path, If_None_Match='"other"')
+    assert response.status_int == 200
+    
+    response = self.request(self.path, If_Modified_Since=response.headers['Last-Modified'])
+    assert response.status_int == 304
+    
+    user = ConditionalUser.get(self.user.key)
+    user.username = 'renamed'
+    user.save()
+    response = self.request(self.path, If_None_Match='"{}"'.format(self.user._etag()))
+    assert response.status_int == 200
+  
+  def test_list_etag(self):
+    response = self.request('/api/v1/users')
+    assert response.status_int == 200
+    etag = response.etag
+    assert response.last_modified == None
+    
+    response = self.request('/api/v1/users', If_None_Match='"{}"'.format(etag))
+    assert response.status_int == 304
+    
+    ConditionalUser(username='bar').save()
+    response = self.request('/api/v1/users', If_None_Match='"{}"'.format(etag))
+    assert response.status_int == 200
+    assert len(json.loads(response.body)['entities']) == 2
+  
+  def test_body_etag(self):
+    response = self.request('/api/v1/names/foo')
+    assert response.status_int == 200
+    assert response.etag
+    
+    response = self.request('/api/v1/names/foo', If_None_Match='"{}"'.format(response.etag))
+    assert response.status_int == 304
+    
+    response = self.request('/api/v1/names/bar', If_None_Match='"{}"'.format(response.etag))
+    assert response.status_int == 200
+    assert json.loads(response.body) == { 'user': 'bar' }
+  
+  def test_if_match(self):
+    etag = self.user._etag()
+    response = self.request(self.path, 'PUT', { 'username': 'bar' }, If_Match='"{}"'.format(etag))
+    assert response.status_int == 200
+    assert json.loads(response.body)['username'] == 'bar'
+    assert response.etag != etag
+    
+    response = self.request(self.path, 'PATCH', { 'username': 'baz' }, If_Match='"{}"'.format(etag))
+    assert response.status_int == 412
+    assert json.loads(response.body)['code'] == 1002
+    assert ConditionalUser.get(self.user.key).username == 'bar'
+    
+    response = self.request(self.path, 'PATCH', { 'username': 'baz' }, If_Match='"{}"'.format(response.etag))
+    assert response.status_int == 412
+    
+    current = self.request(self.path).etag
+    response = self.request(self.path, 'PATCH', { 'username': 'baz' }, If_Match='"{}"'.format(current))
+    assert response.status_int == 200
+    
+    response = self.request(self.path, 'PUT', { 'username': 'qux' })
+    assert response.status_int == 200
+
+
+class DirectWSGIApplicationTest(BasicTestCase):
+  def setUp(self):
+    super(DirectWSGIApplicationTest, self).setUp()
+    application = venom.Application()
+    application.GET('/users/:user', UserHandler).url({
+      'user': venom.Parameters.Integer()
+    })
+    self.app = venom.DirectWSGIApplication(venom.VersionDispatch(application))
+  
+  def test_dispatch(self):
+    response = webapp2.Request.blank('/api/v1/users/123').get_response(self.app)
+    assert response.status_int == 200
+    assert response.headers['content-type'] == 'application/json'
+    assert json.loads(response.body)['user'] == 123
+  
+  def test_dispatch_errors(self):
+    response = webapp2.Request.blank('/api/v2/users/123').get_response(self.app)
+    assert response.status_int == 404
+    response = webapp2.Request.blank('/api/v1/todos/123').get_response(self.app)
+    assert response.status_int == 404
+    response = webapp2.Request.blank('/api/v1/users/abc').get_response(self.app)
+    assert response.status_int == 500
+    assert json.loads(response.body)['code'] == 1000
+    response = webapp2.Request.blank('/api/v1/users/123', environ={ 'REQUEST_METHOD': 'CONNECT' }).get_response(self.app)
+    assert response.status_int == 501
+
+
+class MetaTest(BasicTestCase):
+  def setUp(self):
+    super(MetaTest, self).setUp()
+    self.app = venom.Application()
+    venom.ui(self.app.GET('/users/:user', UserHandler).url({
+      'user': venom.Parameters.Integer()
+    }), 'ui-users-get')
+    self.app.PUT('/users/:user', UserHandler)
+  
+  def get(self, path, etag=None):
+    headers = { 'If-None-Match': etag } if etag else {}
+    return webapp2.Request.blank(path, headers=headers).get_response(self.app)
+  
+  def test_meta(self):
+    response = self.get('/meta/v1/users/123')
+    assert response.status_int == 200
+    body = json.loads(response.body)
+    assert [route['methods'] for route in body['routes']] == [['GET'], ['PUT']]
+    assert body['routes'][0]['url']['user']['type'] == 'Integer'
+    assert body['routes'][0]['ui.guid'] == 'ui-users-get'
+    
+    response = self.get('/meta/v1/users/123?method=put')
+    assert [route['methods'] for route in json.loads(response.body)['routes']] == [['PUT']]
+    
+    response = self.get('/meta/v1/todos/123')
+    assert response.status_int == 404
+  
+  def test_meta_etag(self):
+    response = self.get('/meta/v1/users/123')
+    etag = response.headers['ETag']
+    assert etag
+    
+    response = self.get('/meta/v1/users/456', etag=etag)
+    assert response.status_int == 304
+    assert response.body == ''
+    
+    response = self.get('/meta/v1/users/456?method=GET', etag=etag)
+    assert response.status_int == 200
+  
+  def test_routes(self):
+    response = self.get('/routes/v1')
+    body = json.loads(response.body)
+    assert body['version'] == 1
+    assert [route['path'] for route in body['routes']] == ['/api/v1/users/:user'] * 2
+    
+    response = self.get('/routes/v1', etag=response.headers['ETag'])
+    assert response.status_int == 304
+    
+    response = self.get('/routes/v1?uiguid=ui-users-get')
+    body = json.loads(response.body)
+    assert body['route']['methods'] == ['GET']
+    assert body['route']['ui.handler_name'] == 'UserHandler'
+  
+  def test_routes_invalidation(self):
+    response = self.get('/routes/v1')
+    etag = response.headers['ETag']
+    
+    self.app.DELETE('/users/:user', UserHandler)
+    response = self.get('/routes/v1', etag=etag)
+    assert response.status_int == 200
+    assert len(json.loads(response.body)['routes']) == 3
+
+
+class DocumentationTest(BasicTestCase):
+  def setUp(self):
+    super(DocumentationTest, self).setUp()
+    self.renders = []
+    self._render = venom.docs.template.render
+    def render(path, values):
+      self.renders.append(path)
+      return u'API (v{}) Documentation'.format(values['version'])
+    venom.docs.template.render = render
+  
+  def tearDown(self):
+    venom.docs.template.render = self._render
+    super(DocumentationTest, self).tearDown()
+  
+  def test_rendered_once(self):
+    app = venom.Application(version=3)
+    response = webob.Request.blank('/docs/v3').get_response(app)
+    assert response.status_int == 200
+    assert response.body == 'API (v3) Documentation'
+    # webob.Request is used here since webapp2.Response forces 'no-cache'
+    assert response.headers['Cache-Control'] == venom.docs.Documentation.cache_control
+    assert int(response.headers['Content-Length']) == len(response.body)
+    etag = response.headers['ETag']
+    
+    response = webob.Request.blank('/docs/v3/').get_response(app)
+    assert response.headers['ETag'] == etag
+    
+    response = webob.Request.blank('/docs/v3', headers={ 'If-None-Match': etag }).get_response(app)
+    assert response.status_int == 304
+    assert response.body == ''
+    
+    assert len(self.renders) == 1
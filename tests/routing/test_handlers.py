@@ -0,0 +1,206 @@
+from helper import smart_assert, BasicTestCase
+import venom
+
+from google.appengine.api import apiproxy_stub_map
+from google.appengine.ext import ndb
+
+import json
+import webapp2
+
+
+class HeaderHandler(venom.RequestHandler):
+  def post(self):
+    return { 'agent': self.headers.get('user-agent') }
+
+
+class BodyHandler(venom.RequestHandler):
+  def post(self):
+    return { 'name': self.body.get('name'), 'same': self.body is self.body }
+
+
+class CountingDict(venom.Parameters.Dict):
+  loads = 0
+  
+  def load(self, key, value):
+    CountingDict.loads += 1
+    return super(CountingDict, self).load(key, value)
+
+
+class LazyParametersTest(BasicTestCase):
+  def setUp(self):
+    super(LazyParametersTest, self).setUp()
+    CountingDict.loads = 0
+    self.app = venom.Application()
+    self.app.POST('/headers', HeaderHandler).body(CountingDict({
+      'name': venom.Parameters.String(min=3)
+    }))
+    self.app.POST('/body', BodyHandler).body(CountingDict({
+      'name': venom.Parameters.String(min=3)
+    }))
+  
+  def request(self, path, body):
+    request = webapp2.Request.blank(path, POST=body)
+    request.headers['User-Agent'] = 'venom'
+    return request.get_response(self.app)
+  
+  def test_unread_sections_are_not_parsed(self):
+    response = self.request('/api/v1/headers', 'not json')
+    assert response.status_int == 200
+    assert json.loads(response.body) == { 'agent': 'venom' }
+    assert CountingDict.loads == 0
+  
+  def test_sections_parsed_once(self):
+    response = self.request('/api/v1/body', json.dumps({ 'name': 'foo' }))
+    assert response.status_int == 200
+    assert json.loads(response.body) == { 'name': 'foo', 'same': True }
+    assert CountingDict.loads == 1
+  
+  def test_errors_use_protocol_envelope(self):
+    response = self.request('/api/v1/body', json.dumps({ 'name': 'fo' }))
+    assert response.status_int == 500
+    body = json.loads(response.body)
+    assert body['success'] == False
+    assert body['code'] == 1001
+  
+  def test_descriptor(self):
+    assert isinstance(venom.RequestHandler.body, venom.routing.handlers.LazyParameters)
+
+
+class ParameterViewTest(BasicTestCase):
+  def setUp(self):
+    super(ParameterViewTest, self).setUp()
+    self.data = {
+      'name': 'foo',
+      'address': { 'city': 'bar', 'geo': { 'lat': 1 } },
+      'tags': [{ 'name': 'a' }, { 'name': 'b' }],
+      'matrix': [[1, 2], [3]]
+    }
+    self.view = venom.routing.handlers.ParameterDict(self.data)
+  
+  def test_zero_copy(self):
+    assert self.view._data is self.data
+    assert self.view._views == {}
+    address = self.view['address']
+    assert isinstance(address, venom.routing.handlers.ParameterDict)
+    assert address._data is self.data['address']
+    assert self.view['address'] is address
+    assert self.view._views.keys() == ['address']
+    assert self.view['name'] == 'foo'
+  
+  def test_get(self):
+    assert self.view.get() == None
+    assert self.view.get('') is self.view
+    assert self.view.get('name') == 'foo'
+    assert self.view.get('missing') == None
+    assert self.view.get('address.city') == 'bar'
+    assert self.view.get('address.geo.lat') == 1
+    assert self.view.get('address.missing') == None
+    assert self.view.get('tags.name') == ['a', 'b']
+    assert self.view.get('name', 'address.city') == ['foo', 'bar']
+    assert self.view['tags'].get('name', '') == [['a', 'b'], self.view['tags']]
+  
+  def test_mapping_and_sequence(self):
+    assert self.view == self.data
+    assert dict(**self.view)['name'] == 'foo'
+    assert sorted(self.view.keys()) == sorted(self.data.keys())
+    assert len(self.view['matrix']) == 2
+    assert self.view['matrix'][-1] == [3]
+    assert self.view['matrix'][0][1] == 2
+    assert list(self.view['matrix'][0]) == [1, 2]
+    assert self.view['matrix'][:1] == [[1, 2]]
+    with smart_assert.raises(TypeError) as context:
+      self.view['name'] = 'bar'
+  
+  def test_json(self):
+    encoded = venom.internal.json_encoder.compact_encoder.encode(self.view['address'])
+    assert json.loads(encoded) == self.data['address']
+    encoded = json.dumps(self.view['tags'], cls=venom.internal.json_encoder.JSONEncoder)
+    assert json.loads(encoded) == self.data['tags']
+  
+  def test_headers(self):
+    headers = venom.routing.handlers.HeaderDict({ 'User-Agent': 'venom' })
+    assert headers['user-agent'] == 'venom'
+    assert headers['USER-AGENT'] == 'venom'
+    assert headers.get('User-Agent') == 'venom'
+    assert 'user-agent' in headers
+
+
+class BatchItem(venom.Model):
+  name = venom.Properties.String()
+
+
+class BatchOwner(venom.Model):
+  name = venom.Properties.String()
+
+
+class BatchHandler(venom.RequestHandler):
+  def post(self):
+    return {
+      'entity': self.url.get('entity').name,
+      'owner': self.headers.get('x-owner').name,
+      'items': [item.name for item in self.body.get('items')]
+    }
+
+
+class ModelBatchTest(BasicTestCase):
+  def setUp(self):
+    super(ModelBatchTest, self).setUp()
+    self.items = [BatchItem(name='item{}'.format(i)) for i in range(5)]
+    BatchItem.save_multi(self.items)
+    self.owner = BatchOwner(name='owner').save()
+    ndb.get_context().clear_cache()
+    
+    self.app = venom.Application()
+    self.app.POST('/items/:entity', BatchHandler).url({
+      'entity': venom.Parameters.Model(BatchItem)
+    }).headers({
+      'X-Owner': venom.Parameters.Model(BatchOwner)
+    }).body({
+      'items': venom.Parameters.List(venom.Parameters.Model(BatchItem))
+    })
+    
+    self.gets = 0
+    def count(service, call, request, response):
+      if call == 'Get':
+        self.gets += 1
+    apiproxy_stub_map.apiproxy.GetPreCallHooks().Append('count_gets', count, 'datastore_v3')
+  
+  def tearDown(self):
+    apiproxy_stub_map.apiproxy.GetPreCallHooks().Clear()
+    super(ModelBatchTest, self).tearDown()
+  
+  def request(self, entity, owner, items):
+    request = webapp2.Request.blank('/api/v1/items/{}'.format(entity), POST=json.dumps({ 'items': items }))
+    request.headers['X-Owner'] = str(owner)
+    return request.get_response(self.app)
+  
+  def test_single_fetch_per_model(self):
+    keys = [item.key for item in self.items]
+    response = self.request(keys[0], self.owner.key, keys + keys[:2])
+    assert response.status_int == 200
+    assert json.loads(response.body) == {
+      'entity': 'item0',
+      'owner': 'owner',
+      'items': ['item0', 'item1', 'item2', 'item3', 'item4', 'item0', 'item1']
+    }
+    assert self.gets <= 2
+  
+  def test_missing_entity(self):
+    keys = [item.key for item in self.items]
+    response = self.request(keys[0], self.owner.key, [keys[1], '123456'])
+    assert response.status_int == 500
+    body = json.loads(response.body)
+    assert body['code'] == 1001
+    assert body['message'] == "'request.Body.items[1]' field found no entity from model BatchItem matching the provided key"
+  
+  def test_sections(self):
+    route = self.app.find_route('/api/v1/items/1', 'POST')
+    assert route._batched_sections() == ['url', 'headers', 'body']
+    route = self.app.find_route('/meta/v1/items/1', 'GET')
+    assert route._batched_sections() == []
+  
+  def test_unbatched_load(self):
+    load = venom.Parameters.List(venom.Parameters.Model(BatchItem)).compile()
+    assert load.defers
+    entities = load('request.Body', [self.items[0].key])
+    assert entities[0].name == 'item0'
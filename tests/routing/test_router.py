@@ -0,0 +1,75 @@
+from helper import smart_assert, BasicTestCase
+import venom
+
+
+class TestHandler(venom.RequestHandler):
+  pass
+
+
+class RouterTest(BasicTestCase):
+  def test_static_and_parameter_segments(self):
+    users = venom.GET('/api/v1/users', TestHandler)
+    user = venom.GET('/api/v1/users/:user', TestHandler)
+    todo = venom.GET('/api/v1/users/:user/todos/:todo', TestHandler)
+    router = venom.Router([users, user, todo])
+    
+    assert router.find('/api/v1/users', 'GET') == (users, {})
+    assert router.find('/api/v1/users/', 'GET') == (users, {})
+    assert router.find('/api/v1/users/123', 'GET') == (user, { 'user': '123' })
+    assert router.find('/api/v1/users/123/todos/456', 'get') == (todo, { 'user': '123', 'todo': '456' })
+    assert router.find('/api/v1/users/123/todos', 'GET') == (None, None)
+    assert router.find('/api/v2/users', 'GET') == (None, None)
+  
+  def test_methods(self):
+    get = venom.GET('/api/v1/users/:user', TestHandler)
+    put = venom.PUT('/api/v1/users/:entity', TestHandler)
+    anything = venom.Route('/meta/v1/users/:user', TestHandler)
+    router = venom.Router([get, put, anything])
+    
+    assert router.find('/api/v1/users/123', 'GET') == (get, { 'user': '123' })
+    assert router.find('/api/v1/users/123', 'PUT') == (put, { 'entity': '123' })
+    assert router.find('/api/v1/users/123', 'POST') == (None, None)
+    assert router.find('/meta/v1/users/123', 'POST') == (anything, { 'user': '123' })
+  
+  def test_first_registered_route_wins(self):
+    param = venom.GET('/api/v1/users/:user', TestHandler)
+    static = venom.GET('/api/v1/users/me', TestHandler)
+    
+    router = venom.Router([param, static])
+    assert router.find('/api/v1/users/me', 'GET')[0] is param
+    
+    router = venom.Router([static, param])
+    assert router.find('/api/v1/users/me', 'GET')[0] is static
+  
+  def test_matches_linear_scan(self):
+    app = venom.Application()
+    app.GET('/users', TestHandler)
+    app.GET('/users/:user', TestHandler)
+    app.POST('/users/:user/todos', TestHandler)
+    app.GET('/lists/:list/todos/:todo', TestHandler)
+    
+    requests = [
+      ('/api/v1/users', 'GET'),
+      ('/api/v1/users/123', 'GET'),
+      ('/api/v1/users/123/todos', 'POST'),
+      ('/api/v1/users/123/todos', 'GET'),
+      ('/api/v1/lists/1/todos/2', 'GET'),
+      ('/meta/v1/lists/1/todos/2', 'OPTIONS'),
+      ('/routes/v1', 'GET'),
+      ('/api/v1/missing', 'GET')
+    ]
+    for path, method in requests:
+      expected = None
+      for route in app.routes:
+        if route.matches(path, method):
+          expected = route
+          break
+      smart_assert(app.find_route(path, method), expected).equals()
+  
+  def test_routes_added_after_compiling(self):
+    app = venom.Application()
+    app.GET('/users', TestHandler)
+    assert app.find_route('/api/v1/users', 'GET') != None
+    assert app.find_route('/api/v1/todos', 'GET') == None
+    route = app.GET('/todos', TestHandler)
+    assert app.find_route('/api/v1/todos', 'GET') is route
@@ -0,0 +1,26 @@
+from helper import smart_assert, BasicTestCase
+import venom
+
+
+class PathTest(BasicTestCase):
+  def test_segments(self):
+    path = venom.Path('/api/v1/users/:user/todos/:todo/')
+    assert path.segments == ('api', 'v1', 'users', ':user', 'todos', ':todo')
+    assert path.parameters == ((3, 'user'), (5, 'todo'))
+    assert path.has_parameters()
+    assert not venom.Path('/api/v1/users').has_parameters()
+  
+  def test_match(self):
+    path = venom.Path('/api/v1/users/:user/todos/:todo')
+    assert path.match('/api/v1/users/123/todos/456') == { 'user': '123', 'todo': '456' }
+    assert path.match('api/v1/users/123/todos/456/') == { 'user': '123', 'todo': '456' }
+    assert path.match('/api/v1/users/123/todos') == None
+    assert path.match('/api/v1/lists/123/todos/456') == None
+    assert venom.Path('/api/v1/users').match('/api/v1/users') == {}
+  
+  def test_matches_and_get_parameters(self):
+    path = venom.Path('/api/v1/users/:user')
+    assert path.matches('/api/v1/users/123')
+    assert not path.matches('/api/v1/users')
+    assert path.get_parameters('/api/v1/users/123') == { 'user': '123' }
+    assert path.get_parameters('/api/v1/users') == {}
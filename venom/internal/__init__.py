@@ -1,7 +1,9 @@
-__all__ = ['hybrid_model', 'builtin_file', 'index_yaml', 'search_yaml']
+__all__ = ['hybrid_model', 'builtin_file', 'index_yaml', 'search_yaml', 'json_encoder', 'msgpack_codec']
 
 
 import hybrid_model
 import builtin_file
 import index_yaml
-import search_yaml
\ No newline at end of file
+import search_yaml
+import json_encoder
+import msgpack_codec
\ No newline at end of file
@@ -80,6 +80,15 @@ class HybridSearchDocument(object):
       return self.document
     return None
   
+  def needs_document(self):
+    """ whether get_document would have to read the index """
+    return not self._loaded_document and bool(self.document_id)
+  
+  def set_loaded_document(self, document):
+    """ stores a document prefetched for this id, None when it does not exist """
+    self.document = document
+    self._loaded_document = True
+  
   def register_update(self, document, put_result):
     document._doc_id = put_result.id
     self._set_document(document)
@@ -104,9 +113,9 @@ class HybridDatastoreEntity(object):
   def has_diff(self, properties):
     entity = self.get_entity()
     if not entity: return True
-    provided_properties = [ prop.name for prop in properties ]
+    provided_properties = set(prop.name for prop in properties)
     entity_properties = entity._properties
-    if provided_properties != entity_properties.keys(): return True
+    if provided_properties != set(entity_properties.keys()): return True
     for ndb_prop, prop_name, provided_value in properties:
       entity_value = getattr(entity, prop_name)
       if not provided_value == entity_value: return True
@@ -131,6 +140,21 @@ class HybridDatastoreEntity(object):
       return self.entity
     return None
   
+  def assign_key(self, entity_key):
+    """ gives a new entity the key reserved for it, with nothing stored yet """
+    self.entity_key = entity_key
+    self.entity = None
+    self._loaded_entity = True
+  
+  def needs_entity(self):
+    """ whether get_entity would have to read the datastore """
+    return not self._loaded_entity and isinstance(self.entity_key, ndb.Key)
+  
+  def set_loaded_entity(self, entity):
+    """ stores an entity prefetched for this key, None when it does not exist """
+    self.entity = entity
+    self._loaded_entity = True
+  
   def register_update(self, entity):
     self._set_entity(entity)
   
@@ -142,6 +166,7 @@ class HybridDatastoreEntity(object):
 
 class HybridPutManager(object):
   maximum_search_put = 200
+  maximum_search_get = 200
   
   def __init__(self, hybrid_entities):
     self.hybrids = []
@@ -154,10 +179,150 @@ class HybridPutManager(object):
   def add(self, hybrid_entity):
     self.hybrids.append(hybrid_entity)
   
-  def _put_search_documents(self):
-    search_indexes = {}
+  def _prefetch(self):
+    """
+    ' Loads the stored entity and document of every hybrid that
+    ' the diffs would otherwise read one at a time. Entities are
+    ' read with one get_multi and documents as _get_documents_async
+    ' describes, all issued before waiting on any of them.
+    """
+    entity_hybrids = [
+      hybrid for hybrid in self.hybrids
+      if hybrid.datastore_changed == None and hybrid.datastore_entity.needs_entity()
+    ]
+    entity_futures = ndb.get_multi_async([
+      hybrid.datastore_entity.entity_key for hybrid in entity_hybrids
+    ])
+    
+    document_hybrids = {}
     for hybrid in self.hybrids:
-      if hybrid.document_has_diff():
+      if hybrid.search_changed == None and hybrid.search_document.needs_document():
+        document_hybrids.setdefault(hybrid.kind, []).append(hybrid)
+    document_fetches = [
+      (hybrids, self._get_documents_async(hybrids[0].index, [
+        hybrid.search_document.document_id for hybrid in hybrids
+      ]))
+      for hybrids in document_hybrids.values()
+    ]
+    
+    for hybrid, future in zip(entity_hybrids, entity_futures):
+      hybrid.datastore_entity.set_loaded_entity(future.get_result())
+    for hybrids, fetch in document_fetches:
+      documents = fetch()
+      for hybrid in hybrids:
+        hybrid.search_document.set_loaded_document(documents[hybrid.search_document.document_id])
+  
+  @classmethod
+  def _get_documents_async(cls, index, document_ids):
+    """
+    ' The Search API has no get by many ids, so dense runs of ids
+    ' are read with one range read each and all other ids with
+    ' one get each, all issued together. Sequential ids, such as
+    ' those reserve_ids allocates, form runs. The scattered ids put
+    ' assigns in production do not, so reading N of those documents
+    ' costs N ListDocuments calls sharing a single round trip.
+    ' Returns a function which waits for the reads and returns a
+    ' dict of id to document, or None where none is stored.
+    """
+    runs, singles = cls._split_dense_runs(set(document_ids))
+    ranges = [
+      (run, index.get_range_async(start_id=run[0], limit=cls._run_span(run)))
+      for run in runs
+    ]
+    gets = [(document_id, index.get_async(document_id)) for document_id in singles]
+    
+    def fetch():
+      documents = {}
+      remaining = []
+      for run, future in ranges:
+        results = future.get_result().results
+        found = { document.doc_id: document for document in results }
+        # a short range reached the end of the index
+        last_id = results[-1].doc_id if len(results) == cls._run_span(run) else None
+        for document_id in run:
+          if last_id != None and document_id > last_id:
+            remaining.append(document_id)
+          else:
+            documents[document_id] = found.get(document_id)
+      # only ids of another length sorting inside a run leave any
+      late_gets = [(document_id, index.get_async(document_id)) for document_id in remaining]
+      for document_id, future in gets + late_gets:
+        documents[document_id] = future.get_result()
+      return documents
+    return fetch
+  
+  @staticmethod
+  def _run_span(run):
+    return int(run[-1]) - int(run[0]) + 1
+  
+  @classmethod
+  def _split_dense_runs(cls, document_ids):
+    """
+    ' Splits ids into runs which one range read covers and the ids
+    ' left to read one by one. A run holds numeric ids of a single
+    ' length, sorted, at most maximum_search_get of them, spanning
+    ' at most twice as many numbers as it holds; ids of a single
+    ' length sort by value, so its range read returns little else.
+    """
+    by_length = {}
+    singles = []
+    for document_id in document_ids:
+      if document_id.isdigit() and str(int(document_id)) == document_id:
+        by_length.setdefault(len(document_id), []).append(document_id)
+      else:
+        singles.append(document_id)
+    
+    runs = []
+    for ids in by_length.values():
+      ids.sort(key=int)
+      run = []
+      for document_id in ids:
+        candidate = run + [document_id]
+        if len(candidate) <= cls.maximum_search_get and cls._run_span(candidate) <= 2 * len(candidate):
+          run = candidate
+          continue
+        if len(run) > 1: runs.append(run)
+        else: singles.extend(run)
+        run = [document_id]
+      if len(run) > 1: runs.append(run)
+      else: singles.extend(run)
+    return runs, singles
+  
+  def _allocate_ids_async(self):
+    """
+    ' Reserves keys for the new hybrids of kinds with reserve_ids
+    ' which have a document to put, with one allocate_ids per kind,
+    ' so that their document ids are known without waiting for the
+    ' datastore put. Returns a function which waits and assigns
+    ' the keys.
+    """
+    new_hybrids = {}
+    for hybrid in self._new_documents():
+      if hybrid.reserve_ids:
+        new_hybrids.setdefault(hybrid.kind, []).append(hybrid)
+    allocations = [
+      (hybrids, hybrids[0].model.allocate_ids_async(size=len(hybrids)))
+      for hybrids in new_hybrids.values()
+    ]
+    
+    def allocate():
+      for hybrids, future in allocations:
+        first, last = future.get_result()
+        for hybrid, entity_id in zip(hybrids, xrange(first, last + 1)):
+          hybrid.datastore_entity.assign_key(ndb.Key(hybrid.kind, entity_id))
+    return allocate
+  
+  def _new_documents(self):
+    """ the hybrids whose document id waits on a key for a new entity """
+    return [
+      hybrid for hybrid in self.hybrids
+      if not hybrid.datastore_entity.entity_key and hybrid.search_needs_put()
+    ]
+  
+  def _put_search_documents_async(self, hybrids=None):
+    search_indexes = {}
+    for hybrid in self.hybrids if hybrids == None else hybrids:
+      if hybrid.search_needs_put():
         document = hybrid.get_update_document()
         if not hybrid.kind in search_indexes:
           search_indexes[hybrid.kind] = {
@@ -168,33 +333,66 @@ class HybridPutManager(object):
         search_indexes[hybrid.kind]['documents'].append(document)
         search_indexes[hybrid.kind]['hybrids'].append(hybrid)
     
+    puts = []
     for search_info in search_indexes.values():
       index = search_info['index']
       documents = search_info['documents']
-      hybrids = search_info['hybrids']
-      results = []
-      for i in range(0, len(documents), self.maximum_search_put):
-        results += index.put(documents[i: i + self.maximum_search_put])
-      
-      for hybrid, document, result in zip(hybrids, documents, results):
-        hybrid.register_document(document, result)
-  
-  def _put_datastore_entities(self):
+      futures = [
+        index.put_async(documents[i: i + self.maximum_search_put])
+        for i in range(0, len(documents), self.maximum_search_put)
+      ]
+      puts.append((search_info['hybrids'], documents, futures))
+    
+    def put():
+      for hybrids, documents, futures in puts:
+        results = []
+        for future in futures:
+          results += future.get_result()
+        for hybrid, document, result in zip(hybrids, documents, results):
+          hybrid.register_document(document, result)
+    return put
+  
+  def _put_datastore_entities_async(self):
     entities = []
     saved_hybrids = []
     for hybrid in self.hybrids:
-      if hybrid.datastore_has_diff():
+      if hybrid.datastore_needs_put():
         entities.append(hybrid.get_update_entity())
         saved_hybrids.append(hybrid)
     
-    ndb.put_multi(entities)
+    futures = ndb.put_multi_async(entities)
     
-    for entity, hybrid in zip(entities, saved_hybrids):
-      hybrid.register_entity(entity)
+    def put():
+      for future in futures:
+        future.get_result()
+      for entity, hybrid in zip(entities, saved_hybrids):
+        hybrid.register_entity(entity)
+    return put
   
   def get_results(self):
-    self._put_datastore_entities()
-    self._put_search_documents()
+    """
+    ' Reads what the diffs need, and reserves keys for new entities
+    ' of kinds with reserve_ids, in one round. Then issues the
+    ' datastore put together with the search puts of documents
+    ' whose ids are known. Documents of other new entities are put
+    ' once the datastore has assigned their keys.
+    """
+    allocate = self._allocate_ids_async()
+    self._prefetch()
+    allocate()
+    waiting = set(map(id, self._new_documents()))
+    put_entities = self._put_datastore_entities_async()
+    put_documents = self._put_search_documents_async([
+      hybrid for hybrid in self.hybrids if not id(hybrid) in waiting
+    ])
+    put_entities()
+    if waiting:
+      self._put_search_documents_async([
+        hybrid for hybrid in self.hybrids if id(hybrid) in waiting
+      ])()
+    put_documents()
+    for hybrid in self.hybrids:
+      hybrid.datastore_changed = hybrid.search_changed = None
 
 
 class MetaHybridModel(type):
@@ -214,6 +412,16 @@ class HybridModel(object):
   # constants
   default_indexed = False
   
+  # ids read per Search API request, at most 1000
+  search_batch_size = 100
+  
+  # new entities with search fields reserve their keys with
+  # allocate_ids, so their documents are put alongside them rather
+  # than after. Reserved ids are sequential, not scattered like
+  # those put assigns, so kinds written at a high rate would
+  # hotspot the datastore and should leave this off.
+  reserve_ids = False
+  
   @classmethod
   def _init_class(cls):
     cls.kind = cls.__name__
@@ -235,6 +443,12 @@ class HybridModel(object):
     
     self.search_document = HybridSearchDocument(self.index, document=document, document_id=document_id)
     self.datastore_entity = HybridDatastoreEntity(self.model, entity=entity, entity_key=entity_key)
+    
+    # set by callers which already know whether the next put
+    # changes each side: True writes it without diffing, False
+    # skips it and None diffs it against what is stored
+    self.datastore_changed = None
+    self.search_changed = None
 
   @property
   def entity_key(self):
@@ -259,9 +473,14 @@ class HybridModel(object):
     fields = self._get_document_fields()
     return self.search_document.has_diff(fields)
   
+  def search_needs_put(self):
+    if self.search_changed != None:
+      return self.search_changed
+    return self.document_has_diff()
+  
   def get_update_document(self):
     fields = self._get_document_fields()
-    if not self.search_document.get_document():
+    if not self.search_document.document_id:
       entity_key = self.datastore_entity.entity_key
       if entity_key:
         document_id = self._key_to_document_id(entity_key)
@@ -282,6 +501,11 @@ class HybridModel(object):
     properties = self._get_datastore_properties()
     return self.datastore_entity.has_diff(properties)
   
+  def datastore_needs_put(self):
+    if self.datastore_changed != None:
+      return self.datastore_changed
+    return self.datastore_has_diff()
+  
   def get_update_entity(self):
     properties = self._get_datastore_properties()
     return self.datastore_entity.get_update_entity(properties)
@@ -336,19 +560,150 @@ class HybridModel(object):
     ]
 
   @classmethod
-  def query_by_search(cls, query_string):
-    options = search.QueryOptions(ids_only=True)
-    query = search.Query(query_string, options=options)
-    documents = cls.index.search(query)
-    keys = [cls._document_id_to_key(document.doc_id) for document in documents]
-    entities = ndb.get_multi(keys)
-    return [ cls(entity=datastore_entity) for datastore_entity in entities ]
+  def query_by_search(cls, query_string, batch_size=None):
+    return list(cls.iter_by_search(query_string, batch_size=batch_size))
+  
+  @classmethod
+  def iter_by_search(cls, query_string, batch_size=None, limit=None):
+    """
+    ' Yields a hybrid for every document matching the query, or for
+    ' the first limit of them. Results are read in pages of
+    ' batch_size ids following the search cursor, and each page's
+    ' entities are fetched with get_multi_async while the search
+    ' for the next page is in flight. Documents whose entity no
+    ' longer exists are skipped.
+    """
+    for documents in cls._search_pages(query_string, batch_size, limit):
+      keys = [cls._document_id_to_key(document.doc_id) for document in documents]
+      for future in ndb.get_multi_async(keys):
+        entity = future.get_result()
+        if entity:
+          yield cls(entity=entity)
+  
+  @classmethod
+  def iter_documents_by_search(cls, query_string, returned_fields, batch_size=None, limit=None):
+    """ yields the matching documents holding only returned_fields, without reading the datastore """
+    for documents in cls._search_pages(query_string, batch_size, limit, returned_fields=returned_fields):
+      for document in documents:
+        yield document
+  
+  @classmethod
+  def _search_pages(cls, query_string, batch_size=None, limit=None, returned_fields=None):
+    """ yields each page of documents once the search for the next page is issued """
+    batch_size = batch_size or cls.search_batch_size
+    remaining = limit
+    rpc = cls._search_page_async(query_string, batch_size, remaining, search.Cursor(), returned_fields)
+    while rpc != None:
+      results = rpc.get_result()
+      rpc = None
+      if remaining != None:
+        remaining -= len(results.results)
+      if results.cursor and (remaining == None or remaining > 0):
+        rpc = cls._search_page_async(query_string, batch_size, remaining, results.cursor, returned_fields)
+      yield results.results
+  
+  @classmethod
+  def _search_page_async(cls, query_string, batch_size, remaining, cursor, returned_fields=None):
+    limit = batch_size if remaining == None else min(batch_size, remaining)
+    options = cls._search_options(limit, cursor, returned_fields)
+    return cls.index.search_async(search.Query(query_string, options=options))
+  
+  @staticmethod
+  def _search_options(limit, cursor, returned_fields=None, **options):
+    if returned_fields:
+      return search.QueryOptions(limit=limit, cursor=cursor, returned_fields=list(returned_fields), **options)
+    return search.QueryOptions(limit=limit, cursor=cursor, ids_only=True, **options)
   
   @classmethod
   def query_by_datastore(cls, query_component=None):
     query = cls.model.query(query_component) if query_component else cls.model.query()
     return [ cls(entity=datastore_entity) for datastore_entity in query ]
   
+  @classmethod
+  def iter_by_datastore(cls, query_component=None, batch_size=None, limit=None):
+    query = cls.model.query(query_component) if query_component else cls.model.query()
+    for datastore_entity in query.iter(batch_size=batch_size, limit=limit):
+      yield cls(entity=datastore_entity)
+  
+  @classmethod
+  def fetch_page_by_search(cls, query_string, limit=20, offset=0, cursor=None, keys_only=False, produce_cursor=True, returned_fields=None):
+    """
+    ' Returns (hybrids or document ids, cursor, more) for one page,
+    ' or the documents themselves when returned_fields are given.
+    ' The Search API cannot combine an offset with a cursor, so a
+    ' page at an offset from the start has no cursor and more is
+    ' read from number_found. An offset after a cursor, or past
+    ' the API's maximum, is skipped with ids only reads instead.
+    """
+    returned_fields = None if keys_only else returned_fields
+    if cursor or offset > search.MAXIMUM_SEARCH_OFFSET:
+      cursor = search.Cursor(web_safe_string=cursor) if cursor else search.Cursor()
+      cursor = cls._skip_search_results(query_string, offset, cursor)
+      if cursor == None:
+        return [], None, False
+      options = cls._search_options(limit, cursor, returned_fields)
+    elif offset:
+      accuracy = min(offset + limit + 1, search.MAXIMUM_NUMBER_FOUND_ACCURACY)
+      options = cls._search_options(limit, None, returned_fields, offset=offset, number_found_accuracy=accuracy)
+    else:
+      options = cls._search_options(limit, search.Cursor() if produce_cursor else None, returned_fields)
+    
+    results = cls.index.search(search.Query(query_string, options=options))
+    documents = results.results
+    next_cursor = results.cursor.web_safe_string if results.cursor else None
+    if options.offset:
+      more = results.number_found > options.offset + len(documents)
+    else:
+      more = next_cursor != None
+    if keys_only:
+      return [document.doc_id for document in documents], next_cursor, more
+    if returned_fields:
+      return documents, next_cursor, more
+    return cls.get_multi([document.doc_id for document in documents]), next_cursor, more
+  
+  @classmethod
+  def _skip_search_results(cls, query_string, offset, cursor):
+    """ the cursor offset results after cursor, or None when none remain """
+    while offset > 0 and cursor != None:
+      limit = min(offset, search.MAXIMUM_DOCUMENTS_RETURNED_PER_SEARCH)
+      options = cls._search_options(limit, cursor)
+      results = cls.index.search(search.Query(query_string, options=options))
+      offset -= len(results.results)
+      cursor = results.cursor
+    return cursor
+  
+  @classmethod
+  def fetch_page_by_datastore(cls, query_component=None, limit=None, offset=0, cursor=None, keys_only=False, produce_cursor=True):
+    """
+    ' Returns (hybrids or document ids, cursor, more) for one page,
+    ' or every result when limit is None. Without produce_cursor
+    ' exactly limit rows are read, as detecting whether more
+    ' remain costs one extra row.
+    """
+    query = cls.model.query(query_component) if query_component else cls.model.query()
+    start_cursor = ndb.Cursor(urlsafe=cursor) if cursor else None
+    if limit == None or not produce_cursor:
+      results = query.fetch(limit, offset=offset, start_cursor=start_cursor, keys_only=keys_only)
+      next_cursor, more = None, False
+    else:
+      results, next_cursor, more = query.fetch_page(limit, offset=offset, start_cursor=start_cursor, keys_only=keys_only)
+    next_cursor = next_cursor.urlsafe() if next_cursor and more else None
+    if keys_only:
+      return [cls._key_to_document_id(key) for key in results], next_cursor, more
+    return [ cls(entity=datastore_entity) for datastore_entity in results ], next_cursor, more
+  
+  @classmethod
+  def count_by_search(cls, query_string, limit=None):
+    accuracy = min(limit or search.MAXIMUM_NUMBER_FOUND_ACCURACY, search.MAXIMUM_NUMBER_FOUND_ACCURACY)
+    options = search.QueryOptions(limit=1, number_found_accuracy=accuracy, ids_only=True)
+    results = cls.index.search(search.Query(query_string, options=options))
+    return min(results.number_found, limit) if limit else results.number_found
+  
+  @classmethod
+  def count_by_datastore(cls, query_component=None, limit=None):
+    query = cls.model.query(query_component) if query_component else cls.model.query()
+    return query.count(limit)
+  
   @classmethod
   def _key_to_document_id(cls, key):
     return str(key.id())
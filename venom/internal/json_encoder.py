@@ -0,0 +1,162 @@
+# system imports
+import collections
+import datetime
+import json
+import time
+
+
+__all__  = ['JSONEncoder', 'CompactJSONEncoder', 'compact_encoder']
+__all__ += ['encode_string', 'encode_integer', 'encode_number', 'encode_datetime', 'is_sequence']
+
+
+# the C accelerated string encoder from the json speedups when built
+encode_string = json.encoder.encode_basestring_ascii
+
+INFINITY = float('inf')
+
+
+def is_sequence(value):
+  """ lists, tuples and lazy sequences such as QueryResults, but not strings """
+  if isinstance(value, (list, tuple)):
+    return True
+  return isinstance(value, collections.Sequence) and not isinstance(value, basestring)
+
+
+def encode_float(value):
+  if value != value:
+    return 'NaN'
+  if value == INFINITY:
+    return 'Infinity'
+  if value == -INFINITY:
+    return '-Infinity'
+  return repr(value)
+
+
+def encode_integer(value):
+  if value is True:
+    return 'true'
+  if value is False:
+    return 'false'
+  return str(value)
+
+
+def encode_number(value):
+  if isinstance(value, float):
+    return encode_float(value)
+  return encode_integer(value)
+
+
+def encode_datetime(value):
+  return encode_float(time.mktime(value.timetuple()))
+
+
+def _encode_none(value):
+  return 'null'
+
+
+class JSONEncoder(json.JSONEncoder):
+  """
+  ' Encodes datetimes as timestamps and any object implementing
+  ' __json__ through its result. Used for pretty printed output.
+  """
+  
+  def default(self, obj):
+    if isinstance(obj, datetime.datetime):
+      return time.mktime(obj.timetuple())
+    if hasattr(obj, '__json__'):
+      return obj.__json__()
+    return super(JSONEncoder, self).default(obj)
+
+
+class CompactJSONEncoder(object):
+  """
+  ' Compact JSON encoder dispatching on the exact type of each
+  ' value. Model classes carry a _json_encoder compiled from
+  ' their schema which writes entities straight to JSON without
+  ' building an intermediate dict. Any type not handled here
+  ' falls back to the C accelerated json encoder.
+  """
+  
+  def __init__(self):
+    super(CompactJSONEncoder, self).__init__()
+    self._fallback = JSONEncoder(separators=(',', ':'))
+    self._encoders = {
+      str: encode_string,
+      unicode: encode_string,
+      bool: encode_integer,
+      int: encode_integer,
+      long: encode_integer,
+      float: encode_float,
+      type(None): _encode_none,
+      list: self._encode_list,
+      tuple: self._encode_list,
+      dict: self._encode_dict,
+      datetime.datetime: encode_datetime
+    }
+  
+  def encode(self, value):
+    encoder = self._encoders.get(type(value))
+    if encoder == None:
+      encoder = self._encoders[type(value)] = self._resolve(type(value))
+    return encoder(value)
+  
+  def iterencode(self, value):
+    """
+    ' Splits the outer containers into pieces so large results
+    ' can be written incrementally. Every item is still encoded
+    ' in one call to encode.
+    """
+    if is_sequence(value):
+      yield '['
+      for i, item in enumerate(value):
+        if i: yield ','
+        yield self.encode(item)
+      yield ']'
+    elif isinstance(value, dict):
+      yield '{'
+      for i, (key, item) in enumerate(value.iteritems()):
+        if i: yield ','
+        yield self._encode_key(key)
+        yield ':'
+        for piece in self.iterencode(item):
+          yield piece
+      yield '}'
+    else:
+      yield self.encode(value)
+  
+  def _resolve(self, cls):
+    if hasattr(cls, '_json_encoder'):
+      encode = self.encode
+      return lambda entity: entity._json_encoder(entity, encode)
+    for base, encoder in [
+      (basestring, encode_string),
+      ((int, long), encode_integer),
+      (float, encode_float),
+      (dict, self._encode_dict),
+      ((list, tuple), self._encode_list),
+      (datetime.datetime, encode_datetime)
+    ]:
+      if issubclass(cls, base):
+        return encoder
+    if hasattr(cls, '__json__'):
+      return lambda obj: self.encode(obj.__json__())
+    return self._fallback.encode
+  
+  def _encode_list(self, value):
+    return '[' + ','.join(map(self.encode, value)) + ']'
+  
+  def _encode_dict(self, value):
+    return '{' + ','.join([
+      self._encode_key(key) + ':' + self.encode(item)
+      for key, item in value.iteritems()
+    ]) + '}'
+  
+  def _encode_key(self, key):
+    if isinstance(key, basestring):
+      return encode_string(key)
+    if key == None or isinstance(key, (int, long, float)):
+      return '"{}"'.format(self.encode(key))
+    raise TypeError('key {!r} is not a string'.format(key))
+
+
+compact_encoder = CompactJSONEncoder()
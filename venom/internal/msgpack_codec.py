@@ -0,0 +1,202 @@
+# system imports
+import datetime
+import struct
+import time
+
+# vendor imports
+try:
+  import msgpack
+except ImportError:
+  msgpack = None
+
+
+__all__ = ['packb', 'unpackb', 'Packer', 'Unpacker', 'MsgPackDecodeError']
+
+
+class MsgPackDecodeError(Exception):
+  pass
+
+
+def default(obj):
+  """ mirrors the JSON encoding of datetimes and __json__ objects """
+  if isinstance(obj, datetime.datetime):
+    return time.mktime(obj.timetuple())
+  if hasattr(obj, '__json__'):
+    return obj.__json__()
+  raise TypeError('{!r} is not MessagePack serializable'.format(obj))
+
+
+def _supported_options(module):
+  """
+  ' The keyword options the installed msgpack accepts. raw was
+  ' added in 0.5.2 and replaces encoding, which later releases
+  ' drop; use_bin_type was added in 0.4.0.
+  """
+  pack_options = { 'use_bin_type': False }
+  try:
+    module.packb(None, **pack_options)
+  except TypeError:
+    pack_options = {}
+  unpack_options = { 'raw': False }
+  try:
+    module.unpackb('\xc0', **unpack_options)
+  except TypeError:
+    unpack_options = { 'encoding': 'utf-8' }
+  return pack_options, unpack_options
+
+
+if msgpack:
+  _pack_options, _unpack_options = _supported_options(msgpack)
+
+
+def packb(value):
+  if msgpack:
+    return msgpack.packb(value, default=default, **_pack_options)
+  return Packer().pack(value)
+
+
+def unpackb(data):
+  if msgpack:
+    return msgpack.unpackb(data, **_unpack_options)
+  return Unpacker(data).unpack()
+
+
+class Packer(object):
+  """
+  ' Pure Python MessagePack packer used when the msgpack package
+  ' is not installed. Both str and unicode are packed as the raw
+  ' (str) family, matching msgpack.packb(use_bin_type=False).
+  """
+  
+  def pack(self, value):
+    buffered = []
+    self._pack(value, buffered)
+    return ''.join(buffered)
+  
+  def _pack(self, value, buffered):
+    if value is None:
+      buffered.append('\xc0')
+    elif value is True:
+      buffered.append('\xc3')
+    elif value is False:
+      buffered.append('\xc2')
+    elif isinstance(value, (int, long)):
+      buffered.append(self._pack_integer(value))
+    elif isinstance(value, float):
+      buffered.append(struct.pack('>Bd', 0xcb, value))
+    elif isinstance(value, basestring):
+      if isinstance(value, unicode):
+        value = value.encode('utf-8')
+      buffered.append(self._pack_header(len(value), 0xa0, 32, 0xda, 0xdb))
+      buffered.append(value)
+    elif isinstance(value, (list, tuple)):
+      buffered.append(self._pack_header(len(value), 0x90, 16, 0xdc, 0xdd))
+      for item in value:
+        self._pack(item, buffered)
+    elif isinstance(value, dict):
+      buffered.append(self._pack_header(len(value), 0x80, 16, 0xde, 0xdf))
+      for key, item in value.iteritems():
+        self._pack(key, buffered)
+        self._pack(item, buffered)
+    else:
+      self._pack(default(value), buffered)
+  
+  def _pack_integer(self, value):
+    if 0 <= value < 0x80:
+      return chr(value)
+    if -0x20 <= value < 0:
+      return struct.pack('>b', value)
+    if value > 0:
+      for code, fmt, limit in [(0xcc, '>BB', 1 << 8), (0xcd, '>BH', 1 << 16), (0xce, '>BI', 1 << 32), (0xcf, '>BQ', 1 << 64)]:
+        if value < limit:
+          return struct.pack(fmt, code, value)
+    else:
+      for code, fmt, limit in [(0xd0, '>Bb', 1 << 7), (0xd1, '>Bh', 1 << 15), (0xd2, '>Bi', 1 << 31), (0xd3, '>Bq', 1 << 63)]:
+        if value >= -limit:
+          return struct.pack(fmt, code, value)
+    raise OverflowError('Integer {} is out of MessagePack range'.format(value))
+  
+  def _pack_header(self, length, fix, fix_limit, code16, code32):
+    if length < fix_limit:
+      return chr(fix | length)
+    if length < 1 << 16:
+      return struct.pack('>BH', code16, length)
+    return struct.pack('>BI', code32, length)
+
+
+class Unpacker(object):
+  """
+  ' Pure Python MessagePack unpacker used when the msgpack package
+  ' is not installed. Raw strings are decoded as utf-8 to unicode,
+  ' as JSON strings are, and bin values are returned as str.
+  """
+  
+  _structs = {
+    0xca: '>f', 0xcb: '>d',
+    0xcc: '>B', 0xcd: '>H', 0xce: '>I', 0xcf: '>Q',
+    0xd0: '>b', 0xd1: '>h', 0xd2: '>i', 0xd3: '>q'
+  }
+  
+  def __init__(self, data):
+    super(Unpacker, self).__init__()
+    self.data = data
+    self.offset = 0
+  
+  def unpack(self):
+    value = self._unpack()
+    if self.offset != len(self.data):
+      raise MsgPackDecodeError('Extra data after MessagePack value')
+    return value
+  
+  def _read(self, length):
+    if self.offset + length > len(self.data):
+      raise MsgPackDecodeError('Unexpected end of MessagePack data')
+    chunk = self.data[self.offset: self.offset + length]
+    self.offset += length
+    return chunk
+  
+  def _read_struct(self, fmt):
+    return struct.unpack(fmt, self._read(struct.calcsize(fmt)))[0]
+  
+  def _unpack(self):
+    code = ord(self._read(1))
+    if code < 0x80:
+      return code
+    if code >= 0xe0:
+      return code - 0x100
+    if code & 0xe0 == 0xa0:
+      return self._read(code & 0x1f).decode('utf-8')
+    if code & 0xf0 == 0x90:
+      return self._unpack_array(code & 0x0f)
+    if code & 0xf0 == 0x80:
+      return self._unpack_map(code & 0x0f)
+    if code == 0xc0:
+      return None
+    if code == 0xc2:
+      return False
+    if code == 0xc3:
+      return True
+    if code in self._structs:
+      return self._read_struct(self._structs[code])
+    if code in (0xd9, 0xda, 0xdb):
+      return self._read(self._read_length(code - 0xd9)).decode('utf-8')
+    if code in (0xc4, 0xc5, 0xc6):
+      return self._read(self._read_length(code - 0xc4))
+    if code in (0xdc, 0xdd):
+      return self._unpack_array(self._read_length(code - 0xdc + 1))
+    if code in (0xde, 0xdf):
+      return self._unpack_map(self._read_length(code - 0xde + 1))
+    raise MsgPackDecodeError('Unsupported MessagePack type 0x{:02x}'.format(code))
+  
+  def _read_length(self, size):
+    return self._read_struct(['>B', '>H', '>I'][size])
+  
+  def _unpack_array(self, length):
+    return [self._unpack() for _ in xrange(length)]
+  
+  def _unpack_map(self, length):
+    value = {}
+    for _ in xrange(length):
+      key = self._unpack()
+      value[key] = self._unpack()
+    return value
@@ -9,6 +9,7 @@ from google.appengine.api import search
 # package imports
 from attribute import ModelAttribute
 from query import PropertyComparison, Query, QueryParameter
+from ..internal import json_encoder
 from ..routing import Parameters
 
 
@@ -106,13 +107,25 @@ class Property(ModelAttribute):
   def to_route_parameter(self):
     raise NotImplementedError()
   
+  def to_json_encoder(self):
+    """
+    ' Returns a function writing a non None value of this
+    ' property as JSON, or None to use the generic encoder.
+    """
+    return None
+  
   def __get__(self, instance, cls):
     if instance == None:
       # called on a class
       return self
+    if instance._partial != None and not self._name in instance._partial:
+      instance._load_partial()
     return self._get_value(instance)
 
   def __set__(self, instance, value):
+    if instance._partial != None:
+      instance._load_partial()
+    instance._dirty.add(self._name)
     return self._set_value(instance, value)
   
   def _set_value(self, entity, value):
@@ -233,6 +246,9 @@ class Integer(ChoicesProperty):
   def to_datastore_property(self):
     return ndb.IntegerProperty
   
+  def to_json_encoder(self):
+    return json_encoder.encode_integer
+  
   def to_route_parameter(self):
     return Parameters.Integer(
       required = self.required,
@@ -258,6 +274,9 @@ class Float(Integer):
   def to_datastore_property(self):
     return ndb.FloatProperty
   
+  def to_json_encoder(self):
+    return json_encoder.encode_number
+  
   def to_route_parameter(self):
     return Parameters.Float(
       required = self.required,
@@ -328,6 +347,9 @@ class String(ChoicesProperty):
   def to_datastore_property(self):
     return ndb.StringProperty
   
+  def to_json_encoder(self):
+    return json_encoder.encode_string
+  
   def to_route_parameter(self):
     return Parameters.String(
       required = self.required,
@@ -432,6 +454,9 @@ class DateTime(Float):
     if value == None: return None
     return datetime.datetime.fromtimestamp(value)
   
+  def to_json_encoder(self):
+    return json_encoder.encode_datetime
+  
   def _validate_before_save(self, entity, value):
     super(DateTime, self)._validate_before_save(entity, value)
     
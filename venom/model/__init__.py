@@ -13,3 +13,9 @@ __all__ += query.__all__
 
 from attribute import *
 __all__ += attribute.__all__
+
+from identity import *
+__all__ += identity.__all__
+
+from cache import *
+__all__ += cache.__all__
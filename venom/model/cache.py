@@ -0,0 +1,192 @@
+# system imports
+import collections
+import hashlib
+import threading
+import time
+
+# app engine imports
+from google.appengine.api import memcache
+
+# package imports
+from identity import IdentityMap
+
+
+__all__ = ['CachePolicy', 'QueryResultCache']
+
+
+class CachePolicy(object):
+  """
+  ' Opt-in process local cache for a Model's reads, set as the
+  ' Model's cache_policy. Stored entities are kept in a bounded
+  ' LRU for at most ttl seconds, in front of memcache and the
+  ' datastore. Saves and deletes through this instance invalidate
+  ' their keys; other instances may serve a stale entity until
+  ' it expires, so use it for kinds that are written rarely.
+  '
+  ' EXAMPLE
+  '
+  ' class Session(venom.Model):
+  '   cache_policy = venom.CachePolicy(size=5000, ttl=30)
+  """
+  
+  def __init__(self, size=1000, ttl=60, clock=time.time):
+    super(CachePolicy, self).__init__()
+    if size < 1:
+      raise ValueError('CachePolicy size must be at least 1')
+    self.size = size
+    self.ttl = ttl
+    self.clock = clock
+    self.hits = 0
+    self.misses = 0
+    self.evictions = 0
+    self._entries = collections.OrderedDict()
+    self._lock = threading.Lock()
+  
+  @staticmethod
+  def _identity(model, document_id):
+    return model.kind, unicode(document_id)
+  
+  def get(self, model, document_id):
+    """ the cached datastore entity for this id, or None """
+    identity = self._identity(model, document_id)
+    with self._lock:
+      entry = self._entries.pop(identity, None)
+      if entry == None or entry[0] <= self.clock():
+        self.misses += 1
+        return None
+      self._entries[identity] = entry
+      self.hits += 1
+      return entry[1]
+  
+  def put(self, model, document_id, entity):
+    identity = self._identity(model, document_id)
+    with self._lock:
+      self._entries.pop(identity, None)
+      self._entries[identity] = (self.clock() + self.ttl, entity)
+      while len(self._entries) > self.size:
+        self._entries.popitem(last=False)
+        self.evictions += 1
+  
+  def invalidate(self, model, document_id):
+    with self._lock:
+      self._entries.pop(self._identity(model, document_id), None)
+  
+  def clear(self):
+    with self._lock:
+      self._entries.clear()
+  
+  def stats(self):
+    return {
+      'size': len(self._entries),
+      'hits': self.hits,
+      'misses': self.misses,
+      'evictions': self.evictions
+    }
+  
+  def __repr__(self):
+    return 'CachePolicy(size={}, ttl={})'.format(self.size, self.ttl)
+
+
+class QueryResultCache(object):
+  """
+  ' Memcache backed cache of the document ids a Query returned,
+  ' keyed by the executed datastore filter or search string. Keys
+  ' are namespaced by a per-kind generation counter which every
+  ' save and delete of the kind bumps, so results cached before a
+  ' write are not served after it. Within a request that wrote the
+  ' kind the cache is bypassed, so the request reads its own
+  ' writes rather than results cached before the index caught up.
+  ' Search indexes and the non-ancestor datastore queries venom
+  ' runs are eventually consistent, so results read within
+  ' settle_time seconds of the kind's last write are returned
+  ' but not cached, as they may predate it.
+  """
+  
+  prefix = 'venom:query'
+  settle_time = 10
+  
+  def __init__(self, model):
+    super(QueryResultCache, self).__init__()
+    self.model = model
+  
+  def _generation_key(self):
+    return '{}:generation:{}'.format(self.prefix, self.model.kind)
+  
+  def _written_key(self):
+    return '{}:written:{}'.format(self.prefix, self.model.kind)
+  
+  def generation(self):
+    return self._state()[0]
+  
+  def _state(self):
+    """ the kind's generation and the time of its last write, or None """
+    key = self._generation_key()
+    values = memcache.get_multi([key, self._written_key()])
+    generation = values.get(key)
+    if generation == None:
+      # start from the clock so a generation lost to eviction
+      # does not count up again through values already cached
+      memcache.add(key, int(time.time() * 1000))
+      generation = memcache.get(key)
+    return generation, values.get(self._written_key())
+  
+  def invalidate(self):
+    memcache.incr(self._generation_key(), initial_value=int(time.time() * 1000))
+    memcache.set(self._written_key(), time.time())
+  
+  def _result_key(self, backend, query, generation):
+    digest = hashlib.md5('{}:{!r}'.format(backend, query)).hexdigest()
+    return '{}:{}:{}:{}'.format(self.prefix, self.model.kind, generation, digest)
+  
+  def _settled(self, written):
+    """ whether results read now include every write so far """
+    if written == None:
+      return True
+    return time.time() - written >= self.settle_time
+  
+  def bypassed(self):
+    identity_map = IdentityMap.current()
+    return identity_map != None and self.model.kind in identity_map.kinds_written
+  
+  def fetch(self, backend, query, execute, ttl):
+    """
+    ' Returns the entities matching the query, hydrated from the
+    ' cached ids with one get_multi, or runs execute(query) and
+    ' caches the ids of its results for ttl seconds.
+    """
+    if self.bypassed():
+      return execute(query)
+    generation, written = self._state()
+    key = self._result_key(backend, query, generation)
+    document_ids = memcache.get(key)
+    if document_ids != None:
+      entities = self.model.get_multi(document_ids)
+      return [entity for entity in entities if entity != None]
+    entities = execute(query)
+    if self._settled(written):
+      memcache.set(key, [entity.key for entity in entities], time=ttl)
+    return entities
+  
+  def fetch_page(self, backend, query, options, fetch_page, ttl):
+    """
+    ' Like fetch, for one page of results. options identify the
+    ' page and end with keys_only; fetch_page() returns a
+    ' (results, cursor, more) tuple, which is cached as ids.
+    """
+    keys_only = options[-1]
+    if self.bypassed():
+      return fetch_page()
+    generation, written = self._state()
+    key = self._result_key(backend, (query, options), generation)
+    cached = memcache.get(key)
+    if cached != None:
+      document_ids, cursor, more = cached
+      if keys_only:
+        return document_ids, cursor, more
+      entities = self.model.get_multi(document_ids)
+      return [entity for entity in entities if entity != None], cursor, more
+    results, cursor, more = fetch_page()
+    if self._settled(written):
+      document_ids = results if keys_only else [entity.key for entity in results]
+      memcache.set(key, (document_ids, cursor, more), time=ttl)
+    return results, cursor, more
@@ -0,0 +1,87 @@
+# system imports
+import threading
+
+# app engine imports
+from google.appengine.ext import ndb
+
+
+__all__ = ['IdentityMap']
+
+
+_local = threading.local()
+
+
+class IdentityMap(object):
+  """
+  ' Request scoped map from (kind, document id) to the Model
+  ' instance already loaded for it. While a map is active,
+  ' Model.get and Model.get_multi serve known keys from it, so
+  ' every lookup of an entity in one request returns the same
+  ' instance and costs a single datastore get. Maps nest: the
+  ' innermost active map is the current one.
+  """
+  
+  def __init__(self):
+    super(IdentityMap, self).__init__()
+    self.entities = {}
+    self.hits = 0
+    self.misses = 0
+    self.kinds_written = set()
+    self._previous = None
+  
+  @staticmethod
+  def current():
+    return getattr(_local, 'identity_map', None)
+  
+  def __enter__(self):
+    self._previous = IdentityMap.current()
+    _local.identity_map = self
+    return self
+  
+  def __exit__(self, exception_type, exception_value, traceback):
+    _local.identity_map = self._previous
+    self._previous = None
+    return False
+  
+  @staticmethod
+  def _identity(model, document_id):
+    if isinstance(document_id, ndb.Key):
+      document_id = model.hybrid_model._key_to_document_id(document_id)
+    return model.kind, unicode(document_id)
+  
+  def get(self, model, document_id):
+    """ the loaded instance for this id, or None when it has not been loaded """
+    entity = self.entities.get(self._identity(model, document_id))
+    if entity == None:
+      self.misses += 1
+    else:
+      self.hits += 1
+    return entity
+  
+  def add(self, entity):
+    """ registers a saved entity """
+    self.kinds_written.add(entity.kind)
+    if entity.key != None:
+      self.entities[self._identity(type(entity), entity.key)] = entity
+  
+  def setdefault(self, entity):
+    """ registers a fetched entity unless an instance is already held for its key """
+    if entity == None or entity.key == None:
+      return entity
+    return self.entities.setdefault(self._identity(type(entity), entity.key), entity)
+  
+  def discard(self, entity):
+    """ drops a deleted entity """
+    self.kinds_written.add(entity.kind)
+    if entity.key != None:
+      self.entities.pop(self._identity(type(entity), entity.key), None)
+  
+  def stats(self):
+    return {
+      'entities': len(self.entities),
+      'hits': self.hits,
+      'misses': self.misses
+    }
+  
+  def __repr__(self):
+    return 'IdentityMap(entities={entities}, hits={hits}, misses={misses})'.format(**self.stats())
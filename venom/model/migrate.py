@@ -87,7 +87,7 @@ class Migration(object):
         entities = model.all()
         for i in range(0, len(entities), batch_size):
           group = entities[i: i + batch_size]
-          model.save_multi(group)
+          model.save_multi(group, force=True)
         kinds_updated += 1
     self._finish()
     return kinds_updated
@@ -1,18 +1,26 @@
 # system imports
+import datetime
+import hashlib
 import inspect
 import os
 
+# app engine imports
+from google.appengine.ext import ndb
+
 # package imports
 from ..internal.hybrid_model import HybridModel
 from ..internal.index_yaml import update_index_yaml
 from ..internal.search_yaml import update_search_yaml
+from ..internal.json_encoder import encode_string, compact_encoder
 from attribute import ModelAttribute
+from cache import CachePolicy, QueryResultCache
+from identity import IdentityMap
 from Properties import Property
 from Properties import Model as ModelProperty
 from query import Query, QueryParameter
 
 
-__all__ = ['Model', 'MetaModel', 'PropertySchema', 'ModelSchema']
+__all__ = ['Model', 'MetaModel', 'PropertySchema', 'ModelSchema', 'ModelJSONEncoder']
 
 
 def run_migration_if_dev():
@@ -107,6 +115,54 @@ class ModelSchema(dict):
     return doc[:-1]
 
 
+class ModelJSONEncoder(object):
+  """
+  ' Generated once per Model class from its schema. Hidden
+  ' properties are dropped up front and each property writes
+  ' its value with the encoder selected for its type, so
+  ' entities are serialized without an intermediate dict.
+  """
+  
+  def __init__(self, model):
+    super(ModelJSONEncoder, self).__init__()
+    self.properties = [
+      (name, schema.property)
+      for name, schema in sorted(model._schema.items())
+      if not schema.property.hidden
+    ]
+    self._encode_entity = self._generate(self.properties)
+  
+  @staticmethod
+  def _generate(properties):
+    namespace = {}
+    lines = ['def encode_entity(entity, encode):', '  values = entity._values']
+    parts = []
+    for i, (name, prop) in enumerate(properties):
+      if type(prop)._get_value.im_func is Property._get_value.im_func:
+        lines.append('  value_{0} = values.get({1!r})'.format(i, name))
+      else:
+        namespace['get_value_{}'.format(i)] = prop._get_value
+        lines.append('  value_{0} = get_value_{0}(entity)'.format(i))
+      namespace['encode_{}'.format(i)] = prop.to_json_encoder() or encode_value
+      parts.append("{!r} + ('null' if value_{i} is None else encode_{i}(value_{i}{encode}))".format(
+        encode_string(name) + ':', i=i, encode='' if prop.to_json_encoder() else ', encode'
+      ))
+    parts.append("{!r} + encode(entity.key)".format(encode_string('key') + ':'))
+    lines.append("  return '{' + " + " + ',' + ".join(parts) + " + '}'")
+    exec '\n'.join(lines) in namespace
+    return namespace['encode_entity']
+  
+  def __call__(self, entity, encode):
+    if entity._partial != None:
+      # partial entities write only the fields they were given
+      return encode(entity.__json__())
+    return self._encode_entity(entity, encode)
+
+
+def encode_value(value, encode):
+  return encode(value)
+
+
 def generate_ownership_descriptor(child, query):
   class OwnershipDescriptor(object):
     def __get__(self, instance, cls):
@@ -129,6 +185,20 @@ class Model(object):
   auto_migrate_in_dev = True
   kinds = {}
   
+  # datastore property holding the version stamp kept on save
+  updated_property = '_updated'
+  
+  # optional CachePolicy serving reads from process memory
+  cache_policy = None
+  
+  # names of the properties held by an entity hydrated from
+  # search returned_fields, or None once it is fully loaded
+  _partial = None
+  
+  # stored values of the properties as last loaded or saved,
+  # or None for an entity which has not been stored yet
+  _stored = None
+  
   # attributes updates by metaclass
   kind = None
   hybrid_model = None
@@ -144,6 +214,9 @@ class Model(object):
     cls._properties = ModelAttribute.connect(cls, kind=Property)
     cls._queries = ModelAttribute.connect(cls, kind=Query)
     cls._schema = ModelSchema(cls, cls._properties, cls._queries)
+    cls._json_encoder = ModelJSONEncoder(cls)
+    for query in cls._queries.values():
+      query.compile()
   
   @classmethod
   def _link_owners(cls):
@@ -186,6 +259,8 @@ class Model(object):
     super(Model, self).__init__()
     self.hybrid_entity = self.hybrid_model()
     self.key = None
+    self._updated = None
+    self._dirty = set()
     self._connect_properties()
     self._connect_queries()
     self.populate(**kwargs)
@@ -210,9 +285,47 @@ class Model(object):
     return cls._execute_query(cls.hybrid_model.query_by_datastore(query))
   
   @classmethod
-  def _execute_search_query(cls, query):
+  def _execute_search_query(cls, query, returned_fields=None):
+    if returned_fields:
+      return list(cls._stream_query('search', query, returned_fields=returned_fields))
     return cls._execute_query(cls.hybrid_model.query_by_search(query))
   
+  @classmethod
+  def _fetch_query_page(cls, backend, query, limit, offset=0, cursor=None, keys_only=False, produce_cursor=True, returned_fields=None):
+    """ returns (entities or document ids, cursor, more) for one page of a compiled query """
+    if backend == 'datastore':
+      results, cursor, more = cls.hybrid_model.fetch_page_by_datastore(
+        query, limit, offset=offset, cursor=cursor,
+        keys_only=keys_only, produce_cursor=produce_cursor
+      )
+    else:
+      results, cursor, more = cls.hybrid_model.fetch_page_by_search(
+        query, limit, offset=offset, cursor=cursor,
+        keys_only=keys_only, produce_cursor=produce_cursor, returned_fields=returned_fields
+      )
+    if keys_only:
+      return results, cursor, more
+    if returned_fields:
+      return [cls._document_to_model(document, returned_fields) for document in results], cursor, more
+    return [entity for entity in cls._execute_query(results) if entity != None], cursor, more
+  
+  @classmethod
+  def _stream_query(cls, backend, query, batch_size=None, limit=None, returned_fields=None):
+    if backend == 'datastore':
+      hybrid_entities = cls.hybrid_model.iter_by_datastore(query, batch_size=batch_size, limit=limit)
+    elif returned_fields:
+      documents = cls.hybrid_model.iter_documents_by_search(query, returned_fields, batch_size=batch_size, limit=limit)
+      return (cls._document_to_model(document, returned_fields) for document in documents)
+    else:
+      hybrid_entities = cls.hybrid_model.iter_by_search(query, batch_size=batch_size, limit=limit)
+    return (cls._entity_to_model(hybrid_entity) for hybrid_entity in hybrid_entities)
+  
+  @classmethod
+  def _count_query(cls, backend, query, limit=None):
+    if backend == 'datastore':
+      return cls.hybrid_model.count_by_datastore(query, limit=limit)
+    return cls.hybrid_model.count_by_search(query, limit=limit)
+  
   @classmethod
   def _execute_query(cls, results):
     entities = map(cls._entity_to_model, results)
@@ -222,14 +335,51 @@ class Model(object):
   def _entity_to_model(cls, hybrid_entity):
     if not hybrid_entity:
       return None
+    entity = cls()
+    entity._set_hybrid_entity(hybrid_entity)
+    return entity
+  
+  def _set_hybrid_entity(self, hybrid_entity):
     ndb_entity = hybrid_entity.datastore_entity.get_entity()
     properties = {name: prop._get_value(ndb_entity) for name, prop in ndb_entity._properties.items()}
+    self._populate_from_stored(**properties)
+    self.hybrid_entity = hybrid_entity
+    self.key = hybrid_entity.document_id
+    self._updated = properties.get(self.updated_property)
+    self._snapshot()
+  
+  @classmethod
+  def _document_to_model(cls, document, returned_fields):
+    """
+    ' Hydrates a partial entity from a search document holding only
+    ' returned_fields. Reading any other property, assigning one or
+    ' saving the entity first loads it from the datastore.
+    """
+    values = dict.fromkeys(returned_fields)
+    for field in document.fields:
+      values[field.name] = field.value
     entity = cls()
-    entity._populate_from_stored(**properties)
-    entity.hybrid_entity = hybrid_entity
-    entity.key = entity.hybrid_entity.document_id
+    entity._populate_from_stored(**values)
+    entity.hybrid_entity = cls.hybrid_model(document=document)
+    entity.key = document.doc_id
+    entity._partial = frozenset(returned_fields)
     return entity
   
+  def _load_partial(self):
+    """
+    ' Replaces a partial entity's values with the stored ones. The
+    ' entity stays partial, and so cannot be saved, when it was
+    ' deleted since the search that returned it.
+    """
+    hybrid_entity = self.hybrid_model.get(self.key)
+    if hybrid_entity == None:
+      raise Exception(
+        '{} {} returned by a search no longer exists'
+        .format(self.kind, self.key)
+      )
+    self._partial = None
+    self._set_hybrid_entity(hybrid_entity)
+  
   def populate(self, **kwargs):
     for key, value in kwargs.items():
       if key in self._properties:
@@ -250,8 +400,8 @@ class Model(object):
   def __json__(self):
     json = {
       key: prop._get_value(self)
-      for key, prop in self._properties.items()
-      if not prop.hidden
+      for key, prop in self._json_encoder.properties
+      if self._partial == None or key in self._partial
     }
     json['key'] = self.key
     return json
@@ -273,34 +423,154 @@ class Model(object):
         else:
           property._indexed = True
       entity.hybrid_entity.set(key, value, property)
+    entity._updated = datetime.datetime.utcnow()
+    entity.hybrid_entity.set(cls.updated_property, entity._updated, ndb.DateTimeProperty(indexed=False))
   
-  def save(self):
+  def _snapshot(self):
+    self._stored = {
+      name: prop._get_stored_value(self)
+      for name, prop in self._properties.items()
+    }
+    self._dirty = set()
+  
+  def _changes(self, names=None):
+    """
+    ' Names of the properties assigned since the entity was last
+    ' loaded or saved whose stored value differs from then, or
+    ' None when the entity has never been stored. names widens
+    ' the check to properties set without assignment.
+    """
+    if self._stored == None:
+      return None
+    return set(
+      name for name in (self._dirty if names == None else names)
+      if self._properties[name]._get_stored_value(self) != self._stored.get(name)
+    )
+  
+  def _prepare_save(self, force=False):
+    """
+    ' Sets the hybrid entity's values for a save and returns True,
+    ' or returns False without touching it when nothing changed.
+    ' A known change writes the datastore without diffing it and
+    ' only writes the search index when an indexed property moved.
+    ' Forced saves diff both against what is stored instead.
+    """
+    if self._partial != None:
+      self._load_partial()
+    changes = None if force else self._changes()
+    if changes != None and not changes:
+      return False
     self._set_hybrid_entity_values(self)
+    if changes != None:
+      # validation may have stamped set_on_update properties
+      changes = self._changes(self._properties)
+      self.hybrid_entity.datastore_changed = True
+      self.hybrid_entity.search_changed = any(self._schema[name].search for name in changes)
+    return True
+  
+  def _etag(self):
+    """
+    ' A strong ETag derived from the entity's key and the version
+    ' stamp kept on save, so it is computed without serializing
+    ' the entity. Entities stored before the stamp existed fall
+    ' back to hashing their JSON.
+    """
+    if self._updated == None:
+      version = compact_encoder.encode(self)
+    else:
+      version = self._updated.isoformat()
+    return hashlib.md5('{}:{}:{}'.format(self.kind, self.key, version)).hexdigest()
+  
+  def save(self, force=False):
+    if not self._prepare_save(force):
+      return self
     self.hybrid_entity.put()
     self.key = self.hybrid_entity.document_id
+    self._snapshot()
+    self._invalidate_cache()
+    self._invalidate_queries()
+    identity_map = IdentityMap.current()
+    if identity_map != None:
+      identity_map.add(self)
     return self
   
   @classmethod
   def get(cls, document_id):
-    entity = cls.hybrid_model.get(document_id)
-    return cls._entity_to_model(entity)
+    return cls.get_multi([document_id])[0]
   
   @classmethod
   def get_multi(cls, document_ids):
-    hybrid_entities = cls.hybrid_model.get_multi(document_ids)
-    entities = map(cls._entity_to_model, hybrid_entities)
+    identity_map = IdentityMap.current()
+    if identity_map == None:
+      return cls._fetch_multi(document_ids)
+    
+    entities = [identity_map.get(cls, document_id) for document_id in document_ids]
+    missing = [i for i, entity in enumerate(entities) if entity == None]
+    if missing:
+      fetched = cls._fetch_multi([document_ids[i] for i in missing])
+      for i, entity in zip(missing, fetched):
+        entities[i] = identity_map.setdefault(entity)
     return entities
   
   @classmethod
-  def save_multi(cls, entities):
-    hybrid_entities = []
-    for entity in entities:
-      cls._set_hybrid_entity_values(entity)
-      hybrid_entities.append(entity.hybrid_entity)
-    cls.hybrid_model.put_multi(hybrid_entities)
+  def _fetch_multi(cls, document_ids):
+    policy = cls.cache_policy
+    if policy == None:
+      hybrid_entities = cls.hybrid_model.get_multi(document_ids)
+      return map(cls._entity_to_model, hybrid_entities)
+    
+    document_ids = [
+      cls.hybrid_model._key_to_document_id(document_id) if isinstance(document_id, ndb.Key)
+      else document_id
+      for document_id in document_ids
+    ]
+    hybrid_entities = [None] * len(document_ids)
+    missing = []
+    for i, document_id in enumerate(document_ids):
+      entity = policy.get(cls, document_id)
+      if entity == None:
+        missing.append(i)
+      else:
+        hybrid_entities[i] = cls.hybrid_model(entity=entity)
+    if missing:
+      fetched = cls.hybrid_model.get_multi([document_ids[i] for i in missing])
+      for i, hybrid_entity in zip(missing, fetched):
+        hybrid_entities[i] = hybrid_entity
+        if hybrid_entity != None:
+          policy.put(cls, document_ids[i], hybrid_entity.datastore_entity.entity)
+    return map(cls._entity_to_model, hybrid_entities)
+  
+  @classmethod
+  def _invalidate_queries(cls):
+    for query in cls._queries.values():
+      if query.cache_ttl != None:
+        QueryResultCache(cls).invalidate()
+        return
+  
+  def _invalidate_cache(self):
+    if self.cache_policy != None and self.key != None:
+      self.cache_policy.invalidate(type(self), self.key)
+  
+  @classmethod
+  def save_multi(cls, entities, force=False):
+    entities = [entity for entity in entities if entity._prepare_save(force)]
+    if not entities:
+      return
+    cls.hybrid_model.put_multi([entity.hybrid_entity for entity in entities])
+    cls._invalidate_queries()
+    identity_map = IdentityMap.current()
     for entity in entities:
       entity.key = entity.hybrid_entity.document_id
+      entity._snapshot()
+      entity._invalidate_cache()
+      if identity_map != None:
+        identity_map.add(entity)
   
   def delete(self):
+    self._invalidate_cache()
+    self._invalidate_queries()
+    identity_map = IdentityMap.current()
+    if identity_map != None:
+      identity_map.discard(self)
     return self.hybrid_entity.delete()
       
@@ -1,4 +1,5 @@
 # system imports
+import collections
 import inspect
 
 # app engine imports
@@ -6,12 +7,13 @@ from google.appengine.ext import ndb
 
 # package imports
 from attribute import ModelAttribute
+from cache import QueryResultCache
 
 
 __all__ = [
   'QueryParameter', 'QP', 'QueryComponent', 'QueryLogicalOperator',
-  'AND', 'OR', 'QueryResults', 'Query', 'PropertyComparison',
-  'QueryArgument', 'QueryArgumentList'
+  'AND', 'OR', 'QueryResults', 'QueryPage', 'Query', 'PropertyComparison',
+  'QueryArgument', 'QueryArgumentList', 'QueryPlan'
 ]
 
 
@@ -100,6 +102,14 @@ class QueryComponent(object):
   
   def to_search_query(self, args):
     raise NotImplementedError()
+  
+  def compile_datastore_query(self):
+    """ returns a function building the ndb filter from an iterator of argument values """
+    raise NotImplementedError()
+  
+  def compile_search_query(self):
+    """ returns a format string and a function per slot producing its text from an iterator of argument values """
+    raise NotImplementedError()
 
 
 class PropertyComparison(QueryComponent):
@@ -113,6 +123,16 @@ class PropertyComparison(QueryComponent):
   
   allowed_operators = frozenset((EQ, NE, LT, LE, GT, GE, IN))
   
+  datastore_operators = {
+    EQ: lambda prop, value: prop == value,
+    NE: lambda prop, value: prop != value,
+    LT: lambda prop, value: prop < value,
+    LE: lambda prop, value: prop <= value,
+    GT: lambda prop, value: prop > value,
+    GE: lambda prop, value: prop >= value,
+    IN: lambda prop, value: prop.IN(value)
+  }
+  
   def __init__(self, property, operator, value):
     if not operator in self.allowed_operators:
       raise Exception('Unknown operator "{}"'.format(operator))
@@ -173,7 +193,43 @@ class PropertyComparison(QueryComponent):
       return '(NOT {} = {})'.format(self.property._name, value)
     return '{} {} {}'.format(self.property._name, self.operator, value)
   
+  def compile_datastore_query(self):
+    prop = self.property.to_datastore_property()
+    if inspect.isclass(prop):
+      prop = prop(indexed=True, name=self.property._name)
+    else:
+      prop._name = self.property._name
+      prop._indexed = True
+    compare = self.datastore_operators[self.operator]
+    to_storage = self.property._to_storage
+    if self._is_parameter():
+      return lambda values: compare(prop, to_storage(next(values)))
+    value = self.value
+    return lambda values: compare(prop, to_storage(value))
+  
+  def compile_search_query(self):
+    to_storage = self.property._to_storage
+    def format_value(value):
+      value = to_storage(value)
+      if isinstance(value, str):
+        value = '"{}"'.format(value.replace('"', '\\"'))
+      return value
+    
+    if self.operator == self.NE:
+      template = '(NOT {} = {{}})'.format(self.property._name)
+    else:
+      template = '{} {} {{}}'.format(self.property._name, self.operator)
+    if self._is_parameter():
+      return template, [lambda values: format_value(next(values))]
+    value = self.value
+    return template, [lambda values: format_value(value)]
+  
   """ [end] QueryComponent implementation """
+  
+  def _is_parameter(self):
+    return isinstance(self.value, QueryParameter) or (
+      inspect.isclass(self.value) and issubclass(self.value, QueryParameter)
+    )
 
 
 class QueryLogicalOperator(QueryComponent):
@@ -220,6 +276,25 @@ class QueryLogicalOperator(QueryComponent):
     query_string = ' {} '.format(self.search_conjunction).join(query_strings)
     return '({})'.format(query_string)
   
+  def compile_datastore_query(self):
+    if self.datastore_conjuntion == None:
+      raise ValueError('self.datastore_conjuntion cannot be None')
+    if not self.components:
+      return lambda values: None
+    conjunction = self.datastore_conjuntion
+    builders = [component.compile_datastore_query() for component in self.components]
+    return lambda values: conjunction(*[build(values) for build in builders])
+  
+  def compile_search_query(self):
+    templates = []
+    formatters = []
+    for component in self.components:
+      template, component_formatters = component.compile_search_query()
+      templates.append(template)
+      formatters.extend(component_formatters)
+    template = '({})'.format(' {} '.format(self.search_conjunction).join(templates))
+    return template, formatters
+  
   """ [end] QueryComponent implementation """
 
 
@@ -233,20 +308,199 @@ class OR(QueryLogicalOperator):
   search_conjunction = 'OR'
 
 
-class QueryResults(list):
+class QueryPage(list):
+  """ one page of results and the web safe cursor continuing after it """
+  
+  def __init__(self, results, cursor=None, more=False):
+    super(QueryPage, self).__init__(results)
+    self.cursor = cursor
+    self.more = more
+
+
+class QueryResults(collections.Sequence):
+  """
+  ' The lazy result of calling a Query. Nothing is fetched until
+  ' it is used: get, fetch and count push their limit, offset
+  ' and keys_only down to the datastore or Search API, while
+  ' iterating, indexing or serializing loads every match once.
+  ' With returned_fields, search results hydrate partial entities
+  ' from their documents and the result cache is not used.
+  """
+  
+  def __init__(self, model, backend, query, cache_ttl=None, returned_fields=None):
+    super(QueryResults, self).__init__()
+    self.model = model
+    self.backend = backend
+    self.query = query
+    self.cache_ttl = cache_ttl
+    self.returned_fields = returned_fields
+    self._entities = None
+  
+  def _load(self):
+    if self._entities == None:
+      if self.backend == QueryPlan.DATASTORE:
+        execute = self.model._execute_datastore_query
+      else:
+        execute = self.model._execute_search_query
+      if self.returned_fields:
+        self._entities = execute(self.query, returned_fields=self.returned_fields)
+      elif self.cache_ttl == None:
+        self._entities = execute(self.query)
+      else:
+        cache = QueryResultCache(self.model)
+        self._entities = cache.fetch(self.backend, self.query, execute, self.cache_ttl)
+    return self._entities
+  
   def get(self):
-    return self[0] if len(self) > 0 else None
+    """
+    ' The first result, fetching a single row. Search hits whose
+    ' entity is missing are skipped, reading on from the cursor.
+    """
+    if self._entities != None:
+      return self._entities[0] if len(self._entities) > 0 else None
+    if self.backend == QueryPlan.DATASTORE or self.returned_fields:
+      page = self._fetch(1, produce_cursor=False)
+    else:
+      page = self._fetch(1)
+      while len(page) == 0 and page.more:
+        page = self._fetch(10, cursor=page.cursor)
+    return page[0] if len(page) > 0 else None
+  
+  def count(self, limit=None):
+    """ the number of matches, counted by the backend unless already loaded """
+    if self._entities != None:
+      return len(self._entities) if limit == None else min(len(self._entities), limit)
+    return self.model._count_query(self.backend, self.query, limit=limit)
+  
+  def fetch(self, count, offset=0, cursor=None, keys_only=False):
+    """
+    ' Returns a QueryPage of at most count entities, or document
+    ' ids with keys_only, starting after cursor and then skipping
+    ' offset results. Its cursor continues after the page, except
+    ' for a search page at an offset without a cursor, which the
+    ' Search API cannot return; continue those with a larger offset.
+    """
+    return self._fetch(count, offset=offset, cursor=cursor, keys_only=keys_only)
+  
+  def stream(self, batch_size=None, limit=None):
+    """
+    ' Yields matches as the backend returns them, reading batch_size
+    ' at a time, without keeping them. Stops after limit results, or
+    ' whenever the caller stops iterating.
+    """
+    if self._entities != None:
+      return iter(self._entities[:limit])
+    return self.model._stream_query(
+      self.backend, self.query, batch_size=batch_size,
+      limit=limit, returned_fields=self.returned_fields
+    )
+  
+  def _fetch(self, count, offset=0, cursor=None, keys_only=False, produce_cursor=True):
+    def fetch_page():
+      return self.model._fetch_query_page(
+        self.backend, self.query, count, offset=offset, cursor=cursor,
+        keys_only=keys_only, produce_cursor=produce_cursor,
+        returned_fields=self.returned_fields
+      )
+    
+    if self.cache_ttl == None or (self.returned_fields and not keys_only):
+      results, next_cursor, more = fetch_page()
+    else:
+      cache = QueryResultCache(self.model)
+      options = (count, offset, cursor, produce_cursor, keys_only)
+      results, next_cursor, more = cache.fetch_page(self.backend, self.query, options, fetch_page, self.cache_ttl)
+    return QueryPage(results, cursor=next_cursor, more=more)
+  
+  def __getitem__(self, index):
+    return self._load()[index]
+  
+  def __len__(self):
+    return len(self._load())
+  
+  def __iter__(self):
+    return iter(self._load())
+  
+  def __eq__(self, other):
+    if isinstance(other, QueryResults):
+      other = other._load()
+    return self._load() == other
+  
+  def __ne__(self, other):
+    return not self == other
+  
+  def __json__(self):
+    return self._load()
+  
+  def __repr__(self):
+    return 'QueryResults({!r}, backend={!r}, query={!r})'.format(self.model.kind, self.backend, self.query)
+
+
+class QueryPlan(object):
+  """
+  ' A Query compiled once for execution. The backend is chosen
+  ' up front and the filter is prebuilt, so running the query
+  ' only binds its argument values: into filter nodes over ndb
+  ' properties made once for datastore queries, or into the
+  ' slots of a format string for search queries.
+  """
+  
+  DATASTORE = 'datastore'
+  SEARCH = 'search'
   
-  def count(self):
-    return len(self)
+  def __init__(self, query):
+    super(QueryPlan, self).__init__()
+    self.arguments = query.to_query_arguments()
+    self.positional = all(argument.optional_key for argument in self.arguments)
+    if query.uses_datastore():
+      self.backend = self.DATASTORE
+      self._build = query.compile_datastore_query()
+    else:
+      self.backend = self.SEARCH
+      self.template, self._formatters = query.compile_search_query()
+      self._build = self._format
   
-  def fetch(self, count, offset=0):
-    return self[offset: offset + count]
+  def _format(self, values):
+    return self.template.format(*[format_value(values) for format_value in self._formatters])
+  
+  def bind(self, args, kwargs):
+    """ returns the ndb filter or search string for these arguments """
+    if kwargs or not self.positional or len(args) != len(self.arguments):
+      args = self.arguments.apply(*args, **kwargs)
+    return self._build(iter(args))
+  
+  def __repr__(self):
+    return 'QueryPlan(backend={!r}, arguments={!r})'.format(self.backend, self.arguments)
 
 
 class Query(AND, ModelAttribute):
   def __init__(self, *components):
     super(Query, self).__init__(*components)
+    self.cache_ttl = None
+    self.returned_fields = None
+    self._plan = None
+  
+  def cached(self, ttl=60):
+    """
+    ' Opts this query into the memcache result cache, keeping the
+    ' ids it returns for ttl seconds or until the kind is written.
+    ' Results are not cached for a few seconds after a write while
+    ' the datastore and search index settle, but writes made
+    ' outside venom or lost generation bumps can still serve stale
+    ' ids for up to ttl seconds, so keep ttl short for frequently
+    ' written kinds.
+    """
+    self.cache_ttl = ttl
+    return self
+  
+  def returning(self, *names):
+    """
+    ' Has this search backed query request the named properties
+    ' as returned_fields and hydrate read-only partial entities
+    ' from them, skipping the datastore. The properties must be
+    ' stored in the search index, i.e. used by a search query.
+    """
+    self.returned_fields = tuple(names)
+    return self
   
   """ [below] Implemented from QueryComponent """
   
@@ -264,15 +518,32 @@ class Query(AND, ModelAttribute):
           return True
     return False
   
+  def compile(self):
+    """ called once the Model's properties are connected """
+    plan = QueryPlan(self)
+    if self.returned_fields:
+      self._check_returned_fields(plan)
+    self._plan = plan
+    return plan
+  
+  def _check_returned_fields(self, plan):
+    if plan.backend != QueryPlan.SEARCH:
+      raise Exception(
+        "Query '{}' can only return fields from the search index but it queries the datastore"
+        .format(self._name)
+      )
+    for name in self.returned_fields:
+      schema = self._model._schema if self._model else {}
+      if not name in schema or not schema[name].search:
+        raise Exception(
+          "Query '{}' cannot return '{}' because it is not a property stored in the search index"
+          .format(self._name, name)
+        )
+  
   def __call__(self, *args, **kwargs):
-    query_arguments = self.to_query_arguments()
-    arguments = query_arguments.apply(*args, **kwargs)
-    
-    if self.uses_datastore():
-      query = self.to_datastore_query(arguments)
-      results = self._model._execute_datastore_query(query)
-      return QueryResults(results)
-    else:
-      query = self.to_search_query(arguments)
-      results = self._model._execute_search_query(query)
-      return QueryResults(results)
+    plan = self._plan if self._plan != None else self.compile()
+    query = plan.bind(args, kwargs)
+    return QueryResults(
+      self._model, plan.backend, query,
+      cache_ttl=self.cache_ttl, returned_fields=self.returned_fields
+    )
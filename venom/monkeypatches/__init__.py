@@ -1,3 +1,3 @@
 __all__ = ['__json__']
 
-import __json__
\ No newline at end of file
+import __json__
@@ -1,14 +1,26 @@
+# system imports
 from json import JSONEncoder
 import datetime
 import time
+import warnings
+
 
 def _default(self, obj):
-  if isinstance(obj, datetime.datetime):
-    timestamp = time.mktime(obj.timetuple())
-    return timestamp
-  if hasattr(obj, '__json__'):
-    return getattr(obj, '__json__')()
-  return obj
+  """
+  ' Deprecated: lets plain json.dumps serialize datetimes and
+  ' __json__ objects such as Models, as venom always has. Use
+  ' venom.internal.json_encoder.JSONEncoder or compact_encoder.
+  """
+  if isinstance(obj, datetime.datetime) or hasattr(obj, '__json__'):
+    warnings.warn(
+      'serializing venom objects with json.dumps relies on a global patch; '
+      'use venom.internal.json_encoder instead',
+      DeprecationWarning, stacklevel=3
+    )
+    if isinstance(obj, datetime.datetime):
+      return time.mktime(obj.timetuple())
+    return obj.__json__()
+  return _default.default(self, obj)
 
-_default.default = JSONEncoder().default# Save unmodified default.
-JSONEncoder.default = _default# replacement
\ No newline at end of file
+_default.default = JSONEncoder.default # Save unmodified default.
+JSONEncoder.default = _default # replacement
@@ -55,6 +55,13 @@ class Parameter(object):
   def validate(self, key, value):
     pass
   
+  def compile(self):
+    """
+    ' Returns a function behaving exactly like self.load, compiled
+    ' by ValidatorCompiler for this parameter tree.
+    """
+    return ValidatorCompiler(self).compile()
+  
   def __iter__(self):
     cls = self.__class__
     yield 'type', cls.__name__
@@ -361,3 +368,320 @@ class Model(Parameter):
         "'{}' field found no entity from model {} matching the provided key"
         .format(key, self.model.kind)
       )
+
+
+def _cast_failed(key):
+  """ called from inside an except block, mirroring Parameter.load """
+  traceback.print_exc()
+  raise ParameterCastingFailed(
+    "'{}' failed casting without specifying a reason"
+    .format(key)
+  )
+
+
+class ValidatorCompiler(object):
+  """
+  ' Compiles a Parameter tree into a single generated function
+  ' with the signature and behaviour of Parameter.load. Checks
+  ' that are not configured are left out, patterns are compiled
+  ' and character sets frozen once, and key strings such as
+  ' 'request.Body.tags[3]' are only formatted when a check fails.
+  ' Parameter subclasses other than the ones below keep their
+  ' own load method, which is called from the generated code.
+  '
+  ' Given a ModelBatch, Parameters.Model values are deferred to it
+  ' rather than fetched one at a time. The function's defers
+  ' attribute tells whether the template holds any.
+  """
+  
+  # deeper templates are compiled into separate functions so the
+  # generated code stays within Python's nesting limits
+  maximum_depth = 24
+  
+  def __init__(self, parameter):
+    super(ValidatorCompiler, self).__init__()
+    self.parameter = parameter
+    self.namespace = {
+      'ParameterValidationFailed': ParameterValidationFailed,
+      '_cast_failed': _cast_failed
+    }
+    self.lines = []
+    self.counter = 0
+    self.defers = False
+    self._emitters = {
+      Parameter: self._emit_parameter,
+      ChoicesParameter: self._emit_choices,
+      String: self._emit_string,
+      Integer: self._emit_number,
+      Float: self._emit_number,
+      Dict: self._emit_dict,
+      List: self._emit_list,
+      Model: self._emit_model
+    }
+  
+  def compile(self):
+    self.lines.append('def load(key, value, batch=None):')
+    self._emit(self.parameter, 'value', 'key', 1)
+    self.lines.append('  return value')
+    exec '\n'.join(self.lines) in self.namespace
+    load = self.namespace['load']
+    load.defers = self.defers
+    return load
+  
+  def _name(self, prefix, value=None):
+    self.counter += 1
+    name = '{}_{}'.format(prefix, self.counter)
+    if value != None:
+      self.namespace[name] = value
+    return name
+  
+  def _line(self, depth, line, *args):
+    self.lines.append('  ' * depth + line.format(*args))
+  
+  def _fail(self, depth, message, *args):
+    self._line(depth, 'raise ParameterValidationFailed({}.format({}))', self._name('message', message), ', '.join(args))
+  
+  def _emit(self, parameter, var, key, depth):
+    emitter = self._emitters.get(type(parameter))
+    if not emitter:
+      name = self._name('load', parameter.load)
+      self._line(depth, '{0} = {1}({2}, {0})', var, name, key)
+      return
+    if depth > self.maximum_depth:
+      load = parameter.compile()
+      self.defers = self.defers or load.defers
+      self._line(depth, '{0} = {1}({2}, {0}, batch)', var, self._name('load', load), key)
+      return
+    
+    self._line(depth, 'if {} is None:', var)
+    if parameter.required:
+      self._fail(depth + 1, "'{}' field was not found, but is required", key)
+    else:
+      self._line(depth + 1, 'pass')
+    self._line(depth, 'else:')
+    emitter(parameter, var, key, depth + 1)
+  
+  def _emit_cast(self, cast, var, key, depth):
+    self._line(depth, 'try:')
+    self._line(depth + 1, '{0} = {1}({0})', var, cast)
+    self._line(depth, 'except Exception:')
+    self._line(depth + 1, '_cast_failed({})', key)
+  
+  def _emit_parameter(self, parameter, var, key, depth):
+    self._line(depth, 'pass')
+  
+  def _emit_choices(self, parameter, var, key, depth):
+    if parameter.choices == None:
+      self._line(depth, 'pass')
+      return
+    original = self._name('choices', parameter.choices)
+    try:
+      choices = frozenset(parameter.choices)
+    except TypeError:
+      self._line(depth, 'if not {} in {}:', var, original)
+      self._fail(depth + 1, "'{}' field must be one of {} but instead it was '{}'", key, original, var)
+      return
+    # unhashable values such as lists are looked up in the choices as given
+    name = self._name('choices', choices)
+    found = self._name('found')
+    self._line(depth, 'try:')
+    self._line(depth + 1, '{} = {} in {}', found, var, name)
+    self._line(depth, 'except TypeError:')
+    self._line(depth + 1, '{} = {} in {}', found, var, original)
+    self._line(depth, 'if not {}:', found)
+    self._fail(depth + 1, "'{}' field must be one of {} but instead it was '{}'", key, original, var)
+  
+  def _emit_min_max(self, parameter, value, key, depth, messages):
+    for bound, operator, message in [('min', '<', messages[0]), ('max', '>', messages[1])]:
+      limit = getattr(parameter, bound)
+      if limit == None: continue
+      name = self._name(bound, limit)
+      self._line(depth, 'if {} {} {}:', value, operator, name)
+      self._fail(depth + 1, message, *([key, name] + messages[2]))
+  
+  def _emit_string(self, parameter, var, key, depth):
+    self._emit_cast('str', var, key, depth)
+    self._emit_choices(parameter, var, key, depth)
+    self._emit_min_max(parameter, 'len({})'.format(var), key, depth, [
+      "'{}' field requires at least {} characters but was provided '{}' of length {}",
+      "'{}' field requires at most {} characters but was provided '{}' of length {}",
+      [var, 'len({})'.format(var)]
+    ])
+    if parameter.characters != None:
+      characters = self._name('characters', frozenset(parameter.characters))
+      joined = self._name('joined', ''.join(parameter.characters))
+      self._line(depth, 'if not {}.issuperset({}):', characters, var)
+      self._fail(depth + 1,
+        "'{}' field can only contain characters from '{}' but found characters from '{}'",
+        key, joined, "''.join(set({}) - {})".format(var, characters)
+      )
+    if parameter.pattern != None:
+      pattern = self._name('pattern', re.compile(parameter.pattern))
+      original = self._name('pattern', parameter.pattern)
+      self._line(depth, 'if not {}.match({}):', pattern, var)
+      self._fail(depth + 1, "'{}' field must match pattern '{}' but was given '{}'", key, original, var)
+  
+  def _emit_number(self, parameter, var, key, depth):
+    self._emit_cast('float' if type(parameter) == Float else 'int', var, key, depth)
+    self._emit_choices(parameter, var, key, depth)
+    self._emit_min_max(parameter, var, key, depth, [
+      "'{}' field must be at least {} but was {}",
+      "'{}' field must be at most {} but was {}",
+      [var]
+    ])
+  
+  def _emit_dict(self, parameter, var, key, depth):
+    self._emit_cast('dict', var, key, depth)
+    for name, child in parameter.template.items():
+      if not isinstance(child, Parameter):
+        continue
+      constant = self._name('key', name)
+      child_var = self._name('value')
+      child_key = "'{{}}.{{}}'.format({}, {})".format(key, constant)
+      self._line(depth, '{0} = {1}[{2}] if {2} in {1} else None', child_var, var, constant)
+      self._emit(child, child_var, child_key, depth)
+      self._line(depth, '{}[{}] = {}', var, constant, child_var)
+  
+  def _emit_model(self, parameter, var, key, depth):
+    self.defers = True
+    name = self._name('model', parameter)
+    self._line(depth, 'if batch is None:')
+    self._line(depth + 1, '{0} = {1}.load({2}, {0})', var, name, key)
+    self._line(depth, 'else:')
+    self._line(depth + 1, '{0} = batch.defer({1}, {2}, {0})', var, name, key)
+  
+  def _emit_list(self, parameter, var, key, depth):
+    self._emit_cast('list', var, key, depth)
+    self._emit_min_max(parameter, 'len({})'.format(var), key, depth, [
+      "'{}' field's length must be at least {} but was {}",
+      "'{}' field's length must be at most {} but was {}",
+      ['len({})'.format(var)]
+    ])
+    index = self._name('index')
+    item = self._name('value')
+    self._line(depth, 'for {}, {} in enumerate({}):', index, item, var)
+    self._emit(parameter.template, item, "'{{}}[{{}}]'.format({}, {})".format(key, index), depth + 1)
+    self._line(depth + 1, '{}[{}] = {}', var, index, item)
+
+
+class LazyValidator(object):
+  """
+  ' Stands in for parameter.compile() and compiles it the first
+  ' time it is called, so sections a route never reads cost
+  ' nothing at startup. defers is worked out from the template
+  ' the same way ValidatorCompiler would, without compiling it.
+  """
+  
+  def __init__(self, parameter):
+    super(LazyValidator, self).__init__()
+    self.parameter = parameter
+    self.defers = _defers(parameter)
+    self._load = None
+  
+  def __call__(self, key, value, batch=None):
+    if self._load == None:
+      self._load = self.parameter.compile()
+    return self._load(key, value, batch)
+
+
+def _defers(parameter):
+  """ whether ValidatorCompiler would defer any Parameters.Model in this tree """
+  cls = type(parameter)
+  if cls == Model:
+    return True
+  if cls == List:
+    return _defers(parameter.template)
+  if cls == Dict:
+    return any(
+      _defers(child) for child in parameter.template.values()
+      if isinstance(child, Parameter)
+    )
+  return False
+
+
+# every route starts with an empty template for each section
+_empty_validator = LazyValidator(Dict({}))
+
+
+def lazy_compile(parameter):
+  """
+  ' Returns a LazyValidator for parameter. Required empty Dict
+  ' templates, which all compile to the same function, share one.
+  """
+  if type(parameter) == Dict and parameter.required and not parameter.template:
+    return _empty_validator
+  return LazyValidator(parameter)
+
+
+class DeferredEntity(object):
+  """ placeholder for a Parameters.Model value until its batch is resolved """
+  
+  def __init__(self, parameter, key, value):
+    super(DeferredEntity, self).__init__()
+    self.parameter = parameter
+    self.key = key
+    self.value = value
+    self.entity = None
+
+
+class ModelBatch(object):
+  """
+  ' Collects the ids referenced by Parameters.Model templates while
+  ' the sections of a request are loaded, then fetches them with
+  ' one get_multi per model. Loaded values hold DeferredEntity
+  ' placeholders until substitute swaps the entities in.
+  """
+  
+  def __init__(self):
+    super(ModelBatch, self).__init__()
+    self.deferred = []
+  
+  def defer(self, parameter, key, value):
+    deferred = DeferredEntity(parameter, key, value)
+    self.deferred.append(deferred)
+    return deferred
+  
+  def resolve(self):
+    fetched = {}
+    for model, ids in self._group().items():
+      try:
+        entities = model.get_multi(ids)
+      except Exception:
+        # leave these to Model.load below so the error matches
+        continue
+      for document_id, entity in zip(ids, entities):
+        fetched[model, document_id] = entity
+    
+    for deferred in self.deferred:
+      model = deferred.parameter.model
+      if self._hashable(deferred.value) and (model, deferred.value) in fetched:
+        deferred.entity = fetched[model, deferred.value]
+        deferred.parameter.validate(deferred.key, deferred.entity)
+      else:
+        deferred.entity = deferred.parameter.load(deferred.key, deferred.value)
+  
+  def _group(self):
+    groups = {}
+    seen = set()
+    for deferred in self.deferred:
+      model = deferred.parameter.model
+      if not self._hashable(deferred.value) or (model, deferred.value) in seen:
+        continue
+      seen.add((model, deferred.value))
+      groups.setdefault(model, []).append(deferred.value)
+    return groups
+  
+  @staticmethod
+  def _hashable(value):
+    return isinstance(value, (basestring, int, long))
+  
+  def substitute(self, value):
+    if isinstance(value, DeferredEntity):
+      return value.entity
+    if isinstance(value, dict):
+      for key, item in value.items():
+        value[key] = self.substitute(item)
+    elif isinstance(value, list):
+      for i, item in enumerate(value):
+        value[i] = self.substitute(item)
+    return value
@@ -1,12 +1,51 @@
 # system imports
 import traceback
+import hashlib
 import json
+import os
+import zlib
 
+from webob.datetime_utils import UTC
 
-__all__ = ['Protocol', 'TextProtocol', 'JSONProtocol']
+# package imports
+from ..internal.json_encoder import JSONEncoder, compact_encoder, is_sequence
+from ..internal import msgpack_codec
+
+
+__all__ = ['Protocol', 'TextProtocol', 'JSONProtocol', 'MsgPackProtocol']
 
 
 class Protocol(object):
+  """
+  ' Reads request bodies and writes response bodies in a single
+  ' wire format identified by content_type. When a route
+  ' negotiates several protocols the request body may arrive in
+  ' a different format than the response is written in, in which
+  ' case the reader protocol decodes it.
+  '
+  ' Bodies of at least compress_threshold bytes are gzip or
+  ' deflate compressed when the client's Accept-Encoding allows
+  ' it. A compress_level of 0 or a compress_threshold of None
+  ' disables compression.
+  """
+  
+  content_type = None
+  compress_threshold = 1024
+  compress_level = 6
+  compress_encodings = ('gzip', 'deflate')
+  incompressible_types = (
+    'image/', 'video/', 'audio/', 'application/zip',
+    'application/gzip', 'application/x-gzip'
+  )
+  
+  _window_bits = {
+    'gzip': 16 + zlib.MAX_WBITS,
+    'deflate': zlib.MAX_WBITS
+  }
+  
+  # protocol decoding request bodies in another format, if any
+  reader = None
+  
   def __init__(self, request, response, error, errors):
     super(Protocol, self).__init__()
     self.request = request
@@ -14,20 +53,144 @@ class Protocol(object):
     self.error = error
     self.errors = errors
   
+  def _configure(self, reader=None, compression=None):
+    """
+    ' Applies the route's negotiated reader and compression
+    ' settings after construction, so subclasses overriding
+    ' __init__ with the four argument signature keep working.
+    """
+    self.reader = reader
+    if compression:
+      self.compress_threshold = compression.get('threshold', self.compress_threshold)
+      self.compress_level = compression.get('level', self.compress_level)
+    return self
+  
   def _read(self, value):
+    if self.reader:
+      return self.reader.read(value)
     return self.read(value)
   
   def _write(self, value):
-    written = self.write(value)
-    self.response.write(written)
-    return written
+    if self.response.status_int == 304:
+      return
+    self._write_chunks(self.write_chunks(value))
+  
+  def _write_chunks(self, chunks):
+    if self._compressible():
+      chunks = self._compress(chunks)
+    for chunk in chunks:
+      self.response.write(chunk)
+  
+  def _compressible(self):
+    if not self.compress_level or self.compress_threshold == None:
+      return False
+    if 'Content-Encoding' in self.response.headers:
+      return False
+    content_type = self.content_type or self.response.content_type or ''
+    return not content_type.startswith(self.incompressible_types)
+  
+  def _content_encoding(self):
+    if not self.request.accept_encoding:
+      return None
+    return self.request.accept_encoding.best_match(self.compress_encodings)
+  
+  def _compress(self, chunks):
+    """
+    ' Buffers chunks until compress_threshold bytes have been
+    ' produced. Smaller bodies are written as they are, larger
+    ' ones are compressed chunk by chunk as they are produced.
+    """
+    self._vary('Accept-Encoding')
+    encoding = self._content_encoding()
+    if not encoding:
+      for chunk in chunks:
+        yield chunk
+      return
+    
+    buffered = []
+    size = 0
+    for chunk in chunks:
+      buffered.append(chunk)
+      size += len(chunk)
+      if size >= self.compress_threshold:
+        break
+    else:
+      yield ''.join(buffered)
+      return
+    
+    self.response.headers['Content-Encoding'] = encoding
+    if self.response.etag:
+      self.response.etag = '{}-{}'.format(self.response.etag, encoding)
+    compressor = zlib.compressobj(self.compress_level, zlib.DEFLATED, self._window_bits[encoding])
+    yield compressor.compress(''.join(buffered))
+    for chunk in chunks:
+      yield compressor.compress(chunk)
+    yield compressor.flush()
+  
+  def _vary(self, header):
+    vary = self.response.vary or ()
+    if not header in vary:
+      self.response.vary = tuple(vary) + (header,)
+  
+  def _write_conditional(self, value, etag=None, last_modified=None):
+    """
+    ' Writes value unless the request's If-None-Match or
+    ' If-Modified-Since shows the client already holds it. When
+    ' no etag is given one is computed from the serialized body.
+    """
+    if not self.request.method in ('GET', 'HEAD') or self.response.status_int != 200:
+      return self._write(value)
+    if etag == None:
+      chunks = list(self.write_chunks(value))
+      etag = hashlib.md5(''.join(chunks)).hexdigest()
+      if not self._not_modified(etag, last_modified):
+        self._write_chunks(chunks)
+    elif not self._not_modified(etag, last_modified):
+      self._write(value)
+  
+  def _etag_candidates(self, etag):
+    """ the ETag and those of compressed copies of its body """
+    return [etag] + ['{}-{}'.format(etag, encoding) for encoding in self.compress_encodings]
+  
+  def _not_modified(self, etag, last_modified=None):
+    """
+    ' Sets a strong ETag, and Last-Modified when given, on the
+    ' response. If the request's If-None-Match already holds the
+    ' ETag, or that of a compressed copy of it, or in its absence
+    ' If-Modified-Since is not older than last_modified, the
+    ' response is turned into a bodiless 304 and True is returned.
+    """
+    self.response.etag = etag
+    if last_modified != None:
+      # HTTP dates hold whole seconds, so stamps are compared and
+      # sent at that precision. Naive stamps are in UTC.
+      last_modified = last_modified.replace(microsecond=0)
+      if last_modified.tzinfo == None:
+        last_modified = last_modified.replace(tzinfo=UTC)
+      self.response.last_modified = last_modified
+    
+    if 'If-None-Match' in self.request.headers:
+      for candidate in self._etag_candidates(etag):
+        if candidate in self.request.if_none_match:
+          self.response.etag = candidate
+          self.response.status = 304
+          return True
+      return False
+    
+    if last_modified != None and self.request.if_modified_since:
+      if last_modified <= self.request.if_modified_since:
+        self.response.status = 304
+        return True
+    return False
   
   def _apply_headers(self):
     for key, value in self.headers().items():
       self.response.headers[key] = value
   
   def headers(self):
-    return {}
+    if not self.content_type:
+      return {}
+    return { 'content-type': self.content_type }
   
   def read(self, value):
     raise NotImplementedError('Protocol read method not implemented')
@@ -35,6 +198,9 @@ class Protocol(object):
   def write(self, value):
     raise NotImplementedError('Protocol write method not implemented')
   
+  def write_chunks(self, value):
+    yield self.write(value)
+  
   def __enter__(self):
     return self
   
@@ -47,7 +213,9 @@ class Protocol(object):
   
   def _exit_error(self, exception_type, exception_value, exception_traceback):
     self._apply_headers()
-    self.error(500)
+    self.error(getattr(exception_type, 'http_status', 500))
+    if 'Content-Encoding' in self.response.headers:
+      del self.response.headers['Content-Encoding']
     try:
       if exception_type in self.errors:
         self._write({
@@ -67,11 +235,10 @@ class Protocol(object):
   
   def _exit_success(self):
     self._apply_headers()
-    
+
 
 class TextProtocol(Protocol):
-  def headers(self):
-    return { 'content-type': 'text/plain' }
+  content_type = 'text/plain'
   
   def write(self, value):
     if not value: value = ''
@@ -83,13 +250,79 @@ class TextProtocol(Protocol):
 
 
 class JSONProtocol(Protocol):
-  def headers(self):
-    return { 'content-type': 'application/json' }
+  """
+  ' Writes pretty printed, sorted JSON on the development server
+  ' or when '?pretty=1' is requested and compact JSON otherwise.
+  ' Compact results with more than stream_threshold items are
+  ' encoded incrementally and written in chunk_size pieces.
+  """
+  
+  content_type = 'application/json'
+  pretty = None
+  stream_threshold = 1000
+  chunk_size = 64 * 1024
+  
+  def _is_pretty(self):
+    if self.request.GET.get('pretty') in ('1', 'true'):
+      return True
+    if self.pretty != None:
+      return self.pretty
+    return os.environ.get('SERVER_SOFTWARE', '').startswith('Development')
+  
+  def _encoder(self):
+    if self._is_pretty():
+      return JSONEncoder(indent=2, sort_keys=True)
+    return compact_encoder
+  
+  def _is_large(self, value):
+    if is_sequence(value):
+      return len(value) > self.stream_threshold
+    if isinstance(value, dict):
+      for item in value.values():
+        if is_sequence(item) and len(item) > self.stream_threshold:
+          return True
+    return False
   
   def write(self, value):
     if not value: value = {}
-    return json.dumps(value, indent=2, sort_keys=True)
+    return self._encoder().encode(value)
+  
+  def write_chunks(self, value):
+    if not value: value = {}
+    encoder = self._encoder()
+    if not self._is_large(value):
+      yield encoder.encode(value)
+      return
+    pieces = encoder.iterencode(value)
+    buffered = []
+    size = 0
+    for piece in pieces:
+      buffered.append(piece)
+      size += len(piece)
+      if size >= self.chunk_size:
+        yield ''.join(buffered)
+        buffered = []
+        size = 0
+    if buffered:
+      yield ''.join(buffered)
   
   def read(self, value):
     if not value: return {}
     return json.loads(value)
+
+
+class MsgPackProtocol(Protocol):
+  """
+  ' Writes and reads MessagePack. The msgpack package is used
+  ' when installed, otherwise a pure Python codec is used.
+  """
+  
+  content_type = 'application/x-msgpack'
+  
+  def write(self, value):
+    if not value: value = {}
+    return msgpack_codec.packb(value)
+  
+  def read(self, value):
+    if not value: return {}
+    return msgpack_codec.unpackb(value)
@@ -12,6 +12,9 @@ __all__ += wsgi_entry.__all__
 from routes import *
 __all__ += routes.__all__
 
+from router import *
+__all__ += router.__all__
+
 from application import *
 __all__ += application.__all__
 
@@ -1,20 +1,23 @@
 # system imports
 from collections import defaultdict
+import hashlib
 import inspect
 
 # package imports
 import routes
+from router import Router
 from wsgi_entry import WSGIEntryPoint
 import Protocols
-from handlers import RequestHandler
+from handlers import RequestHandler, PreconditionFailed
 from ..__ui__ import ui
 from ..model import Model
 import Parameters
 from ..model import Properties
+from ..internal.json_encoder import JSONEncoder
 import docs
 
 
-__all__ = ['Application', 'VersionDispatch']
+__all__ = ['Application', 'VersionDispatch', 'RouteMetaIndex']
 
 
 
@@ -27,6 +30,18 @@ def _removenull(obj):
   return obj
 
 
+def _version_key(path):
+  """
+  ' Returns the (prefix, version) pair from the first two
+  ' segments of a request path, e.g. ('api', 'v1') for
+  ' '/api/v1/users', or None when the path is too short.
+  """
+  parts = path.split('/', 3)
+  if len(parts) < 3 or parts[0]:
+    return None
+  return parts[1], parts[2]
+
+
 def route_to_meta(route):
   docstring = ''
   if len(route.allowed_methods) != 1:
@@ -56,52 +71,111 @@ def route_to_meta(route):
   }
 
 
+_etag_encoder = JSONEncoder(sort_keys=True, separators=(',', ':'))
+
+
+def _etag(obj):
+  return hashlib.md5(_etag_encoder.encode(obj)).hexdigest()
+
+
+class RouteMetaIndex(object):
+  """
+  ' Route metadata for the meta and routes handlers. Building it
+  ' reads handler source from disk, so it is computed once on
+  ' first use (or on warmup), indexed by route and 'ui.guid'
+  ' and rebuilt only when routes are added to the application.
+  """
+  
+  def __init__(self, app):
+    super(RouteMetaIndex, self).__init__()
+    self.app = app
+    self._route_count = None
+  
+  def _load(self):
+    if self._route_count == len(self.app.routes):
+      return
+    self._metas = {}
+    self._etags = {}
+    self._guids = {}
+    summaries = []
+    for route in self.app.routes:
+      if not route.path.startswith('/api/'): continue
+      guid = ui.get_guid(route)
+      if guid:
+        self._guids[guid] = route
+      summaries.append({
+        'path': route.path,
+        'methods': list(route.allowed_methods),
+        'ui.guid': guid
+      })
+    self._listing = {
+      'routes': summaries,
+      'version': self.app.version
+    }
+    self._listing_etag = _etag(self._listing)
+    self._route_count = len(self.app.routes)
+  
+  def warmup(self):
+    self._load()
+    for route in self.app.routes:
+      if route.path.startswith('/api/'):
+        self.meta(route)
+  
+  def meta(self, route):
+    self._load()
+    if not route in self._metas:
+      meta = route_to_meta(route)
+      self._metas[route] = meta
+      self._etags[route] = _etag(meta)
+    return self._metas[route]
+  
+  def etag(self, route):
+    self.meta(route)
+    return self._etags[route]
+  
+  def find(self, path, method=None):
+    routes = self.app.router.find_all(path)
+    if method:
+      routes = [route for route in routes if route.matches_method(method)]
+    return routes
+  
+  def get_by_guid(self, guid):
+    self._load()
+    return self._guids.get(guid)
+  
+  def listing(self):
+    self._load()
+    return self._listing, self._listing_etag
+
+
 def generate_meta_handler(app):
   class MetaRouteHandler(RequestHandler):
-    def _removenull(self, obj):
-      for key, value in obj.items():
-        if value == None:
-          del obj[key]
-        if isinstance(value, dict):
-          self._removenull(value)
-      return obj
-    
     def serve(self):
       raw_path = self.path[len(app._meta_prefix):]
       if raw_path.startswith('/'): raw_path = raw_path[1:]
       path = '{}/{}'.format(app._api_prefix, raw_path)
-      meta = { 'meta': True, 'routes': [] }
-      method = self.query.get('method')
-      for route in app.routes:
-        if method and not route.matches_method(method):
-          continue
-        if route.matches_path(path):
-          meta['routes'].append(route_to_meta(route))
-      return meta
+      routes = app.meta.find(path, self.query.get('method'))
+      etag = hashlib.md5(''.join(map(app.meta.etag, routes))).hexdigest()
+      if self.protocol._not_modified(etag):
+        return None
+      return { 'meta': True, 'routes': map(app.meta.meta, routes) }
   return MetaRouteHandler
 
 
 def generate_routes_handler(app):
   class GetRoutesHandler(RequestHandler):
     def serve(self):
-      returned_routes = []
-      
       guid = self.query.get('uiguid')
+      route = app.meta.get_by_guid(guid) if guid else None
+      if route:
+        if self.protocol._not_modified(app.meta.etag(route)):
+          return None
+        return { 'route': app.meta.meta(route) }
       
-      for route in app.routes:
-        if not route.path.startswith('/api/'): continue
-        if guid and ui.get_guid(route) == guid:
-          return { 'route': route_to_meta(route) }
-        returned_routes.append({
-          'path': route.path,
-          'methods': list(route.allowed_methods),
-          'ui.guid': ui.get_guid(route)
-        })
-      
-      return {
-        'routes': returned_routes,
-        'version': app.version
-      }
+      listing, etag = app.meta.listing()
+      if self.protocol._not_modified(etag):
+        return None
+      return listing
   return GetRoutesHandler
 
 
@@ -110,13 +184,22 @@ class _RoutesShortHand(WSGIEntryPoint):
     super(_RoutesShortHand, self).__init__()
     self.protocol = protocol
     self.routes = routes if routes else []
+    self._router = None
   
   def _add_route(self, path, handler, protocol, route_cls):
     if not protocol: protocol = self.protocol
     route = route_cls(path, handler, protocol=protocol)
     self.routes.append(route)
+    if self._router != None:
+      self._router.add(route)
     return route
   
+  @property
+  def router(self):
+    if self._router == None or len(self._router) != len(self.routes):
+      self._router = Router(self.routes)
+    return self._router
+  
   def GET(self, path, handler, protocol=None):
     return self._add_route(path, handler, protocol, routes.GET)
   
@@ -141,7 +224,7 @@ class _RoutesShortHand(WSGIEntryPoint):
   def TRACE(self, path, handler, protocol=None):
     return self._add_route(path, handler, protocol, routes.TRACE)
   
-  def CRUD(self, base_path, model, protocol=None, domain=None):
+  def CRUD(self, base_path, model, protocol=None, domain=None, conditional=False):
     if not inspect.isclass(model):
       raise ValueError('Expected type venom.Model got {}'.format(model))
     if not issubclass(model, Model):
@@ -184,10 +267,10 @@ class _RoutesShortHand(WSGIEntryPoint):
         if domain:
           setattr(entity, domain, self.url.get(domain))
         return entity.save()
-      
-    self._add_route(base_path, BaseHandler, protocol, routes.GET).url(url_params)
+    
+    base_get = self._add_route(base_path, BaseHandler, protocol, routes.GET).url(url_params)
     self._add_route(base_path, BaseHandler, protocol, routes.POST).body(body_params).url(url_params)
-      
+    
     class SpecificHandler(RequestHandler):
       def _check_ownership(self):
         entity = self.url.get('entity')
@@ -196,6 +279,27 @@ class _RoutesShortHand(WSGIEntryPoint):
           if getattr(entity, domain).key != owner.key:
             raise Exception('Invalid ownership')
       
+      def _check_precondition(self):
+        """
+        Honor If-Match so clients can update an entity they read
+        earlier without re-reading it to detect changes
+        """
+        if not 'If-Match' in self.request.headers:
+          return
+        entity = self.url.get('entity')
+        for etag in self.protocol._etag_candidates(entity._etag()):
+          if etag in self.request.if_match:
+            return
+        raise PreconditionFailed(
+          "{} entity '{}' has been modified since it was read"
+          .format(model.kind, entity.key)
+        )
+      
+      def _save(self, entity):
+        entity.save()
+        self.response.etag = entity._etag()
+        return entity
+      
       def get(self):
         """
         Given an entity key, return the entity found in the database
@@ -208,22 +312,24 @@ class _RoutesShortHand(WSGIEntryPoint):
         Given an entity key, replace it's data with the provided body data
         """
         self._check_ownership()
+        self._check_precondition()
         entity = self.url.get('entity')
         entity.populate(**self.body)
-        return entity.save()
+        return self._save(entity)
       
       def patch(self):
         """
         Given an entity key, alter any provided fields from the body data
         """
         self._check_ownership()
+        self._check_precondition()
         entity = self.url.get('entity')
         entity.populate(**{
           key: value
           for key, value in self.body.items()
           if value != None
         })
-        return entity.save()
+        return self._save(entity)
       
       def delete(self):
         """
@@ -234,10 +340,14 @@ class _RoutesShortHand(WSGIEntryPoint):
     
     path = '{}/:entity'.format(base_path)
     url_params = dict({ 'entity': Parameters.Model(model) }.items() + url_params.items())
-    self._add_route(path, SpecificHandler, protocol, routes.GET).url(url_params)
+    specific_get = self._add_route(path, SpecificHandler, protocol, routes.GET).url(url_params)
     self._add_route(path, SpecificHandler, protocol, routes.PUT).url(url_params).body(body_params)
     self._add_route(path, SpecificHandler, protocol, routes.PATCH).url(url_params).body(patch_params)
     self._add_route(path, SpecificHandler, protocol, routes.DELETE).url(url_params)
+    
+    if conditional:
+      base_get.conditional('entity')
+      specific_get.conditional('entity')
 
 
 class Application(_RoutesShortHand):
@@ -248,12 +358,15 @@ class Application(_RoutesShortHand):
   default_errors = {
     Parameters.ParameterCastingFailed    : 1000,
     Parameters.ParameterValidationFailed : 1001,
+    PreconditionFailed                   : 1002,
     Properties.PropertyValidationFailed  : 2000,
   }
   
-  def __init__(self, routes=None, version=1, packages=None, protocol=Protocols.JSONProtocol, errors=None):
+  def __init__(self, routes=None, version=1, packages=None, protocol=Protocols.JSONProtocol, errors=None, protocols=None, compression=None):
     super(Application, self).__init__(protocol=protocol)
     self.routes = routes if routes else []
+    self.protocols = tuple(protocols) if protocols else ()
+    self.compression = compression if compression else {}
     self.errors = errors if errors else {}
     self.version = version
     self.packages = []
@@ -265,6 +378,9 @@ class Application(_RoutesShortHand):
     self._routes_prefix = '/{}/v{}'.format('routes', version)
     self._docs_prefix = '/{}/v{}'.format('docs', version)
     
+    self.meta = RouteMetaIndex(self)
+    self.docs = docs.Documentation(self)
+    
     self._add_routes_route()
     
     if packages and not isinstance(packages, list):
@@ -275,7 +391,7 @@ class Application(_RoutesShortHand):
     if not packages: return
     for package in packages:
       self.load_package(package)
-    
+  
   def load_package(self, package):
     if not hasattr(package, 'package'):
       raise AttributeError('Venom Package must have package(app) method')
@@ -284,18 +400,16 @@ class Application(_RoutesShortHand):
   
   def dispatch(self, request, response, error):
     if self._matches_prefix(request.path, self._docs_prefix):
-      return docs.Documentation(self)
-    route = self.find_route(request.path, request.method)
+      return self.docs
+    route, parameters = self.router.find(request.path, request.method)
     if route == None:
       error(404)
       return
-    route.handle(request, response, error, errors=self.errors)
+    route.handle(request, response, error, errors=self.errors, parameters=parameters)
   
   def find_route(self, path, method):
-    for route in self.routes:
-      if route.matches(path, method):
-        return route
-    return None
+    route, _ = self.router.find(path, method)
+    return route
   
   def _add_route(self, path, handler, protocol, route_cls):
     if path.startswith('/'): path = path[1:]
@@ -304,7 +418,12 @@ class Application(_RoutesShortHand):
   
   def _add_api_route(self, path, handler, protocol, route_cls):
     path = '{}/{}'.format(self._api_prefix, path)
-    return super(Application, self)._add_route(path, handler, protocol, route_cls)
+    route = super(Application, self)._add_route(path, handler, protocol, route_cls)
+    if self.protocols:
+      route.negotiate(*self.protocols)
+    if self.compression:
+      route.compress(**self.compression)
+    return route
   
   def _add_meta_route(self, path):
     path = '{}/{}'.format(self._meta_prefix, path)
@@ -313,12 +432,12 @@ class Application(_RoutesShortHand):
   def _add_routes_route(self):
     return super(Application, self)._add_route(self._routes_prefix, generate_routes_handler(self), self.internal_protocol, routes.Route)
   
+  def version_keys(self):
+    version = 'v{}'.format(self.version)
+    return [(prefix, version) for prefix in self.allowed_prefixes]
+  
   def matches_version(self, path):
-    for prefix in self.allowed_prefixes:
-      prefix = '/{}/v{}/'.format(prefix, self.version)
-      if path.startswith(prefix) or path == prefix[:-1]:
-        return True
-    return False
+    return _version_key(path) in self.version_keys()
   
   def _matches_prefix(self, path, prefix):
     if not prefix.endswith('/'):
@@ -329,12 +448,49 @@ class Application(_RoutesShortHand):
 class VersionDispatch(WSGIEntryPoint):
   def __init__(self, *applications):
     super(VersionDispatch, self).__init__()
-    self.applications = applications
+    self.applications = []
+    self._dispatch_table = {}
+    for application in applications:
+      self.register(application)
   
-  def dispatch(self, request, response, error):
-    path = request.path
+  def register(self, application):
+    """
+    ' Adds an application to the dispatch table, keyed on each
+    ' of its '/<prefix>/v<version>' path prefixes. Can be called
+    ' at any time to bring a new version live. As when matching
+    ' applications in order, a prefix already served keeps the
+    ' application registered first.
+    """
+    for key in application.version_keys():
+      self._dispatch_table.setdefault(key, application)
+    self.applications.append(application)
+    return application
+  
+  def retire(self, version):
+    """
+    ' Removes the application serving the given version so its
+    ' paths 404 from then on, or are served by the next one
+    ' registered for them. Returns the retired application.
+    """
     for application in self.applications:
-      if application.matches_version(path):
-        return application
-    error(404)
-  
\ No newline at end of file
+      if application.version == version:
+        break
+    else:
+      raise ValueError('No application registered for version {}'.format(version))
+    self.applications.remove(application)
+    for key in application.version_keys():
+      if self._dispatch_table.get(key) is not application:
+        continue
+      del self._dispatch_table[key]
+      for other in self.applications:
+        if key in other.version_keys():
+          self._dispatch_table[key] = other
+          break
+    return application
+  
+  def dispatch(self, request, response, error):
+    application = self._dispatch_table.get(_version_key(request.path))
+    if application == None:
+      error(404)
+      return
+    return application
@@ -1,4 +1,5 @@
 # system imports
+import hashlib
 import os
 
 # package imports
@@ -12,13 +13,38 @@ __all__ = 'Documentation'
 
 
 class Documentation(WSGIEntryPoint):
+  """
+  ' Serves the documentation page for one application version.
+  ' The template is rendered on the first request and then held
+  ' in memory with its ETag for the life of the instance.
+  """
+  
+  cache_control = 'public, max-age=300'
+  
   def __init__(self, application):
     super(Documentation, self).__init__()
     self.application = application
+    self._rendered = None
+    self._etag = None
+  
+  def render(self):
+    if self._rendered == None:
+      template_values = {
+        'version': self.application.version
+      }
+      path = os.path.join(os.path.dirname(__file__), 'docs/index.html')
+      self._rendered = template.render(path, template_values)
+      if isinstance(self._rendered, unicode):
+        self._rendered = self._rendered.encode('utf-8')
+      self._etag = hashlib.md5(self._rendered).hexdigest()
+    return self._rendered, self._etag
   
   def dispatch(self, request, response, error):
-    template_values = {
-      'version': self.application.version
-    }
-    path = os.path.join(os.path.dirname(__file__), 'docs/index.html')
-    response.write(template.render(path, template_values))
+    rendered, etag = self.render()
+    response.headers['Content-Type'] = 'text/html; charset=utf-8'
+    response.headers['Cache-Control'] = self.cache_control
+    response.etag = etag
+    if etag in request.if_none_match:
+      response.status = 304
+      return
+    response.body = rendered
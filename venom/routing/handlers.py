@@ -1,16 +1,28 @@
-__all__ = ['Servable', 'RequestHandler']
+# system imports
+import collections
+
+# package imports
+import Parameters
+
+
+__all__ = ['Servable', 'RequestHandler', 'PreconditionFailed']
+
+
+class PreconditionFailed(Exception):
+  http_status = 412
 
 
 class Servable(object):
   _attributes = ['route', 'protocol']
   
-  def __init__(self, request, response, error, route, protocol):
+  def __init__(self, request, response, error, route, protocol, parameters=None):
     super(Servable, self).__init__()
     self.request = request
     self.response = response
     self.error = error
     self.route = route
     self.protocol = protocol
+    self.parameters = parameters
   
   def serve(self):
     raise NotImplementedError()
@@ -26,34 +38,92 @@ class Servable(object):
     return '{}({})'.format(name, ', '.join(args))
 
 
+class LazyParameters(object):
+  """
+  ' Non-data descriptor which parses and validates one section of
+  ' the request the first time a handler reads it, then caches the
+  ' result on the handler so later reads are plain attribute
+  ' lookups. Validation errors raise inside serve() and so still
+  ' reach the protocol's error envelope.
+  """
+  
+  def __init__(self, loader):
+    super(LazyParameters, self).__init__()
+    self.loader = loader
+    self.name = loader.__name__
+  
+  def __get__(self, handler, cls):
+    if handler == None:
+      return self
+    value = self.loader(handler)
+    handler.__dict__[self.name] = value
+    return value
+
+
 class RequestHandler(Servable):
   _attributes = ['path', 'method']
   
-  def __init__(self, request, response, error, route, protocol):
+  def __init__(self, request, response, error, route, protocol, parameters=None):
+    super(RequestHandler, self).__init__(request, response, error, route, protocol, parameters=parameters)
     self.path = request.path
-    self.route = route
     self.method = request.method.lower()
-    
-    self.url = ParameterDict(self._get_url_parameters())
-    self.query = ParameterDict(self._get_query_parameters(request))
-    self.headers = HeaderDict(self._get_headers_parameters(request))
-    self.body = ParameterDict(self._get_body_parameters(request, protocol))
-    
     self.throw = error
   
-  def _get_headers_parameters(self, request):
-    return self.route._headers.load('request.Headers', request.headers)
+  @LazyParameters
+  def url(self):
+    return ParameterDict(self._get_parameters('url'))
+  
+  @LazyParameters
+  def query(self):
+    return ParameterDict(self._get_parameters('query'))
   
-  def _get_query_parameters(self, request):
-    return self.route._query.load('request.Query', request.GET)
+  @LazyParameters
+  def headers(self):
+    return HeaderDict(self._get_parameters('headers'))
   
-  def _get_url_parameters(self):
-    path_params = self.route.path.get_parameters(self.path)
-    return self.route._url.load('request.Path', path_params)
+  @LazyParameters
+  def body(self):
+    return ParameterDict(self._get_parameters('body'))
   
-  def _get_body_parameters(self, request, protocol):
+  def _get_parameters(self, section):
+    """
+    ' Sections whose templates hold Parameters.Model are loaded
+    ' together the first time any of them is read, so that every
+    ' entity they reference is fetched in one get_multi per model.
+    """
+    batched = self.route._batched_sections()
+    if not section in batched:
+      return self._load_section(section)
+    if not '_batched' in self.__dict__:
+      batch = Parameters.ModelBatch()
+      loaded = [(name, self._load_section(name, batch)) for name in batched]
+      batch.resolve()
+      self._batched = { name: batch.substitute(value) for name, value in loaded }
+    return self._batched[section]
+  
+  def _load_section(self, section, batch=None):
+    if section == 'url':
+      return self._get_url_parameters(self.parameters, batch=batch)
+    if section == 'query':
+      return self._get_query_parameters(self.request, batch=batch)
+    if section == 'headers':
+      return self._get_headers_parameters(self.request, batch=batch)
+    return self._get_body_parameters(self.request, self.protocol, batch=batch)
+  
+  def _get_headers_parameters(self, request, batch=None):
+    return self.route._load_headers('request.Headers', request.headers, batch)
+  
+  def _get_query_parameters(self, request, batch=None):
+    return self.route._load_query('request.Query', request.GET, batch)
+  
+  def _get_url_parameters(self, path_params=None, batch=None):
+    if path_params == None:
+      path_params = self.route.path.get_parameters(self.path)
+    return self.route._load_url('request.Path', path_params, batch)
+  
+  def _get_body_parameters(self, request, protocol, batch=None):
     body = protocol._read(request.body)
-    return self.route._body.load('request.Body', body)
+    return self.route._load_body('request.Body', body, batch)
   
   def serve(self):
     method = self.method.lower()
@@ -62,17 +132,69 @@ class RequestHandler(Servable):
     raise Exception('HTTP Method {} not implemented when expected'.format(method.upper()))
 
 
-class ParameterList(list):
-  def __init__(self, *args, **kwargs):
-    super(ParameterList, self).__init__(*args, **kwargs)
-    self._sanitize()
+_split_paths = {}
+
+
+def _split_path(path):
+  """ dotted paths are split once and reused for every lookup """
+  sections = _split_paths.get(path)
+  if sections == None:
+    sections = _split_paths[path] = tuple(path.split('.'))
+  return sections
+
+
+def _view(value):
+  if isinstance(value, dict):
+    return ParameterDict(value)
+  if isinstance(value, list):
+    return ParameterList(value)
+  return value
+
+
+class ParameterList(collections.Sequence):
+  """
+  ' Read-only view over a decoded list. Nested dicts and lists
+  ' are wrapped in views when first accessed rather than copied
+  ' up front.
+  """
   
-  def _sanitize(self):
-    for i, item in enumerate(self):
-      if isinstance(item, dict):
-        self[i] = ParameterDict(item)
-      elif isinstance(item, list):
-        self[i] = ParameterList(item)
+  def __init__(self, data):
+    super(ParameterList, self).__init__()
+    self._data = data
+    self._views = {}
+  
+  def __getitem__(self, index):
+    if isinstance(index, slice):
+      return ParameterList(self._data[index])
+    if index < 0:
+      index += len(self._data)
+    view = self._views.get(index)
+    if view == None:
+      view = _view(self._data[index])
+      if view is not self._data[index]:
+        self._views[index] = view
+    return view
+  
+  def __len__(self):
+    return len(self._data)
+  
+  def __iter__(self):
+    for i in xrange(len(self._data)):
+      yield self[i]
+  
+  def __eq__(self, other):
+    if isinstance(other, ParameterList):
+      other = other._data
+    return self._data == other
+  
+  def __ne__(self, other):
+    return not self == other
+  
+  def __json__(self):
+    return self._data
+  
+  def __repr__(self):
+    return 'ParameterList({!r})'.format(self._data)
   
   def get(self, *paths):
     if not paths: return None
@@ -81,23 +203,55 @@ class ParameterList(list):
   
   def _get(self, path):
     if not path: return self
-    response = []
-    for item in self:
-      response.append(item.get(path))
-    return response
+    return self._lookup(_split_path(path))
+  
+  def _lookup(self, sections):
+    return [item._lookup(sections) for item in self]
 
 
-class ParameterDict(dict):
-  def __init__(self, *args, **kwargs):
-    super(ParameterDict, self).__init__(*args, **kwargs)
-    self._sanitize()
+class ParameterDict(collections.Mapping):
+  """
+  ' Read-only view over a decoded dict. Nested dicts and lists
+  ' are wrapped in views when first accessed rather than copied
+  ' up front, and get('a.b.c') walks a cached split of the path.
+  """
   
-  def _sanitize(self):
-    for key, value in self.items():
-      if isinstance(value, dict):
-        self[key] = ParameterDict(value)
-      elif isinstance(value, list):
-        self[key] = ParameterList(value)
+  def __init__(self, data):
+    super(ParameterDict, self).__init__()
+    self._data = data
+    self._views = {}
+  
+  def __getitem__(self, key):
+    view = self._views.get(key)
+    if view == None:
+      value = self._data[key]
+      view = _view(value)
+      if view is not value:
+        self._views[key] = view
+    return view
+  
+  def __contains__(self, key):
+    return key in self._data
+  
+  def __len__(self):
+    return len(self._data)
+  
+  def __iter__(self):
+    return iter(self._data)
+  
+  def __eq__(self, other):
+    if isinstance(other, ParameterDict):
+      other = other._data
+    return self._data == other
+  
+  def __ne__(self, other):
+    return not self == other
+  
+  def __json__(self):
+    return self._data
+  
+  def __repr__(self):
+    return '{}({!r})'.format(self.__class__.__name__, self._data)
   
   def get(self, *paths):
     if not paths: return None
@@ -106,26 +260,28 @@ class ParameterDict(dict):
   
   def _get(self, path):
     if not path: return self
-    section = path.split('.')[0]
-    rest = '.'.join(path.split('.')[1:])
-    
+    return self._lookup(_split_path(path))
+  
+  def _lookup(self, sections):
+    section = sections[0]
     if not section in self: return None
-    
-    if rest:
-      return self[section].get(rest)
-    return self[section]
+    value = self[section]
+    if len(sections) == 1:
+      return value
+    return value._lookup(sections[1:])
 
 
 class HeaderDict(ParameterDict):
+  """ case insensitive view over the request headers """
+  
   def __init__(self, obj):
-    obj = dict(obj)
-    for key, value in obj.items():
-      self[key] = value
+    super(HeaderDict, self).__init__({
+      key.lower(): value
+      for key, value in dict(obj).items()
+    })
   
   def __getitem__(self, key):
     return super(HeaderDict, self).__getitem__(key.lower())
   
-  def __setitem__(self, key, value):
-    return super(HeaderDict, self).__setitem__(key.lower(), value)
-    
-    
+  def __contains__(self, key):
+    return super(HeaderDict, self).__contains__(key.lower())
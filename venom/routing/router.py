@@ -0,0 +1,111 @@
+# package imports
+from routes import Path
+
+
+__all__ = ['Router', 'RouterNode']
+
+
+class RouterNode(object):
+  """
+  ' A single segment in the compiled route trie. Static
+  ' segments are stored in a dict keyed by their literal value
+  ' and all ':param' segments share one wildcard edge. Routes
+  ' terminating at this node are indexed by HTTP method.
+  """
+  
+  def __init__(self):
+    super(RouterNode, self).__init__()
+    self.static = {}
+    self.wildcard = None
+    self.methods = {}
+  
+  def child(self, segment):
+    if segment.startswith(':'):
+      if not self.wildcard:
+        self.wildcard = RouterNode()
+      return self.wildcard
+    if not segment in self.static:
+      self.static[segment] = RouterNode()
+    return self.static[segment]
+  
+  def add(self, method, entry):
+    self.methods.setdefault(method, []).append(entry)
+
+
+class Router(object):
+  """
+  ' Compiles a list of routes into a segment trie so that
+  ' resolving a request costs O(path depth) rather than
+  ' O(number of routes). When several routes match the same
+  ' request the one registered first wins, exactly as with a
+  ' linear scan over the routes list.
+  """
+  
+  def __init__(self, routes=None):
+    super(Router, self).__init__()
+    self.root = RouterNode()
+    self._count = 0
+    for route in routes if routes else []:
+      self.add(route)
+  
+  def add(self, route):
+    node = self.root
+    for segment in route.path.segments:
+      node = node.child(segment)
+    entry = (self._count, route, route.path.parameters)
+    for method in route.allowed_methods:
+      node.add(method, entry)
+    self._count += 1
+    return route
+  
+  def find(self, path, method):
+    """
+    ' Returns a (route, parameters) tuple for the first route
+    ' matching the given path and method, or (None, None).
+    """
+    segments = Path._traverse_path(path)
+    entry = self._find(self.root, segments, 0, method.upper())
+    if entry == None:
+      return None, None
+    _, route, parameters = entry
+    return route, { name: segments[i] for i, name in parameters }
+  
+  def _find(self, node, segments, depth, method):
+    if depth == len(segments):
+      entries = node.methods.get(method)
+      return entries[0] if entries else None
+    
+    best = None
+    static = node.static.get(segments[depth])
+    if static:
+      best = self._find(static, segments, depth + 1, method)
+    if node.wildcard:
+      entry = self._find(node.wildcard, segments, depth + 1, method)
+      if entry and (not best or entry[0] < best[0]):
+        best = entry
+    return best
+  
+  def find_all(self, path):
+    """
+    ' Returns every route matching the given path regardless of
+    ' method, in the order they were registered.
+    """
+    found = {}
+    self._find_all(self.root, Path._traverse_path(path), 0, found)
+    return [found[order] for order in sorted(found)]
+  
+  def _find_all(self, node, segments, depth, found):
+    if depth == len(segments):
+      for entries in node.methods.values():
+        for order, route, _ in entries:
+          found[order] = route
+      return
+    
+    static = node.static.get(segments[depth])
+    if static:
+      self._find_all(static, segments, depth + 1, found)
+    if node.wildcard:
+      self._find_all(node.wildcard, segments, depth + 1, found)
+  
+  def __len__(self):
+    return self._count
@@ -1,7 +1,12 @@
+# system imports
+import hashlib
+import logging
+
 # package imports
 import Parameters
 import Protocols
 from handlers import Servable
+from ..model import Model, IdentityMap, QueryResults
 
 
 __all__  = ['Route', 'Path']
@@ -9,18 +14,43 @@ __all__ += ['GET', 'POST', 'PUT', 'PATCH', 'HEAD', 'DELETE', 'OPTIONS', 'TRACE']
 
 
 class Path(str):
+  """
+  ' A route template such as '/api/v1/users/:user'. The template
+  ' is split into segments once, at construction, so matching a
+  ' request only has to split the request path.
+  """
+  
+  def __init__(self, path):
+    super(Path, self).__init__()
+    self.segments = tuple(self._traverse_path(self))
+    self.parameters = tuple(
+      (i, segment[1:])
+      for i, segment in enumerate(self.segments)
+      if segment.startswith(':')
+    )
+    self._static_segments = tuple(
+      (i, segment)
+      for i, segment in enumerate(self.segments)
+      if not segment.startswith(':')
+    )
+  
+  def match(self, path):
+    """
+    ' Matches the given request path against this template and
+    ' returns its url parameters as a dict, or None on a miss.
+    """
+    return self.match_segments(self._traverse_path(path))
+  
+  def match_segments(self, segments):
+    if len(segments) != len(self.segments):
+      return None
+    for i, segment in self._static_segments:
+      if segments[i] != segment:
+        return None
+    return { name: segments[i] for i, name in self.parameters }
+  
   def matches(self, path):
-    desired_path = self._traverse_path(self)
-    given_path = self._traverse_path(path)
-    
-    if len(desired_path) != len(given_path):
-      return False
-    
-    for desired, given in zip(desired_path, given_path):
-      if not desired.startswith(':') and desired != given:
-        return False
-    
-    return True
+    return self.match(path) != None
   
   @classmethod
   def _traverse_path(cls, path):
@@ -35,17 +65,11 @@ class Path(str):
     return path
   
   def has_parameters(self):
-    return ':' in self
+    return len(self.parameters) > 0
   
   def get_parameters(self, path):
-    desired_path = self._traverse_path(self)
-    given_path = self._traverse_path(path)
-    
-    return {
-      desired[1:] : given
-      for desired, given in zip(desired_path, given_path)
-      if desired.startswith(':')
-    }
+    parameters = self.match(path)
+    return parameters if parameters != None else {}
 
 
 class Route(object):
@@ -65,10 +89,13 @@ class Route(object):
     self.path = Path(path)
     self.handler = handler
     self.protocol = protocol
-    self._url = Parameters.Dict({})
-    self._body = Parameters.Dict({})
-    self._query = Parameters.Dict({})
-    self._headers = Parameters.Dict({})
+    self.alternate_protocols = ()
+    self.compression = {}
+    self.conditional_etag = None
+    self.url({})
+    self.body({})
+    self.query({})
+    self.headers({})
   
   def matches_method(self, method):
     return method.upper() in self.allowed_methods
@@ -79,35 +106,144 @@ class Route(object):
   def matches(self, path, method):
     return self.matches_path(path) and self.matches_method(method)
   
-  def handle(self, request, response, error, errors=None):
+  def handle(self, request, response, error, errors=None, parameters=None):
+    """
+    ' Serves the request inside its own IdentityMap, so an entity
+    ' looked up several times while handling it is fetched once.
+    ' The map is left in the WSGI environ as venom.identity_map
+    ' for instrumentation.
+    """
     errors = errors if errors else {}
-    with self.protocol(request, response, error, errors) as protocol:
-      handler = self.handler(request, response, error, self, protocol)
-      response = handler.serve()
-      protocol._write(response)
+    if parameters == None:
+      parameters = self.path.get_parameters(request.path)
+    writer, reader = self._negotiate(request)
+    if reader:
+      reader = reader(request, response, error, errors)
+    with IdentityMap() as identity_map:
+      request.environ['venom.identity_map'] = identity_map
+      try:
+        protocol = writer(request, response, error, errors)._configure(reader=reader, compression=self.compression)
+        with protocol:
+          if self.alternate_protocols:
+            protocol._vary('Accept')
+          handler = self.handler(request, response, error, self, protocol, parameters=parameters)
+          response = handler.serve()
+          if self.conditional_etag == None:
+            protocol._write(response)
+          else:
+            protocol._write_conditional(response, *self._entity_version(response))
+      finally:
+        logging.debug('%r served %s %s with %r', self, request.method, request.path, identity_map)
+  
+  def negotiate(self, *protocols):
+    """
+    ' Offers additional protocols for this route. Responses are
+    ' written in the protocol best matching the Accept header and
+    ' request bodies are read in the one matching Content-Type,
+    ' or in the response's protocol when Content-Type is unknown.
+    """
+    self.alternate_protocols = tuple(
+      protocol for protocol in protocols
+      if protocol != self.protocol
+    )
+    self._offers = [self.protocol.content_type] + [
+      protocol.content_type for protocol in self.alternate_protocols
+    ]
+    self._protocols = { protocol.content_type: protocol for protocol in self.alternate_protocols }
+    self._protocols[self.protocol.content_type] = self.protocol
+    return self
+  
+  def _negotiate(self, request):
+    if not self.alternate_protocols:
+      return self.protocol, None
+    content_type = request.accept.best_match(self._offers, default_match=self.protocol.content_type)
+    writer = self._protocols.get(content_type, self.protocol)
+    reader = self._protocols.get(request.content_type, writer)
+    return writer, reader if reader != writer else None
+  
+  def compress(self, threshold=None, level=None):
+    """
+    ' Overrides the protocol's compression threshold in bytes
+    ' and zlib level for this route. A level of 0 disables
+    ' compression.
+    """
+    if threshold != None:
+      self.compression['threshold'] = threshold
+    if level != None:
+      self.compression['level'] = level
+    return self
+  
+  def conditional(self, etag='body'):
+    """
+    ' Opts this route into conditional GET. With etag='body' the
+    ' ETag hashes the serialized response. With etag='entity' it
+    ' is derived from the keys and version stamps of the entities
+    ' returned, so a 304 is answered without serializing them.
+    """
+    if not etag in ('body', 'entity'):
+      raise ValueError("Route.conditional etag must be 'body' or 'entity'")
+    self.conditional_etag = etag
+    return self
+  
+  def _entity_version(self, value):
+    """
+    ' Returns an (etag, last_modified) tuple for a returned entity,
+    ' list of entities or dict of those and strings, or
+    ' (None, None) when the body must be hashed instead.
+    """
+    if self.conditional_etag != 'entity':
+      return None, None
+    # a list's newest stamp does not change when an entity is
+    # removed from it, so only single entities get Last-Modified
+    if isinstance(value, Model):
+      return value._etag(), value._updated
+    
+    items = sorted(value.items()) if isinstance(value, dict) else [(None, value)]
+    parts = []
+    for key, item in items:
+      if isinstance(item, basestring):
+        parts.append(u'{}={}'.format(key, item))
+        continue
+      for entity in item if isinstance(item, (list, tuple, QueryResults)) else [item]:
+        if not isinstance(entity, Model):
+          return None, None
+        parts.append(u'{}={}'.format(key, entity._etag()))
+    
+    return hashlib.md5(u','.join(parts).encode('utf-8')).hexdigest(), None
+  
+  def _batched_sections(self):
+    """ the request sections whose templates defer Parameters.Model lookups """
+    return [
+      section for section in ('url', 'query', 'headers', 'body')
+      if getattr(self, '_load_' + section).defers
+    ]
   
   def url(self, params):
     if isinstance(params, dict):
       params = Parameters.Dict(params)
     self._url = params
+    self._load_url = Parameters.lazy_compile(params)
     return self
   
   def body(self, params):
     if isinstance(params, dict):
       params = Parameters.Dict(params)
     self._body = params
+    self._load_body = Parameters.lazy_compile(params)
     return self
   
   def query(self, params):
     if isinstance(params, dict):
       params = Parameters.Dict(params)
     self._query = params
+    self._load_query = Parameters.lazy_compile(params)
     return self
   
   def headers(self, params):
     if isinstance(params, dict):
       params = Parameters.Dict(params)
     self._headers = params
+    self._load_headers = Parameters.lazy_compile(params)
     return self
   
   def __repr__(self):
@@ -119,8 +255,8 @@ class Route(object):
         args.append('{}={!r}'.format(attr, value))
     name = cls.__name__
     return '{}({})'.format(name, ', '.join(args))
-    
-  
+
+
 class GET(Route):
   allowed_methods = frozenset(['GET'])
 
@@ -1,6 +1,9 @@
-__all__ = ['WSGIEntryPoint']
+__all__ = ['WSGIEntryPoint', 'DirectWSGIApplication']
 
 
+# system imports
+import logging
+
 import webapp2
 
 
@@ -29,4 +32,48 @@ class WSGIEntryPoint(object):
     self._entrypoint = MainHandler
   
   def __call__(self, *args, **kwargs):
-    return self.wsgi(*args, **kwargs)
\ No newline at end of file
+    return self.wsgi(*args, **kwargs)
+
+
+class DirectWSGIApplication(object):
+  """
+  ' Opt-in WSGI application which builds a single request and
+  ' response per call and walks WSGIEntryPoint.dispatch directly,
+  ' following nested entry points (VersionDispatch -> Application
+  ' -> Documentation) without a webapp2 dispatch cycle for each.
+  '
+  ' EXAMPLE
+  '
+  ' app = venom.DirectWSGIApplication(venom.VersionDispatch(v1, v2))
+  """
+  
+  allowed_methods = WSGIEntryPoint.allowed_methods
+  
+  def __init__(self, entrypoint):
+    super(DirectWSGIApplication, self).__init__()
+    self.entrypoint = entrypoint
+  
+  def __call__(self, environ, start_response):
+    request = webapp2.Request(environ)
+    response = webapp2.Response()
+    request.response = response
+    
+    def error(code):
+      response.status = code
+      response.clear()
+    
+    try:
+      if request.method not in self.allowed_methods:
+        response = webapp2.exc.HTTPNotImplemented()
+      else:
+        self.dispatch(request, response, error)
+    except Exception as err:
+      logging.exception(err)
+      response = webapp2.exc.HTTPInternalServerError()
+    
+    return response(environ, start_response)
+  
+  def dispatch(self, request, response, error):
+    entrypoint = self.entrypoint
+    while isinstance(entrypoint, WSGIEntryPoint):
+      entrypoint = entrypoint.dispatch(request, response, error)